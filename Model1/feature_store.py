@@ -0,0 +1,130 @@
+# feature_store.py
+#
+# Columnar cache of the merged, encoded training frame.
+#
+# materialize() writes the featurized frame as a Parquet dataset partitioned by
+# state, together with the fitted label encoders and a manifest, under a
+# directory named after a fingerprint of the source CSVs and the preprocessing
+# config (feature version, dropped/date/categorical columns). Later runs with the
+# same sources and config skip CSV parsing, merging and encoder fitting entirely
+# and read only the columns they need (memory-mapped) with load_features().
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+import pandas as pd
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_CACHE_DIR = os.path.join(MODEL_DIR, "feature_cache")
+PARTITION_COLS = ["State_x"]
+MANIFEST_FILENAME = "manifest.json"
+ENCODERS_FILENAME = "label_encoders.pkl"
+DATASET_DIRNAME = "features.parquet"
+
+# Bytes sampled from the start and end of each source file for the fingerprint
+_SAMPLE_BYTES = 1 << 20
+
+
+def source_fingerprint(paths, feature_config=None):
+    """
+    Fingerprint of the source files: name, size, mtime and a sample of the
+    first and last megabyte. Cheap enough to run on multi-GB extracts every time.
+    `feature_config` (JSON-serializable) describes how the features are built, so
+    a preprocessing change gets a new fingerprint instead of stale cached features.
+    """
+    digest = hashlib.sha256()
+    if feature_config is not None:
+        digest.update(json.dumps(feature_config, sort_keys=True).encode())
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        with open(path, "rb") as f:
+            digest.update(f.read(_SAMPLE_BYTES))
+            if stat.st_size > _SAMPLE_BYTES:
+                f.seek(max(stat.st_size - _SAMPLE_BYTES, _SAMPLE_BYTES))
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cache_path(fingerprint, cache_dir=FEATURE_CACHE_DIR):
+    return os.path.join(cache_dir, fingerprint[:16])
+
+
+def read_manifest(fingerprint, cache_dir=FEATURE_CACHE_DIR):
+    """Manifest for a materialized fingerprint, or None if it is not cached."""
+    manifest_path = os.path.join(cache_path(fingerprint, cache_dir), MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return manifest if manifest.get("fingerprint") == fingerprint else None
+
+
+def materialize(df, le_dict, fingerprint, cache_dir=FEATURE_CACHE_DIR, partition_cols=PARTITION_COLS,
+                feature_config=None):
+    """Write the featurized frame, its encoders and a manifest for this fingerprint."""
+    target_dir = cache_path(fingerprint, cache_dir)
+    staging_dir = f"{target_dir}.tmp"
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    partition_cols = [col for col in partition_cols if col in df.columns]
+    df.to_parquet(
+        os.path.join(staging_dir, DATASET_DIRNAME),
+        engine="pyarrow",
+        index=False,
+        partition_cols=partition_cols or None,
+    )
+    with open(os.path.join(staging_dir, ENCODERS_FILENAME), "wb") as f:
+        pickle.dump(le_dict, f)
+
+    manifest = {
+        "fingerprint": fingerprint,
+        "created_at": datetime.now().isoformat(),
+        "rows": len(df),
+        "columns": list(df.columns),
+        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+        "partition_cols": partition_cols,
+        "feature_config": feature_config,
+    }
+    # Manifest last, then an atomic rename: a half-written cache is never visible
+    with open(os.path.join(staging_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(staging_dir, target_dir)
+    print(f"✅ Materialized {len(df)} feature rows to {target_dir}")
+    return manifest
+
+
+def load_features(fingerprint, columns=None, filters=None, cache_dir=FEATURE_CACHE_DIR):
+    """
+    Load cached features (memory-mapped), optionally only some columns or
+    partitions, e.g. filters=[("State_x", "in", [2, 5])]. Returns (df, le_dict).
+    """
+    manifest = read_manifest(fingerprint, cache_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No materialized features for fingerprint {fingerprint[:16]}")
+
+    target_dir = cache_path(fingerprint, cache_dir)
+    df = pd.read_parquet(
+        os.path.join(target_dir, DATASET_DIRNAME),
+        engine="pyarrow",
+        columns=columns,
+        filters=filters,
+        memory_map=True,
+    )
+
+    # Partition columns come back as dictionary-encoded categories; restore dtypes
+    for col in manifest["partition_cols"]:
+        if col in df.columns:
+            df[col] = df[col].astype(manifest["dtypes"][col])
+    ordered = [col for col in manifest["columns"] if col in df.columns]
+    df = df[ordered]
+
+    with open(os.path.join(target_dir, ENCODERS_FILENAME), "rb") as f:
+        le_dict = pickle.load(f)
+    return df, le_dict
@@ -0,0 +1,172 @@
+# incremental.py
+#
+# Warm-start retraining from a new labelled claims batch.
+#
+#   python incremental.py --batch-dir /data/claims/2026-10-19 --rounds 50
+#
+# Boosting continues from the currently registered model (artifacts/registry.json)
+# on the new batch only. Existing label encodings are kept stable and extended
+# with any new categories. The updated model is compared with the base model on
+# a holdout from the batch and only published if it does not regress.
+
+import argparse
+import json
+import os
+import pickle
+import sys
+from datetime import datetime
+
+import numpy as np
+from sklearn.metrics import accuracy_score, log_loss
+
+from policy_data import load_merged
+from two import (
+    CATEGORICAL_COLS, ENCODER_FILENAME, MODEL_DIR, MODEL_FILENAME, TARGET, StageTimer,
+    build_classifier, environment_info, evaluate, load_registry, preprocess, save_artifacts,
+    split_data,
+)
+
+
+def load_current_model(output_dir):
+    """The registered model, its encoders and version."""
+    registry = load_registry(output_dir)
+    version = registry.get("current")
+    if not version:
+        raise FileNotFoundError(f"No registered model in {output_dir}; run two.py first")
+
+    version_dir = os.path.join(output_dir, version)
+    with open(os.path.join(version_dir, MODEL_FILENAME), "rb") as f:
+        model = pickle.load(f)
+    with open(os.path.join(version_dir, ENCODER_FILENAME), "rb") as f:
+        le_dict = pickle.load(f)
+    return model, le_dict, version
+
+
+def extend_encoders(df, le_dict):
+    """
+    Append labels not seen before to each encoder's classes_. Existing codes never
+    change, because the booster's splits depend on them. Returns {column: new labels}.
+    """
+    added = {}
+    for col in CATEGORICAL_COLS:
+        if col not in df.columns or col not in le_dict or col == TARGET:
+            continue
+        encoder = le_dict[col]
+        known = set(encoder.classes_)
+        new_labels = sorted(set(df[col].astype(str).unique()) - known)
+        if new_labels:
+            encoder.classes_ = np.concatenate([encoder.classes_, np.array(new_labels, dtype=encoder.classes_.dtype)])
+            added[col] = new_labels
+    return added
+
+
+def holdout_scores(model, X, y, n_classes):
+    proba = model.predict_proba(X)
+    return {
+        "logloss": float(log_loss(y, proba, labels=np.arange(n_classes))),
+        "accuracy": float(accuracy_score(y, proba.argmax(axis=1))),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Continue boosting the registered risk model on a new batch.")
+    parser.add_argument("--batch-dir", required=True, help="Directory with the new batch extracts (same CSV schema)")
+    parser.add_argument("--output-dir", default=os.path.join(MODEL_DIR, "artifacts"))
+    parser.add_argument("--rounds", type=int, default=50, help="Additional boosting rounds")
+    parser.add_argument("--learning-rate", type=float, default=None, help="Defaults to the base model's")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--early-stopping-rounds", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.0,
+                        help="Allowed holdout logloss increase before the update is rejected")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-publish", action="store_true",
+                        help="Do not copy the model/encoders to the paths the API loads")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    timer = StageTimer()
+    started_at = datetime.now()
+
+    with timer.stage("load"):
+        base_model, le_dict, base_version = load_current_model(args.output_dir)
+        batch_df = load_merged(args.batch_dir)
+
+    with timer.stage("preprocess"):
+        # Encoders see the raw labels, so extend them before encoding
+        new_categories = extend_encoders(batch_df, le_dict)
+        if new_categories:
+            print(f"Extended encoders with new categories: {new_categories}")
+
+        target_labels = set(batch_df[TARGET].astype(str).unique())
+        unknown_targets = target_labels - set(le_dict[TARGET].classes_)
+        if unknown_targets:
+            print(f"Error: new target classes {sorted(unknown_targets)} need a full retrain (two.py)")
+            return 2
+
+        df, le_dict = preprocess(batch_df, le_dict=le_dict)
+        feature_names = base_model.get_booster().feature_names
+        for col in feature_names:
+            if col not in df.columns:
+                df[col] = 0
+        df = df[feature_names + [TARGET]]
+        X_train, X_val, X_hold, y_train, y_val, y_hold = split_data(df, seed=args.seed)
+
+    n_classes = len(le_dict[TARGET].classes_)
+    if y_train.nunique() != n_classes:
+        print(f"Error: the batch must contain all {n_classes} target classes to continue boosting")
+        return 2
+
+    with timer.stage("train"):
+        base_params = base_model.get_params()
+        params = {key: base_params[key] for key in ("max_depth", "subsample", "colsample_bytree")}
+        params["learning_rate"] = args.learning_rate or base_params["learning_rate"]
+        params["n_estimators"] = args.rounds
+        model = build_classifier(params, n_classes=n_classes, n_jobs=args.n_jobs, seed=args.seed,
+                                 early_stopping_rounds=args.early_stopping_rounds)
+        base_booster = base_model.get_booster()
+        best_iteration = getattr(base_model, "best_iteration", None)
+        if best_iteration is not None:
+            # Continue from the early-stopped model, not from the trees past its best iteration
+            base_booster = base_booster[: best_iteration + 1]
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], xgb_model=base_booster, verbose=False)
+
+    with timer.stage("compare"):
+        base_scores = holdout_scores(base_model, X_hold, y_hold, n_classes)
+        new_scores = holdout_scores(model, X_hold, y_hold, n_classes)
+        regressed = new_scores["logloss"] > base_scores["logloss"] + args.tolerance
+    print(f"Holdout logloss: base {base_scores['logloss']:.4f} -> updated {new_scores['logloss']:.4f}")
+
+    version = f"{started_at.strftime('%Y%m%d-%H%M%S')}-inc-{base_version[:15]}"
+    metrics = evaluate(model, X_hold, y_hold)
+    metrics.update({
+        "version": version,
+        "trained_at": started_at.isoformat(),
+        "base_version": base_version,
+        "batch_dir": os.path.abspath(args.batch_dir),
+        "rows": {"train": len(X_train), "validation": len(X_val), "holdout": len(X_hold)},
+        "holdout_comparison": {"base": base_scores, "updated": new_scores, "tolerance": args.tolerance},
+        "new_categories": new_categories,
+        "params": {**params, "warm_start_from": base_version, "seed": args.seed},
+        "best_iteration": getattr(model, "best_iteration", None),
+        "environment": environment_info(),
+        "stages": timer.stages,
+    })
+
+    if regressed:
+        rejected_dir = os.path.join(args.output_dir, "rejected")
+        os.makedirs(rejected_dir, exist_ok=True)
+        with open(os.path.join(rejected_dir, f"{version}-metrics.json"), "w") as f:
+            json.dump(metrics, f, indent=2, default=str)
+        print(f"❌ Update rejected: holdout logloss regressed. {base_version} stays current.")
+        return 3
+
+    save_artifacts(args.output_dir, version, model, le_dict, metrics,
+                   publish_dir=None if args.no_publish else MODEL_DIR)
+    print(f"✅ Incremental model {version} published on top of {base_version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,26 @@
+# Weather enrichment of the policy extracts.
+#
+# Interactive (prompts for the weather source, writes insurance_with_weather.csv):
+#   python one.py
+#
+# Headless, chunked and resumable (bounded memory, partitioned Parquet output):
+#   python one.py --source visual_crossing --output-dir weather_out --chunksize 100000
+#   python one.py --config nightly.json --resume
+
+import argparse
+import json
+import os
+import shutil
+import sys
 import pandas as pd
 import requests
-from datetime import datetime
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 import time
 
-# ===========================
-# Load and merge datasets
-# ===========================
-try:
-    mock_df = pd.read_csv("australia_insurance_mock_data.csv")
-    extended_df = pd.read_csv("australia_insurance_extended_mo.csv")
-    print(f"Loaded {len(mock_df)} records from mock data and {len(extended_df)} records from extended data")
-except FileNotFoundError as e:
-    print(f"Error: Could not find CSV file - {e}")
-    exit(1)
-
-# Merge on Customer Name (since no common ID)
-combined_df = pd.merge(mock_df, extended_df, on="Customer Name", how="left")
-print(f"Merged dataset has {len(combined_df)} records")
+from policy_data import MODEL_DIR, iter_merged_partitions, load_merged
+from weather_store import WeatherStore, iso_date_from_timestamp, missing_date_ranges, read_through
 
 # Map state abbreviations to capital cities with coordinates
 state_to_coords = {
@@ -29,15 +33,22 @@ state_to_coords = {
     "VIC": {"city": "Melbourne", "lat": -37.8136, "lon": 144.9631},
     "NSW": {"city": "Sydney", "lat": -33.8688, "lon": 151.2093}
 }
+city_to_coords = {info["city"]: info for info in state_to_coords.values()}
+coords_to_city = {(info["lat"], info["lon"]): info["city"] for info in state_to_coords.values()}
+
+# Historical weather never changes: every lookup reads through the local store
+weather_store = WeatherStore()
 
 # ===========================
 # OpenWeatherMap API setup
 # ===========================
 # You need to get a free API key from: https://openweathermap.org/api
-API_KEY = "YOUR_OPENWEATHER_API_KEY_HERE"  # Replace with your OpenWeatherMap API key
+API_KEY = os.getenv("OPENWEATHERMAP_API_KEY", "YOUR_OPENWEATHER_API_KEY_HERE")  # Replace with your OpenWeatherMap API key
 BASE_URL = "http://api.openweathermap.org/data/2.5/onecall/timemachine"
 
 
+@read_through(weather_store, "openweather", key=lambda lat, lon, date_timestamp: (
+    coords_to_city.get((lat, lon), f"{lat},{lon}"), iso_date_from_timestamp(date_timestamp)))
 def get_weather_openweather(lat, lon, date_timestamp):
     """Fetch historical weather using OpenWeatherMap One Call API."""
     url = f"{BASE_URL}?lat={lat}&lon={lon}&dt={date_timestamp}&appid={API_KEY}&units=metric"
@@ -83,10 +94,11 @@ def get_weather_openweather(lat, lon, date_timestamp):
 
 # Alternative: Use a free weather API (Visual Crossing Weather)
 # They offer 1000 free API calls per day
-VISUAL_CROSSING_API_KEY = "YOUR_VISUAL_CROSSING_API_KEY"  # Get free key from visualcrossing.com
+VISUAL_CROSSING_API_KEY = os.getenv("VISUAL_CROSSING_API_KEY", "YOUR_VISUAL_CROSSING_API_KEY")  # Get free key from visualcrossing.com
 VISUAL_CROSSING_URL = "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline"
 
 
+@read_through(weather_store, "visual_crossing")
 def get_weather_visual_crossing(city, date_str):
     """Fetch historical weather using Visual Crossing Weather API (free tier available)."""
     url = f"{VISUAL_CROSSING_URL}/{city},Australia/{date_str}/{date_str}?key={VISUAL_CROSSING_API_KEY}&include=days"
@@ -127,129 +139,432 @@ def get_weather_visual_crossing(city, date_str):
         return {"temp": None, "humidity": None, "wind_speed": None}
 
 
+def get_weather_range_visual_crossing(city, start_date, end_date):
+    """Fetch a whole date range for one city in a single Visual Crossing request."""
+    url = f"{VISUAL_CROSSING_URL}/{city},Australia/{start_date}/{end_date}?key={VISUAL_CROSSING_API_KEY}&include=days"
+
+    try:
+        response = requests.get(url, timeout=60)
+        if response.status_code != 200:
+            print(f"Range request failed for {city} {start_date}..{end_date}: HTTP {response.status_code}")
+            return {}
+        return {
+            day["datetime"]: {
+                "temp": day.get("temp"),
+                "humidity": day.get("humidity"),
+                "wind_speed": day.get("windspeed")
+            }
+            for day in response.json().get("days", [])
+        }
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        print(f"Range request error for {city} {start_date}..{end_date}: {e}")
+        return {}
+
+
 # Mock weather data function (for testing without API)
+@read_through(weather_store, "mock")
 def get_mock_weather(city, date_str):
     """Generate mock weather data for testing purposes."""
     import random
-    random.seed(hash(city + date_str))  # Consistent mock data
+    rng = random.Random(hash(city + date_str))  # Consistent mock data, safe across threads
 
     return {
-        "temp": round(random.uniform(10, 35), 1),
-        "humidity": random.randint(30, 90),
-        "wind_speed": round(random.uniform(5, 25), 1)
+        "temp": round(rng.uniform(10, 35), 1),
+        "humidity": rng.randint(30, 90),
+        "wind_speed": round(rng.uniform(5, 25), 1)
     }
 
 
 # ===========================
-# Process dataset
+# Rate limiting
 # ===========================
-df = combined_df.copy()
-
-# Check for required columns
-required_columns = ["Policy Start Date_x", "Policy End Date_x", "State_x"]
-missing_columns = [col for col in required_columns if col not in df.columns]
-if missing_columns:
-    print(f"Error: Missing required columns: {missing_columns}")
-    print(f"Available columns: {list(df.columns)}")
-    exit(1)
-
-# Ensure dates are in proper format
-df["Policy Start Date_x"] = pd.to_datetime(df["Policy Start Date_x"], errors="coerce")
-df["Policy End Date_x"] = pd.to_datetime(df["Policy End Date_x"], errors="coerce")
-
-# Check for invalid dates
-invalid_start_dates = df["Policy Start Date_x"].isna().sum()
-invalid_end_dates = df["Policy End Date_x"].isna().sum()
-if invalid_start_dates > 0:
-    print(f"Warning: {invalid_start_dates} rows have invalid start dates")
-if invalid_end_dates > 0:
-    print(f"Warning: {invalid_end_dates} rows have invalid end dates")
-
-# Choose which API to use
-print("Choose weather data source:")
-print("1. Visual Crossing Weather API (free 1000 calls/day)")
-print("2. Mock weather data (for testing)")
-print("3. OpenWeatherMap (requires paid plan for historical data)")
-
-choice = input("Enter choice (1, 2, or 3): ").strip()
-
-if choice == "1":
-    if VISUAL_CROSSING_API_KEY == "QC5UZX86FHYRAXM9PUXWZSQX2":
-        print(
-            "Please get a free API key from https://www.visualcrossing.com/weather-api and update VISUAL_CROSSING_API_KEY")
-        exit(1)
-    weather_function = lambda city, date_str: get_weather_visual_crossing(city, date_str)
-    print("Using Visual Crossing Weather API")
-elif choice == "2":
-    weather_function = lambda city, date_str: get_mock_weather(city, date_str)
-    print("Using mock weather data")
-elif choice == "3":
-    if API_KEY == "YOUR_OPENWEATHER_API_KEY_HERE":
-        print("Please get an API key from https://openweathermap.org/api and update API_KEY")
-        exit(1)
-    weather_function = lambda city, date_str: get_weather_openweather(
-        state_to_coords[state]["lat"],
-        state_to_coords[state]["lon"],
-        int(pd.to_datetime(date_str).timestamp())
+# Per-provider request budgets. Visual Crossing's free tier allows 1000 records/day;
+# OpenWeatherMap's One Call allows 60 calls/minute and 1000 calls/day on the free plan.
+WEATHER_RATE_LIMITS = {
+    "visual_crossing": {"rate_per_sec": 5.0, "burst": 5, "daily_quota": 1000, "max_workers": 5},
+    "openweather": {"rate_per_sec": 1.0, "burst": 1, "daily_quota": 1000, "max_workers": 2},
+    "mock": {"rate_per_sec": None, "burst": None, "daily_quota": None, "max_workers": 8},
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate_per_sec` refill with bursts of up to `burst`."""
+
+    def __init__(self, rate_per_sec, burst):
+        self.rate_per_sec = rate_per_sec
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_sec)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate_per_sec
+            time.sleep(wait)
+
+
+EMPTY_WEATHER = {"temp": None, "humidity": None, "wind_speed": None}
+
+
+def fetch_weather_pairs(pairs, weather_function, provider, quota_used=0):
+    """
+    Fetch weather once per distinct (city, date) pair, concurrently and within the
+    provider's rate limit and daily quota (less `quota_used` by earlier requests).
+    Returns a DataFrame keyed by city and date.
+    """
+    limits = WEATHER_RATE_LIMITS[provider]
+    bucket = TokenBucket(limits["rate_per_sec"], limits["burst"]) if limits["rate_per_sec"] else None
+
+    quota = limits["daily_quota"]
+    if quota is not None:
+        quota = max(quota - quota_used, 0)
+    if quota == 0 and pairs:
+        print(f"Warning: daily quota exhausted; skipping {len(pairs)} weather lookups")
+        pairs = []
+    elif quota is not None and len(pairs) > quota:
+        print(f"Warning: {len(pairs)} unique (city, date) pairs exceed the daily quota of {quota}; "
+              f"only the first {quota} will be fetched")
+        pairs = pairs[:quota]
+
+    def fetch(pair):
+        if bucket:
+            bucket.acquire()
+        return pair, weather_function(*pair)
+
+    rows = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=limits["max_workers"]) as pool:
+        futures = [pool.submit(fetch, pair) for pair in pairs]
+        for done, future in enumerate(as_completed(futures), start=1):
+            (city, date_str), weather = future.result()
+            rows.append({"city": city, "date": date_str, **(weather or EMPTY_WEATHER)})
+            if done % 50 == 0 or done == len(futures):
+                print(f"Fetched {done}/{len(futures)} unique weather lookups "
+                      f"({done / (time.perf_counter() - started):.1f}/s)")
+
+    return pd.DataFrame(rows, columns=["city", "date", "temp", "humidity", "wind_speed"])
+
+
+def prefetch_visual_crossing_ranges(pairs, max_gap_days=0, quota_used=0):
+    """
+    Bulk-fetch contiguous date ranges per city into the store. Returns the pairs
+    still missing afterwards (to be fetched one by one) and the records used so far
+    today (`quota_used` plus this prefetch), which count against the daily quota
+    (Visual Crossing bills every day of a range).
+    """
+    limits = WEATHER_RATE_LIMITS["visual_crossing"]
+    bucket = TokenBucket(limits["rate_per_sec"], limits["burst"])
+    quota = limits["daily_quota"]
+    dates_by_city = {}
+    for city_name, date_str in pairs:
+        dates_by_city.setdefault(city_name, []).append(date_str)
+
+    used = quota_used
+    for city_name, dates in dates_by_city.items():
+        ranges = [r for r in missing_date_ranges(dates, max_gap_days) if r[0] != r[1]]
+        for start_date, end_date in ranges:
+            records = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days + 1
+            if quota is not None and used + records > quota:
+                print(f"Warning: daily quota of {quota} records reached; skipping {city_name} {start_date}..{end_date}")
+                continue
+            bucket.acquire()
+            days = get_weather_range_visual_crossing(city_name, start_date, end_date)
+            used += records
+            stored = weather_store.put_many("visual_crossing", [(city_name, d, w) for d, w in days.items()])
+            print(f"Prefetched {stored} days for {city_name} {start_date}..{end_date}")
+
+    return weather_store.missing("visual_crossing", pairs), used
+
+
+def enrich_with_weather(df, weather_function, provider, quota_used=0):
+    """
+    Add start_/end_ weather columns with one lookup per distinct (city, date).
+    `quota_used` is the number of API records already used today; returns the
+    enriched frame and the updated count, so callers can carry it across chunks.
+    """
+    city = df["State_x"].astype(str).map({state: info["city"] for state, info in state_to_coords.items()})
+    unknown = city.isna() & df["State_x"].notna()
+    if unknown.any():
+        print(f"Unknown states for {int(unknown.sum())} rows: {sorted(df.loc[unknown, 'State_x'].astype(str).unique())}")
+
+    start_date = df["Policy Start Date_x"].dt.strftime("%Y-%m-%d")
+    end_date = df["Policy End Date_x"].dt.strftime("%Y-%m-%d")
+
+    keys = pd.concat([
+        pd.DataFrame({"city": city, "date": start_date}),
+        pd.DataFrame({"city": city, "date": end_date}),
+    ]).dropna().drop_duplicates()
+    pairs = list(keys.itertuples(index=False, name=None))
+    print(f"{len(df)} rows need {len(pairs)} unique (city, date) weather lookups (was {2 * len(df)})")
+
+    # Only pairs missing from the local store cost an API call
+    stored = weather_store.get_many(provider, pairs)
+    missing = [pair for pair in pairs if pair not in stored]
+    print(f"{len(stored)} lookups served from the weather store, {len(missing)} to fetch")
+
+    if provider == "visual_crossing" and missing:
+        missing, quota_used = prefetch_visual_crossing_ranges(missing, quota_used=quota_used)
+        # Days stored by the range prefetch are served from the store like the rest
+        stored = weather_store.get_many(provider, pairs)
+
+    fetched_df = fetch_weather_pairs(missing, weather_function, provider, quota_used=quota_used)
+    quota_used += len(fetched_df)
+    stored_df = pd.DataFrame(
+        [{"city": city_name, "date": date_str, **weather} for (city_name, date_str), weather in stored.items()],
+        columns=fetched_df.columns,
     )
-    print("Using OpenWeatherMap API")
-else:
-    print("Invalid choice, using mock data")
-    weather_function = lambda city, date_str: get_mock_weather(city, date_str)
+    weather_df = pd.concat([stored_df, fetched_df], ignore_index=True)
 
-# Collect weather data for both start and end dates
-start_weather, end_weather = [], []
-total_rows = len(df)
+    # Vectorized join back onto every row for both dates
+    lookup = pd.DataFrame({"city": city, "start_date": start_date, "end_date": end_date})
+    start = lookup.merge(weather_df, how="left", left_on=["city", "start_date"], right_on=["city", "date"])
+    end = lookup.merge(weather_df, how="left", left_on=["city", "end_date"], right_on=["city", "date"])
+    weather_cols = ["temp", "humidity", "wind_speed"]
 
-for index, row in df.iterrows():
-    if index % 50 == 0:  # Progress indicator
-        print(f"Processing row {index + 1}/{total_rows}")
+    start_weather_df = start[weather_cols].add_prefix("start_").set_axis(df.index)
+    end_weather_df = end[weather_cols].add_prefix("end_").set_axis(df.index)
+    return pd.concat([df, start_weather_df, end_weather_df], axis=1), quota_used
 
-    state = row.get("State_x")
-    city_info = state_to_coords.get(state, None)
 
-    if city_info:
-        city = city_info["city"]
+# ===========================
+# Process dataset
+# ===========================
+REQUIRED_COLUMNS = ["Policy Start Date_x", "Policy End Date_x", "State_x"]
+WEATHER_SOURCES = ["visual_crossing", "mock", "openweather"]
+CHECKPOINT_FILENAME = "_checkpoint.json"
+PARTITIONS_DIRNAME = "_partitions"
+
+
+def get_weather_function(provider):
+    """Weather lookup taking (city, date_str) for a provider; exits if its API key is not set."""
+    if provider == "visual_crossing":
+        if VISUAL_CROSSING_API_KEY == "YOUR_VISUAL_CROSSING_API_KEY":
+            print(
+                "Please get a free API key from https://www.visualcrossing.com/weather-api and set VISUAL_CROSSING_API_KEY")
+            sys.exit(1)
+        print("Using Visual Crossing Weather API")
+        return get_weather_visual_crossing
+    if provider == "openweather":
+        if API_KEY == "YOUR_OPENWEATHER_API_KEY_HERE":
+            print("Please get an API key from https://openweathermap.org/api and set OPENWEATHERMAP_API_KEY")
+            sys.exit(1)
+        print("Using OpenWeatherMap API")
+        return lambda city, date_str: get_weather_openweather(
+            city_to_coords[city]["lat"],
+            city_to_coords[city]["lon"],
+            int(pd.to_datetime(date_str).timestamp())
+        )
+    print("Using mock weather data")
+    return get_mock_weather
 
-        # Process start date weather
-        if pd.notna(row["Policy Start Date_x"]):
-            start_date_str = row["Policy Start Date_x"].strftime("%Y-%m-%d")
-            start_weather.append(weather_function(city, start_date_str))
-        else:
-            start_weather.append({"temp": None, "humidity": None, "wind_speed": None})
 
-        # Process end date weather
-        if pd.notna(row["Policy End Date_x"]):
-            end_date_str = row["Policy End Date_x"].strftime("%Y-%m-%d")
-            end_weather.append(weather_function(city, end_date_str))
-        else:
-            end_weather.append({"temp": None, "humidity": None, "wind_speed": None})
+def prompt_for_source():
+    print("Choose weather data source:")
+    print("1. Visual Crossing Weather API (free 1000 calls/day)")
+    print("2. Mock weather data (for testing)")
+    print("3. OpenWeatherMap (requires paid plan for historical data)")
+
+    choice = input("Enter choice (1, 2, or 3): ").strip()
+    if choice in ("1", "2", "3"):
+        return WEATHER_SOURCES[int(choice) - 1]
+    print("Invalid choice, using mock data")
+    return "mock"
+
+
+def prepare_chunk(df):
+    """Validate required columns and parse policy dates."""
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        print(f"Error: Missing required columns: {missing_columns}")
+        print(f"Available columns: {list(df.columns)}")
+        sys.exit(1)
+
+    # Ensure dates are in proper format
+    df["Policy Start Date_x"] = pd.to_datetime(df["Policy Start Date_x"], errors="coerce")
+    df["Policy End Date_x"] = pd.to_datetime(df["Policy End Date_x"], errors="coerce")
+
+    # Check for invalid dates
+    invalid_start_dates = df["Policy Start Date_x"].isna().sum()
+    invalid_end_dates = df["Policy End Date_x"].isna().sum()
+    if invalid_start_dates > 0:
+        print(f"Warning: {invalid_start_dates} rows have invalid start dates")
+    if invalid_end_dates > 0:
+        print(f"Warning: {invalid_end_dates} rows have invalid end dates")
+    return df
+
+
+def read_checkpoint(output_dir):
+    path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_checkpoint(output_dir, checkpoint):
+    path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def iter_input_chunks(data_dir, chunksize, partitions, partition_dir=None, start=(0, 0)):
+    """
+    Merged input in chunks of at most `chunksize` rows, in a deterministic order, as
+    (partition, offset, chunk). `start` is the (partition, offset) to continue from.
+    """
+    start_partition, start_offset = start
+    for p, part in iter_merged_partitions(data_dir, chunksize=chunksize, n_partitions=partitions,
+                                          partition_dir=partition_dir, start_partition=start_partition):
+        first = start_offset if p == start_partition else 0
+        for offset in range(first, len(part), chunksize):
+            yield p, offset, part.iloc[offset:offset + chunksize].reset_index(drop=True)
+
+
+def run_pipeline(args):
+    """
+    Headless mode: stream the merged input in chunks, enrich each chunk and write
+    it as its own Parquet part, checkpointing after every part. The join partitions
+    are kept in the output directory until the run completes, and --resume continues
+    from the partition and offset recorded in the checkpoint. The provider's daily quota is
+    shared by all chunks and kept in the checkpoint with its date; once it is
+    used up the run stops, to be resumed the next day.
+    """
+    os.makedirs(args.output_dir, exist_ok=True)
+    checkpoint = read_checkpoint(args.output_dir) if args.resume else None
+    if checkpoint and (checkpoint["chunksize"], checkpoint["partitions"]) != (args.chunksize, args.partitions):
+        print("Error: --chunksize/--partitions differ from the checkpoint; resume with the original settings")
+        return 1
+    done_chunks = checkpoint["completed_chunks"] if checkpoint else 0
+    rows_done = checkpoint["rows_written"] if checkpoint else 0
+    position = (checkpoint["next_partition"], checkpoint["next_offset"]) if checkpoint else (0, 0)
+    if checkpoint:
+        print(f"Resuming after chunk {done_chunks - 1} ({rows_done} rows already written)")
+    quota_date = date.today().isoformat()
+    quota_used = checkpoint.get("quota_used", 0) if checkpoint and checkpoint.get("quota_date") == quota_date else 0
+    daily_quota = WEATHER_RATE_LIMITS[args.source]["daily_quota"]
+
+    weather_function = get_weather_function(args.source)
+    started = time.perf_counter()
+    partition_dir = os.path.join(args.output_dir, PARTITIONS_DIRNAME)
+
+    chunks = iter_input_chunks(args.data_dir, args.chunksize, args.partitions, partition_dir, start=position)
+    for index, (partition, offset, chunk) in enumerate(chunks, start=done_chunks):
+        if date.today().isoformat() != quota_date:
+            quota_date, quota_used = date.today().isoformat(), 0
+        if daily_quota is not None and quota_used >= daily_quota:
+            print(f"Daily quota of {daily_quota} {args.source} records used up before chunk {index}; "
+                  f"rerun with --resume tomorrow to continue")
+            chunks.close()
+            break
+
+        chunk_started = time.perf_counter()
+        enriched, quota_used = enrich_with_weather(prepare_chunk(chunk), weather_function, args.source,
+                                                   quota_used=quota_used)
+
+        part_path = os.path.join(args.output_dir, f"part-{index:05d}.parquet")
+        enriched.to_parquet(f"{part_path}.tmp", engine="pyarrow", index=False)
+        os.replace(f"{part_path}.tmp", part_path)
+
+        rows_done += len(enriched)
+        write_checkpoint(args.output_dir, {
+            "source": args.source,
+            "chunksize": args.chunksize,
+            "partitions": args.partitions,
+            "completed_chunks": index + 1,
+            "next_partition": partition,
+            "next_offset": offset + len(chunk),
+            "rows_written": rows_done,
+            "quota_date": quota_date,
+            "quota_used": quota_used,
+            "updated_at": datetime.now().isoformat(),
+        })
+
+        elapsed = time.perf_counter() - chunk_started
+        coverage = enriched["start_temp"].notna().mean() if len(enriched) else 0
+        print(f"✓ Chunk {index}: {len(enriched)} rows in {elapsed:.1f}s "
+              f"({len(enriched) / max(elapsed, 1e-9):.0f} rows/s, {coverage:.0%} start-date weather) "
+              f"— {rows_done} rows total")
     else:
-        print(f"Unknown state: {state} at row {index}")
-        start_weather.append({"temp": None, "humidity": None, "wind_speed": None})
-        end_weather.append({"temp": None, "humidity": None, "wind_speed": None})
-
-    # Small delay to avoid hitting API rate limits
-    if choice == "1":  # Visual Crossing
-        time.sleep(0.2)
-    elif choice == "3":  # OpenWeatherMap
-        time.sleep(1.0)
-
-# Create weather DataFrames
-start_weather_df = pd.DataFrame(start_weather).add_prefix("start_")
-end_weather_df = pd.DataFrame(end_weather).add_prefix("end_")
-
-# Combine all data
-df = pd.concat([df, start_weather_df, end_weather_df], axis=1)
-
-# Save final output
-output_file = "insurance_with_weather.csv"
-df.to_csv(output_file, index=False)
-print(f"✅ {output_file} created with weather data for policy start and end dates.")
-print(f"Final dataset has {len(df)} rows and {len(df.columns)} columns")
-
-# Show summary of weather data collected
-start_weather_collected = start_weather_df['start_temp'].notna().sum()
-end_weather_collected = end_weather_df['end_temp'].notna().sum()
-print(f"Weather data collected for {start_weather_collected}/{total_rows} start dates")
-print(f"Weather data collected for {end_weather_collected}/{total_rows} end dates")
\ No newline at end of file
+        # Every chunk is written; the partitions are only needed to resume
+        shutil.rmtree(partition_dir, ignore_errors=True)
+
+    total = time.perf_counter() - started
+    print(f"✅ Enriched output written to {args.output_dir} ({rows_done} rows, {total:.1f}s this run)")
+    return 0
+
+
+def run_interactive(data_dir):
+    """Original flow: prompt for the source, enrich everything, write one CSV."""
+    try:
+        # Compact dtypes, one-to-one join on a deduplicated key (see policy_data.py)
+        df = load_merged(data_dir)
+    except FileNotFoundError as e:
+        print(f"Error: Could not find CSV file - {e}")
+        return 1
+
+    df = prepare_chunk(df)
+    provider = prompt_for_source()
+    weather_function = get_weather_function(provider)
+
+    total_rows = len(df)
+    df, _ = enrich_with_weather(df, weather_function, provider)
+
+    # Save final output
+    output_file = "insurance_with_weather.csv"
+    df.to_csv(output_file, index=False)
+    print(f"✅ {output_file} created with weather data for policy start and end dates.")
+    print(f"Final dataset has {len(df)} rows and {len(df.columns)} columns")
+
+    # Show summary of weather data collected
+    start_weather_collected = df['start_temp'].notna().sum()
+    end_weather_collected = df['end_temp'].notna().sum()
+    print(f"Weather data collected for {start_weather_collected}/{total_rows} start dates")
+    print(f"Weather data collected for {end_weather_collected}/{total_rows} end dates")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Enrich the policy extracts with historical weather.")
+    parser.add_argument("--config", help="JSON file with any of the options below (CLI flags take precedence)")
+    parser.add_argument("--source", choices=WEATHER_SOURCES,
+                        help="Weather source; giving one (here or in --config) runs the headless pipeline")
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--output-dir", default=None, help="Directory for Parquet parts and the checkpoint")
+    parser.add_argument("--chunksize", type=int, default=None, help="Rows per output part")
+    parser.add_argument("--partitions", type=int, default=None, help="Hash partitions used to join the extracts")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    args = parser.parse_args(argv)
+
+    defaults = {"data_dir": MODEL_DIR, "output_dir": os.path.join(MODEL_DIR, "insurance_with_weather"),
+                "chunksize": 100_000, "partitions": 16}
+    config = {}
+    if args.config:
+        with open(args.config) as f:
+            config = json.load(f)
+    for key, default in {**defaults, "source": None}.items():
+        if getattr(args, key) is None:
+            setattr(args, key, config.get(key, default))
+    args.resume = args.resume or bool(config.get("resume", False))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.source is None:
+        return run_interactive(args.data_dir)
+    if args.source not in WEATHER_SOURCES:
+        print(f"Error: unknown weather source '{args.source}' (expected one of {WEATHER_SOURCES})")
+        return 2
+    return run_pipeline(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# policy_data.py
+#
+# Memory-efficient loading of the two policy extracts used by one.py and two.py.
+#
+# Columns are read with compact dtypes (categoricals, float32, parsed dates)
+# and the extracts are joined on a deduplicated, validated key instead of
+# "Customer Name", which fans the join out whenever two customers share a name.
+# Files that do not fit in memory can be joined with iter_merged_chunks(),
+# which hash-partitions both sides to disk and merges one partition at a time;
+# iter_merged_partitions() can keep the partitions to resume a long run.
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MOCK_DATA_FILE = "australia_insurance_mock_data.csv"
+EXTENDED_DATA_FILE = "australia_insurance_extended_mo.csv"
+
+CATEGORY_COLS = ["State", "Insurance Type", "Claim Status", "Product Tier", "Payment Frequency"]
+FLOAT_COLS = ["Age", "Annual Premium (AUD)", "Claim Amount (AUD)", "Risk Score"]
+STRING_COLS = ["Customer Name", "Policy Number", "Email", "Phone", "Agent Name"]
+DATE_COLS = ["Policy Start Date", "Policy End Date"]
+DATE_FORMAT = "%m/%d/%Y"
+
+# Used when "Policy Number" is not present in both extracts (the mock extract has none)
+COMPOSITE_KEY_COLS = ["Customer Name", "Policy Start Date", "Policy End Date", "State", "Insurance Type"]
+KEY_COL = "_join_key"
+PARTITION_MANIFEST = "_partitions.json"
+
+CSV_DTYPES = {
+    **{col: "float32" for col in FLOAT_COLS},
+    **{col: "string" for col in STRING_COLS + CATEGORY_COLS + DATE_COLS},
+}
+
+
+def compact_frame(df):
+    """Cast a raw extract frame to compact dtypes (in place where possible)."""
+    for col in CATEGORY_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in FLOAT_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("float32")
+    for col in DATE_COLS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], format=DATE_FORMAT, errors="coerce")
+    return df
+
+
+def read_extract(path, usecols=None, chunksize=None):
+    """Read one extract with compact dtypes; returns a frame or a chunk iterator."""
+    reader = pd.read_csv(path, dtype=CSV_DTYPES, usecols=usecols, chunksize=chunksize)
+    if chunksize is None:
+        return compact_frame(reader)
+    return (compact_frame(chunk) for chunk in reader)
+
+
+def join_key_columns(left_columns, right_columns):
+    if "Policy Number" in left_columns and "Policy Number" in right_columns:
+        return ["Policy Number"]
+    return COMPOSITE_KEY_COLS
+
+
+def add_join_key(df, key_cols):
+    """Hash the key columns into a single uint64 join key."""
+    df[KEY_COL] = pd.util.hash_pandas_object(df[key_cols].astype(str), index=False).to_numpy(np.uint64)
+    return df
+
+
+def deduplicate(df, name):
+    """Keep the last record per join key and report how many were dropped."""
+    duplicates = int(df[KEY_COL].duplicated(keep="last").sum())
+    if duplicates:
+        print(f"Warning: dropped {duplicates} duplicate {name} records on the join key")
+        df = df.drop_duplicates(subset=KEY_COL, keep="last")
+    return df
+
+
+def merge_extracts(mock_df, extended_df, key_cols):
+    """One-to-one join that keeps the _x/_y suffixes the model features rely on."""
+    if KEY_COL not in mock_df.columns:
+        add_join_key(mock_df, key_cols)
+    if KEY_COL not in extended_df.columns:
+        add_join_key(extended_df, key_cols)
+    mock_df = deduplicate(mock_df, "mock")
+    extended_df = deduplicate(extended_df, "extended")
+
+    # Customer Name is an identifier, keep a single unsuffixed copy
+    extended_df = extended_df.drop(columns=["Customer Name"], errors="ignore")
+
+    merged = pd.merge(mock_df, extended_df, on=KEY_COL, how="left", validate="one_to_one")
+    return merged.drop(columns=[KEY_COL]).reset_index(drop=True)
+
+
+def load_merged(data_dir=MODEL_DIR, usecols=None):
+    """Load and join both extracts in memory."""
+    mock_df = read_extract(os.path.join(data_dir, MOCK_DATA_FILE), usecols=usecols)
+    extended_df = read_extract(os.path.join(data_dir, EXTENDED_DATA_FILE), usecols=usecols)
+    print(f"Loaded {len(mock_df)} records from mock data and {len(extended_df)} records from extended data")
+
+    merged = merge_extracts(mock_df, extended_df, join_key_columns(mock_df.columns, extended_df.columns))
+    print(f"Merged dataset has {len(merged)} records "
+          f"({merged.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB in memory)")
+    return merged
+
+
+def _partition_to_disk(path, key_cols, n_partitions, out_dir, prefix, chunksize, usecols):
+    rows = 0
+    for i, chunk in enumerate(read_extract(path, usecols=usecols, chunksize=chunksize)):
+        add_join_key(chunk, key_cols)
+        partition = chunk[KEY_COL].to_numpy() % np.uint64(n_partitions)
+        for p in range(n_partitions):
+            part = chunk[partition == p]
+            if len(part):
+                part.to_pickle(os.path.join(out_dir, f"{prefix}-{p:04d}-{i:06d}.pkl"))
+        rows += len(chunk)
+    return rows
+
+
+def _read_partition(out_dir, prefix, p):
+    files = sorted(f for f in os.listdir(out_dir) if f.startswith(f"{prefix}-{p:04d}-"))
+    if not files:
+        return None
+    # Chunks carry their own category sets; re-compact after concatenation
+    return compact_frame(pd.concat([pd.read_pickle(os.path.join(out_dir, f)) for f in files], ignore_index=True))
+
+
+def _partition_signature(paths, n_partitions, usecols):
+    """What the partition files were built from: source name/size/mtime and the options."""
+    sources = [[os.path.basename(path), os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in paths]
+    return {"sources": sources, "n_partitions": n_partitions, "usecols": sorted(usecols) if usecols else None}
+
+
+def _ensure_partitions(paths, key_cols, n_partitions, out_dir, chunksize, usecols):
+    """
+    Hash-partition both extracts into out_dir, unless its manifest shows they already
+    were partitioned from the same files with the same options.
+    """
+    manifest_path = os.path.join(out_dir, PARTITION_MANIFEST)
+    signature = _partition_signature(paths, n_partitions, usecols)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("signature") == signature:
+            print(f"Reusing {n_partitions} partitions in {out_dir}")
+            return
+    # Stale or half-written partitions are never mixed with new ones
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    mock_path, extended_path = paths
+    mock_rows = _partition_to_disk(mock_path, key_cols, n_partitions, out_dir, "mock", chunksize, usecols)
+    extended_rows = _partition_to_disk(extended_path, key_cols, n_partitions, out_dir, "ext", chunksize, usecols)
+    print(f"Partitioned {mock_rows} mock and {extended_rows} extended records into {n_partitions} partitions")
+
+    # Manifest last: partitions without one are rebuilt
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump({"signature": signature, "mock_rows": mock_rows, "extended_rows": extended_rows}, f, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+
+def iter_merged_partitions(data_dir=MODEL_DIR, chunksize=500_000, n_partitions=16, usecols=None, tmp_dir=None,
+                           partition_dir=None, start_partition=0):
+    """
+    Join extracts larger than memory.
+
+    Both files are streamed in chunks and hash-partitioned on the join key to a
+    scratch directory; each partition pair is then deduplicated and joined on its
+    own, so peak memory is roughly (total size / n_partitions). Yields
+    (partition, merged frame), starting at `start_partition`.
+
+    With `partition_dir` the partition files are kept there (with a manifest) and
+    reused by later calls on unchanged extracts; the caller removes the directory
+    when it is done with it. Otherwise a temporary directory is used and removed.
+    """
+    mock_path = os.path.join(data_dir, MOCK_DATA_FILE)
+    extended_path = os.path.join(data_dir, EXTENDED_DATA_FILE)
+    mock_header = pd.read_csv(mock_path, nrows=0).columns
+    extended_header = pd.read_csv(extended_path, nrows=0).columns
+    key_cols = join_key_columns(mock_header, extended_header)
+
+    scratch = partition_dir or tempfile.mkdtemp(prefix="policy_join_", dir=tmp_dir)
+    try:
+        _ensure_partitions([mock_path, extended_path], key_cols, n_partitions, scratch, chunksize, usecols)
+
+        for p in range(start_partition, n_partitions):
+            mock_part = _read_partition(scratch, "mock", p)
+            if mock_part is None:
+                continue
+            extended_part = _read_partition(scratch, "ext", p)
+            if extended_part is None:
+                extended_part = compact_frame(pd.DataFrame(columns=extended_header).astype(
+                    {col: dtype for col, dtype in CSV_DTYPES.items() if col in extended_header}))
+            yield p, merge_extracts(mock_part, extended_part, key_cols)
+    finally:
+        if partition_dir is None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def iter_merged_chunks(data_dir=MODEL_DIR, chunksize=500_000, n_partitions=16, usecols=None, tmp_dir=None):
+    """Merged frames of iter_merged_partitions(), one per partition."""
+    for _, merged in iter_merged_partitions(data_dir, chunksize, n_partitions, usecols, tmp_dir):
+        yield merged
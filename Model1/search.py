@@ -0,0 +1,222 @@
+# search.py
+#
+# Hyperparameter search for the risk scoring model.
+#
+#   python search.py --n-configs 27 --folds 5 --workers 8
+#
+# Candidate configurations are scored with stratified k-fold CV in a process
+# pool. Successive halving runs every candidate on a small boosting budget,
+# keeps the best 1/eta and re-runs the survivors with eta times more trees,
+# so weak configurations stop early. The winner is refit with early stopping
+# and saved as a versioned artifact next to a leaderboard.
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, log_loss
+from sklearn.model_selection import StratifiedKFold
+
+import feature_store
+from two import (
+    DEFAULT_PARAMS, MODEL_DIR, TARGET, StageTimer, build_classifier, evaluate,
+    load_featurized, save_artifacts, split_data,
+)
+
+PARAM_SPACE = {
+    "max_depth": [3, 4, 6, 8],
+    "learning_rate": [0.02, 0.05, 0.1, 0.2],
+    "subsample": [0.6, 0.8, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "min_child_weight": [1, 5, 10],
+    "reg_lambda": [0.5, 1.0, 5.0],
+}
+# XGBoost's own defaults for the searched params that DEFAULT_PARAMS does not set
+XGB_DEFAULTS = {"min_child_weight": 1, "reg_lambda": 1.0}
+
+# Training data shared with worker processes once, via the pool initializer
+_worker_X = None
+_worker_y = None
+
+
+def _init_worker(X, y):
+    global _worker_X, _worker_y
+    _worker_X, _worker_y = X, y
+
+
+def sample_configs(n_configs, seed=42):
+    """Random, de-duplicated draws from PARAM_SPACE (the default config always included)."""
+    rng = random.Random(seed)
+    configs = [{key: DEFAULT_PARAMS.get(key, XGB_DEFAULTS.get(key)) for key in PARAM_SPACE}]
+    seen = {tuple(sorted(configs[0].items()))}
+    max_unique = math.prod(len(values) for values in PARAM_SPACE.values())
+
+    while len(configs) < min(n_configs, max_unique):
+        config = {key: rng.choice(values) for key, values in PARAM_SPACE.items()}
+        key = tuple(sorted(config.items()))
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def cross_validate(config_id, params, n_estimators, n_splits, seed, n_jobs):
+    """Stratified k-fold CV of one configuration; runs inside a worker process."""
+    X, y = _worker_X, _worker_y
+    n_classes = int(y.nunique())
+    labels = np.arange(n_classes)
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+
+    started = time.perf_counter()
+    losses, accuracies = [], []
+    for train_idx, valid_idx in folds.split(X, y):
+        model = build_classifier({**params, "n_estimators": n_estimators},
+                                 n_classes=n_classes, n_jobs=n_jobs, seed=seed)
+        model.fit(X.iloc[train_idx], y.iloc[train_idx], verbose=False)
+        proba = model.predict_proba(X.iloc[valid_idx])
+        losses.append(log_loss(y.iloc[valid_idx], proba, labels=labels))
+        accuracies.append(accuracy_score(y.iloc[valid_idx], proba.argmax(axis=1)))
+
+    return {
+        "config_id": config_id,
+        "n_estimators": n_estimators,
+        "mean_logloss": float(np.mean(losses)),
+        "std_logloss": float(np.std(losses)),
+        "mean_accuracy": float(np.mean(accuracies)),
+        "cv_time_s": round(time.perf_counter() - started, 3),
+        **params,
+    }
+
+
+def successive_halving(X, y, configs, min_estimators, max_estimators, eta=3,
+                       n_splits=5, seed=42, workers=None, threads_per_worker=1):
+    """Run successive halving over configs; returns the full leaderboard (one row per rung run)."""
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    survivors = list(enumerate(configs))
+    budget = min_estimators
+    leaderboard = []
+    rung = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X, y)) as pool:
+        while survivors:
+            print(f"🔎 Rung {rung}: {len(survivors)} configs x {budget} trees x {n_splits} folds")
+            futures = [
+                pool.submit(cross_validate, config_id, params, budget, n_splits, seed, threads_per_worker)
+                for config_id, params in survivors
+            ]
+            results = []
+            for future in as_completed(futures):
+                result = future.result()
+                result["rung"] = rung
+                results.append(result)
+            results.sort(key=lambda r: r["mean_logloss"])
+            leaderboard.extend(results)
+            print(f"   ✓ Best logloss at rung {rung}: {results[0]['mean_logloss']:.4f} (config {results[0]['config_id']})")
+
+            if budget >= max_estimators or len(survivors) == 1:
+                break
+            keep = max(1, len(survivors) // eta)
+            kept_ids = {r["config_id"] for r in results[:keep]}
+            survivors = [(config_id, params) for config_id, params in survivors if config_id in kept_ids]
+            budget = min(budget * eta, max_estimators)
+            rung += 1
+
+    return pd.DataFrame(leaderboard).sort_values(["rung", "mean_logloss"], ascending=[False, True])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Successive-halving CV search for the risk scoring model.")
+    parser.add_argument("--data-dir", default=MODEL_DIR)
+    parser.add_argument("--output-dir", default=os.path.join(MODEL_DIR, "artifacts"))
+    parser.add_argument("--n-configs", type=int, default=27)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--eta", type=int, default=3, help="Keep 1/eta of configs per rung")
+    parser.add_argument("--min-estimators", type=int, default=50)
+    parser.add_argument("--max-estimators", type=int, default=DEFAULT_PARAMS["n_estimators"])
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: cores / threads)")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--early-stopping-rounds", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--publish", action="store_true",
+                        help="Copy the best model/encoders to the paths the API loads")
+    parser.add_argument("--feature-cache-dir", default=feature_store.FEATURE_CACHE_DIR)
+    parser.add_argument("--no-feature-cache", action="store_true", help="Always featurize from the CSVs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    timer = StageTimer()
+    started_at = datetime.now()
+
+    try:
+        with timer.stage("load_features"):
+            df, le_dict, data_fingerprint = load_featurized(
+                args.data_dir, cache_dir=args.feature_cache_dir, use_cache=not args.no_feature_cache,
+            )
+    except FileNotFoundError as e:
+        print(f"Error: Could not find CSV file - {e}")
+        return 1
+
+    with timer.stage("split"):
+        X_train, X_val, X_test, y_train, y_val, y_test = split_data(df, seed=args.seed)
+        # CV runs on train + validation; the test split stays untouched for the final report
+        X_search = pd.concat([X_train, X_val])
+        y_search = pd.concat([y_train, y_val])
+
+    with timer.stage("search"):
+        configs = sample_configs(args.n_configs, seed=args.seed)
+        leaderboard = successive_halving(
+            X_search, y_search, configs,
+            min_estimators=args.min_estimators, max_estimators=args.max_estimators, eta=args.eta,
+            n_splits=args.folds, seed=args.seed, workers=args.workers,
+            threads_per_worker=args.threads_per_worker,
+        )
+
+    best = leaderboard.iloc[0]
+    # The leaderboard row is all floats (max_depth=4.0); take the params from the config itself
+    best_params = dict(configs[int(best["config_id"])])
+    best_params["n_estimators"] = args.max_estimators
+    print(f"🏆 Best config {best['config_id']}: {best_params} (CV logloss {best['mean_logloss']:.4f})")
+
+    with timer.stage("refit"):
+        model = build_classifier(
+            {**DEFAULT_PARAMS, **best_params}, n_classes=df[TARGET].nunique(), n_jobs=-1,
+            seed=args.seed, early_stopping_rounds=args.early_stopping_rounds,
+        )
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+        metrics = evaluate(model, X_test, y_test)
+
+    version = f"{started_at.strftime('%Y%m%d-%H%M%S')}-{data_fingerprint[:8]}-search"
+    metrics.update({
+        "version": version,
+        "trained_at": started_at.isoformat(),
+        "data_fingerprint": data_fingerprint,
+        "features": list(X_train.columns),
+        "params": {**DEFAULT_PARAMS, **best_params, "tree_method": "hist", "seed": args.seed,
+                   "early_stopping_rounds": args.early_stopping_rounds},
+        "best_iteration": getattr(model, "best_iteration", None),
+        "search": {"n_configs": len(configs), "folds": args.folds, "eta": args.eta,
+                   "best_cv_logloss": float(best["mean_logloss"])},
+        "stages": timer.stages,
+    })
+
+    version_dir = save_artifacts(
+        args.output_dir, version, model, le_dict, metrics,
+        publish_dir=MODEL_DIR if args.publish else None,
+    )
+    leaderboard.to_csv(os.path.join(version_dir, "leaderboard.csv"), index=False)
+    print(f"✅ Leaderboard written to {os.path.join(version_dir, 'leaderboard.csv')}")
+    print(f"Test accuracy: {metrics['accuracy']:.4f}, ROC AUC: {metrics['roc_auc']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
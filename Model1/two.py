@@ -1,149 +1,403 @@
 # risk_scoring_model.py
+#
+# Headless training pipeline for the XGBoost risk scoring model.
+#
+#   python two.py --n-jobs 32 --early-stopping-rounds 50
+#
+# Every run writes a versioned artifact directory (model, encoders, booster
+# JSON, metrics.json) under --output-dir and, unless --no-publish is given,
+# copies the model and encoders to the paths backend/api.py loads.
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
 
 import pandas as pd
 import numpy as np
+import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import accuracy_score, classification_report, roc_auc_score
 import xgboost as xgb
-import joblib
-import shap
-
-# =====================
-# 1. Load Data
-# =====================
-try:
-    mock_df = pd.read_csv("australia_insurance_mock_data.csv")
-    extended_df = pd.read_csv("australia_insurance_extended_mo.csv")
-    print(f"Loaded {len(mock_df)} records from mock data and {len(extended_df)} records from extended data")
-except FileNotFoundError as e:
-    print(f"Error: Could not find CSV file - {e}")
-    exit(1)
-
-# Merge on Customer Name (since no common ID)
-df = pd.merge(mock_df, extended_df, on="Customer Name", how="left")
-print(f"Merged dataset has {len(df)} records")
-# =====================
-# 2. Preprocessing
-# =====================
-# Drop identifiers
-drop_cols = ['Customer Name', 'Email', 'Phone', 'Agent Name']
-df = df.drop(columns=drop_cols, errors="ignore")
 
-# Convert dates to durations
-date_cols = ['Policy Start Date_x', 'Policy End Date_x',
-             'Policy Start Date_y', 'Policy End Date_y']
+import feature_store
+from policy_data import EXTENDED_DATA_FILE, MOCK_DATA_FILE, load_merged
 
-for col in date_cols:
-    if col in df.columns:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
+try:
+    import resource  # Unix only; used for peak RSS per stage
+except ImportError:
+    resource = None
 
-if {'Policy Start Date_x', 'Policy End Date_x'}.issubset(df.columns):
-    df['Policy Duration_x'] = (df['Policy End Date_x'] - df['Policy Start Date_x']).dt.days
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILENAME = "risk_scoring_model.pkl"
+ENCODER_FILENAME = "label_encoders.pkl"
+REGISTRY_FILENAME = "registry.json"
 
-if {'Policy Start Date_y', 'Policy End Date_y'}.issubset(df.columns):
-    df['Policy Duration_y'] = (df['Policy End Date_y'] - df['Policy Start Date_y']).dt.days
+# Identifiers are dropped before training
+DROP_COLS = ['Customer Name', 'Email', 'Phone', 'Agent Name']
 
-df = df.drop(columns=date_cols, errors="ignore")
+DATE_COLS = ['Policy Start Date_x', 'Policy End Date_x',
+             'Policy Start Date_y', 'Policy End Date_y']
 
-# Handle categorical features
-categorical_cols = [
+CATEGORICAL_COLS = [
     'State_x', 'State_y',
     'Insurance Type_x', 'Insurance Type_y',
     'Claim Status_x', 'Claim Status_y',
     'Policy Number', 'Product Tier', 'Payment Frequency'
 ]
 
-le_dict = {}
-for col in categorical_cols:
-    if col in df.columns:
-        le = LabelEncoder()
-        df[col] = le.fit_transform(df[col].astype(str))
-        le_dict[col] = le
+# Use Claim Status_x as target (1 = claim filed, 0 = no claim)
+TARGET = "Claim Status_x"
+
+# Bump when preprocess() changes in a way the column lists below do not capture;
+# together they key the feature cache
+FEATURE_VERSION = 1
+FEATURE_CONFIG = {
+    "version": FEATURE_VERSION,
+    "drop_cols": DROP_COLS,
+    "date_cols": DATE_COLS,
+    "categorical_cols": CATEGORICAL_COLS,
+}
+
+DEFAULT_PARAMS = {
+    "n_estimators": 500,
+    "max_depth": 6,
+    "learning_rate": 0.05,
+    "subsample": 0.8,
+    "colsample_bytree": 0.8,
+}
 
-# Fill missing values
-df = df.fillna(0)
 
 # =====================
-# 3. Define Features & Target
+# Stage timing
 # =====================
-# Use Claim Status_x as target (1 = claim filed, 0 = no claim)
-target = "Claim Status_x"
+def _peak_rss_mb():
+    """Process peak resident set size in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class StageTimer:
+    """Records wall time and peak memory for each named pipeline stage."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        print(f"▶ {name}...")
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = {
+                "wall_time_s": round(elapsed, 3),
+                "peak_rss_mb": _peak_rss_mb(),
+            }
+            print(f"   ✓ {name} finished in {elapsed:.2f}s (peak RSS {self.stages[name]['peak_rss_mb']} MB)")
 
-X = df.drop(columns=[target])
-y = df[target]
 
 # =====================
-# 4. Train-Test Split
+# 1. Load Data
 # =====================
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
+def load_data(data_dir):
+    # Compact dtypes, one-to-one join on a deduplicated key (see policy_data.py)
+    return load_merged(data_dir)
+
 
 # =====================
-# 5. Train XGBoost
+# 2. Preprocessing
 # =====================
-xgb_clf = xgb.XGBClassifier(
-    n_estimators=500,
-    max_depth=6,
-    learning_rate=0.05,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    random_state=42,
-    eval_metric="logloss",
-    use_label_encoder=False
-)
+def preprocess(df, le_dict=None):
+    """
+    Drop identifiers, turn dates into durations and label-encode categoricals.
+    Pass an existing le_dict to reuse fitted encoders instead of fitting new ones.
+    """
+    df = df.drop(columns=DROP_COLS, errors="ignore")
+
+    # Convert dates to durations
+    for col in DATE_COLS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+
+    if {'Policy Start Date_x', 'Policy End Date_x'}.issubset(df.columns):
+        df['Policy Duration_x'] = (df['Policy End Date_x'] - df['Policy Start Date_x']).dt.days
+
+    if {'Policy Start Date_y', 'Policy End Date_y'}.issubset(df.columns):
+        df['Policy Duration_y'] = (df['Policy End Date_y'] - df['Policy Start Date_y']).dt.days
+
+    df = df.drop(columns=DATE_COLS, errors="ignore")
+
+    # Handle categorical features
+    fit_encoders = le_dict is None
+    if fit_encoders:
+        le_dict = {}
+    for col in CATEGORICAL_COLS:
+        if col not in df.columns:
+            continue
+        if fit_encoders:
+            le = LabelEncoder()
+            df[col] = le.fit_transform(df[col].astype(str))
+            le_dict[col] = le
+        elif col in le_dict:
+            lookup = {label: index for index, label in enumerate(le_dict[col].classes_)}
+            df[col] = df[col].astype(str).map(lookup).fillna(-1).astype(int)
+
+    # Fill missing values
+    df = df.fillna(0)
+    return df, le_dict
+
+
+def load_featurized(data_dir, cache_dir=feature_store.FEATURE_CACHE_DIR, use_cache=True, rebuild=False):
+    """
+    Merged, encoded training frame plus encoders and the source fingerprint.
+    Served from the Parquet feature cache when the source CSVs and FEATURE_CONFIG are unchanged.
+    """
+    source_files = [os.path.join(data_dir, MOCK_DATA_FILE), os.path.join(data_dir, EXTENDED_DATA_FILE)]
+    fingerprint = feature_store.source_fingerprint(source_files, feature_config=FEATURE_CONFIG)
 
-xgb_clf.fit(X_train, y_train)
+    if use_cache and not rebuild and feature_store.read_manifest(fingerprint, cache_dir):
+        print(f"Using cached features for fingerprint {fingerprint[:16]}")
+        df, le_dict = feature_store.load_features(fingerprint, cache_dir=cache_dir)
+        return df, le_dict, fingerprint
 
-explainer = shap.TreeExplainer(xgb_clf)
+    df, le_dict = preprocess(load_data(data_dir))
+    if use_cache:
+        feature_store.materialize(df, le_dict, fingerprint, cache_dir=cache_dir, feature_config=FEATURE_CONFIG)
+    return df, le_dict, fingerprint
 
-# Calculate SHAP values for test set
-shap_values = explainer.shap_values(X_test)
 
-# ---- Global Explainability ----
-# Shows average feature importance across all predictions
-shap.summary_plot(shap_values, X_test, plot_type="bar")
+# =====================
+# 3-4. Features, Target & Splits
+# =====================
+def split_data(df, test_size=0.2, val_size=0.1, seed=42):
+    """Stratified train / validation / test split; val_size is a fraction of the full set."""
+    X = df.drop(columns=[TARGET])
+    y = df[TARGET]
 
-# ---- Detailed (per feature) ----
-# Shows how each feature affects predictions positively/negatively
-shap.summary_plot(shap_values, X_test)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=seed, stratify=y
+    )
+    X_train, X_val, y_train, y_val = train_test_split(
+        X_train, y_train, test_size=val_size / (1 - test_size), random_state=seed, stratify=y_train
+    )
+    return X_train, X_val, X_test, y_train, y_val, y_test
 
-# ---- Local Explainability ----
-# Pick one customer/policy and explain its prediction
 
-row_to_explain = 6
+# =====================
+# 5. Train XGBoost
+# =====================
+def build_classifier(params=None, n_classes=2, n_jobs=-1, seed=42, early_stopping_rounds=None):
+    """XGBClassifier with histogram tree building and explicit thread control."""
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    return xgb.XGBClassifier(
+        **params,
+        tree_method="hist",
+        n_jobs=n_jobs,
+        random_state=seed,
+        eval_metric="mlogloss" if n_classes > 2 else "logloss",
+        early_stopping_rounds=early_stopping_rounds,
+    )
+
 
+# =====================
 # 6. Evaluate
 # =====================
-y_pred = xgb_clf.predict(X_test)
-y_pred_proba = xgb_clf.predict_proba(X_test)
+def evaluate(model, X_test, y_test):
+    y_pred = model.predict(X_test)
+    y_pred_proba = model.predict_proba(X_test)
 
-print("Accuracy:", accuracy_score(y_test, y_pred))
+    metrics = {"accuracy": float(accuracy_score(y_test, y_pred))}
+    try:
+        if y_pred_proba.shape[1] == 2:
+            metrics["roc_auc"] = float(roc_auc_score(y_test, y_pred_proba[:, 1]))
+        else:
+            metrics["roc_auc"] = float(roc_auc_score(y_test, y_pred_proba, multi_class="ovr"))
+    except Exception as e:
+        print("ROC AUC could not be computed:", e)
+        metrics["roc_auc"] = None
 
-try:
-    auc = roc_auc_score(y_test, y_pred_proba, multi_class="ovr")
-    print("ROC AUC:", auc)
-except Exception as e:
-    print("ROC AUC could not be computed:", e)
+    metrics["classification_report"] = classification_report(y_test, y_pred, output_dict=True, zero_division=0)
+    return metrics
 
-print("\nClassification Report:\n", classification_report(y_test, y_pred))
 
-# Feature Importance
-import matplotlib.pyplot as plt
-xgb.plot_importance(xgb_clf, max_num_features=15)
-plt.show()
+def write_shap_plots(model, X_test, out_dir):
+    """Global SHAP summary plots written to PNG (never opens a window)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import shap
 
+    explainer = shap.TreeExplainer(model)
+    shap_values = explainer.shap_values(X_test)
+
+    shap.summary_plot(shap_values, X_test, plot_type="bar", show=False)
+    plt.savefig(os.path.join(out_dir, "shap_summary_bar.png"), bbox_inches="tight")
+    plt.close("all")
+
+    xgb.plot_importance(model, max_num_features=15)
+    plt.savefig(os.path.join(out_dir, "feature_importance.png"), bbox_inches="tight")
+    plt.close("all")
+
+
+# =====================
 # 7. Save Model & Encoders
 # =====================
-model_filename = "risk_scoring_model.pkl"
-encoder_filename = "label_encoders.pkl"
+def save_artifacts(output_dir, version, model, le_dict, metrics, publish_dir=None):
+    """
+    Write a versioned artifact directory and register it as current.
+    Returns the version directory path.
+    """
+    version_dir = os.path.join(output_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    with open(os.path.join(version_dir, MODEL_FILENAME), "wb") as f:
+        pickle.dump(model, f)
+    with open(os.path.join(version_dir, ENCODER_FILENAME), "wb") as f:
+        pickle.dump(le_dict, f)
+    model.get_booster().save_model(os.path.join(version_dir, "booster.json"))
+    with open(os.path.join(version_dir, "metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=2, default=str)
+
+    registry_path = os.path.join(output_dir, REGISTRY_FILENAME)
+    registry = load_registry(output_dir)
+    registry["current"] = version
+    registry.setdefault("versions", []).append(version)
+    with open(registry_path, "w") as f:
+        json.dump(registry, f, indent=2)
+    print(f"✅ Artifacts saved to {version_dir}")
+
+    if publish_dir:
+        # Save model and encoders where the API loads them from
+        shutil.copyfile(os.path.join(version_dir, MODEL_FILENAME), os.path.join(publish_dir, MODEL_FILENAME))
+        shutil.copyfile(os.path.join(version_dir, ENCODER_FILENAME), os.path.join(publish_dir, ENCODER_FILENAME))
+        print(f"✅ Model and encoders published to {publish_dir}")
+
+    return version_dir
+
+
+def load_registry(output_dir):
+    registry_path = os.path.join(output_dir, REGISTRY_FILENAME)
+    if os.path.exists(registry_path):
+        with open(registry_path) as f:
+            return json.load(f)
+    return {"current": None, "versions": []}
+
+
+def environment_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "sklearn": sklearn.__version__,
+        "xgboost": xgb.__version__,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the XGBoost risk scoring model (non-interactive).")
+    parser.add_argument("--data-dir", default=MODEL_DIR, help="Directory containing the source CSV files")
+    parser.add_argument("--output-dir", default=os.path.join(MODEL_DIR, "artifacts"),
+                        help="Root directory for versioned artifacts")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="XGBoost threads (-1 = all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--val-size", type=float, default=0.1, help="Validation fraction used for early stopping")
+    parser.add_argument("--early-stopping-rounds", type=int, default=50)
+    parser.add_argument("--n-estimators", type=int, default=DEFAULT_PARAMS["n_estimators"])
+    parser.add_argument("--max-depth", type=int, default=DEFAULT_PARAMS["max_depth"])
+    parser.add_argument("--learning-rate", type=float, default=DEFAULT_PARAMS["learning_rate"])
+    parser.add_argument("--shap-plots", action="store_true", help="Write SHAP/importance PNGs to the artifact dir")
+    parser.add_argument("--no-publish", action="store_true",
+                        help="Do not copy the model/encoders to the paths the API loads")
+    parser.add_argument("--feature-cache-dir", default=feature_store.FEATURE_CACHE_DIR)
+    parser.add_argument("--no-feature-cache", action="store_true", help="Always featurize from the CSVs")
+    parser.add_argument("--rebuild-features", action="store_true", help="Refresh the Parquet feature cache")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    timer = StageTimer()
+    started_at = datetime.now()
+
+    try:
+        with timer.stage("load_features"):
+            df, le_dict, data_fingerprint = load_featurized(
+                args.data_dir, cache_dir=args.feature_cache_dir,
+                use_cache=not args.no_feature_cache, rebuild=args.rebuild_features,
+            )
+    except FileNotFoundError as e:
+        print(f"Error: Could not find CSV file - {e}")
+        return 1
+
+    with timer.stage("split"):
+        X_train, X_val, X_test, y_train, y_val, y_test = split_data(
+            df, test_size=args.test_size, val_size=args.val_size, seed=args.seed
+        )
+
+    params = {
+        **DEFAULT_PARAMS,
+        "n_estimators": args.n_estimators,
+        "max_depth": args.max_depth,
+        "learning_rate": args.learning_rate,
+    }
+    with timer.stage("train"):
+        xgb_clf = build_classifier(
+            params, n_classes=df[TARGET].nunique(), n_jobs=args.n_jobs, seed=args.seed,
+            early_stopping_rounds=args.early_stopping_rounds,
+        )
+        xgb_clf.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+
+    with timer.stage("evaluate"):
+        metrics = evaluate(xgb_clf, X_test, y_test)
+    print("Accuracy:", metrics["accuracy"])
+    print("ROC AUC:", metrics["roc_auc"])
+
+    version = f"{started_at.strftime('%Y%m%d-%H%M%S')}-{data_fingerprint[:8]}"
+    metrics.update({
+        "version": version,
+        "trained_at": started_at.isoformat(),
+        "data_fingerprint": data_fingerprint,
+        "rows": {"train": len(X_train), "validation": len(X_val), "test": len(X_test)},
+        "features": list(X_train.columns),
+        "params": {**params, "tree_method": "hist", "n_jobs": args.n_jobs, "seed": args.seed,
+                   "early_stopping_rounds": args.early_stopping_rounds},
+        "best_iteration": getattr(xgb_clf, "best_iteration", None),
+        "environment": environment_info(),
+        "stages": timer.stages,
+    })
+
+    with timer.stage("save"):
+        version_dir = save_artifacts(
+            args.output_dir, version, xgb_clf, le_dict, metrics,
+            publish_dir=None if args.no_publish else MODEL_DIR,
+        )
+        if args.shap_plots:
+            write_shap_plots(xgb_clf, X_test, version_dir)
+
+    # Rewrite metrics so the save stage timing is included
+    metrics["stages"] = timer.stages
+    with open(os.path.join(version_dir, "metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=2, default=str)
 
-# Save model
-joblib.dump(xgb_clf, model_filename)
-print(f"✅ Model saved to {model_filename}")
+    total = sum(stage["wall_time_s"] for stage in timer.stages.values())
+    print(f"✅ Training run {version} finished in {total:.2f}s")
+    return 0
 
-# Save label encoders (for preprocessing new data consistently)
-joblib.dump(le_dict, encoder_filename)
-print(f"✅ Label encoders saved to {encoder_filename}")
 
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# weather_store.py
+#
+# Local SQLite store of historical daily weather, keyed by (source, location, date).
+#
+# Historical weather for a given place and day never changes, so anything
+# fetched once is kept here and later runs only hit the network for the
+# dates that are missing. The weather functions in one.py read through the
+# store via the read_through() decorator.
+
+import functools
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_PATH = os.path.join(MODEL_DIR, "weather_store.sqlite")
+WEATHER_FIELDS = ("temp", "humidity", "wind_speed")
+
+
+class WeatherStore:
+    """Thread-safe SQLite store of daily weather observations."""
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS weather (
+                source TEXT NOT NULL,
+                location TEXT NOT NULL,
+                date TEXT NOT NULL,
+                temp REAL,
+                humidity REAL,
+                wind_speed REAL,
+                fetched_at TEXT NOT NULL,
+                PRIMARY KEY (source, location, date)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def get(self, source, location, date_str):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT temp, humidity, wind_speed FROM weather WHERE source = ? AND location = ? AND date = ?",
+                (source, location, date_str),
+            ).fetchone()
+        return dict(zip(WEATHER_FIELDS, row)) if row else None
+
+    def get_many(self, source, pairs):
+        """Stored weather for (location, date) pairs; missing pairs are simply absent."""
+        found = {}
+        by_location = {}
+        for location, date_str in pairs:
+            by_location.setdefault(location, set()).add(date_str)
+
+        with self.lock:
+            for location, dates in by_location.items():
+                rows = self.conn.execute(
+                    "SELECT date, temp, humidity, wind_speed FROM weather "
+                    "WHERE source = ? AND location = ? AND date BETWEEN ? AND ?",
+                    (source, location, min(dates), max(dates)),
+                )
+                for date_str, *values in rows:
+                    if date_str in dates:
+                        found[(location, date_str)] = dict(zip(WEATHER_FIELDS, values))
+        return found
+
+    def missing(self, source, pairs):
+        stored = self.get_many(source, pairs)
+        return [pair for pair in pairs if pair not in stored]
+
+    def put_many(self, source, rows):
+        """Store an iterable of (location, date, weather dict) rows."""
+        fetched_at = datetime.now().isoformat(timespec="seconds")
+        records = [
+            (source, location, date_str, *(weather.get(field) for field in WEATHER_FIELDS), fetched_at)
+            for location, date_str, weather in rows
+            if weather and any(weather.get(field) is not None for field in WEATHER_FIELDS)
+        ]
+        if not records:
+            return 0
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO weather VALUES (?, ?, ?, ?, ?, ?, ?)", records)
+            self.conn.commit()
+        return len(records)
+
+    def put(self, source, location, date_str, weather):
+        return self.put_many(source, [(location, date_str, weather)])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def missing_date_ranges(date_strs, max_gap_days=0):
+    """
+    Collapse dates into (start, end) ranges for bulk range requests. Runs separated
+    by at most max_gap_days missing days are merged into one range.
+    """
+    days = sorted({date.fromisoformat(d) for d in date_strs})
+    ranges = []
+    for day in days:
+        if ranges and (day - ranges[-1][1]).days <= max_gap_days + 1:
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [(start.isoformat(), end.isoformat()) for start, end in ranges]
+
+
+def read_through(store, source, key=None):
+    """
+    Decorate a weather fetch function so it reads through the store.
+    `key(*args)` maps the function's arguments to (location, date); by default
+    the function is assumed to take (location, date_str). Failed fetches
+    (all fields None) are not stored, so they are retried next run.
+    """
+    def decorator(fetch):
+        @functools.wraps(fetch)
+        def wrapper(*args):
+            location, date_str = key(*args) if key else args
+            cached = store.get(source, location, date_str)
+            if cached is not None:
+                return cached
+            weather = fetch(*args)
+            store.put(source, location, date_str, weather)
+            return weather
+        return wrapper
+    return decorator
+
+
+def iso_date_from_timestamp(timestamp):
+    return (datetime(1970, 1, 1) + timedelta(seconds=int(timestamp))).strftime("%Y-%m-%d")
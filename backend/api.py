@@ -1,5 +1,5 @@
 # --- Imports ---
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
 import requests
 import feedparser
@@ -11,19 +11,34 @@ import time
 import os
 from dotenv import load_dotenv
 import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
+import xgboost as xgb
 from PyPDF2 import PdfReader
-from jinja2 import Environment, FileSystemLoader
 from openai import OpenAI
 import markdown
 import json
-from jinja2 import Environment, BaseLoader
-from fpdf import FPDF
-import logging
-import json
-from jinja2 import Environment, BaseLoader
-from fpdf import FPDF
-import logging
+import xml.etree.ElementTree as ET
+
+from compliance_cache import ComplianceCache, checklist_fingerprint, make_cache_key
+from passage_index import PassageIndex, requirement_context, split_passages
+from policy_sections import (
+    PolicyRevisionStore, changed_sections, cited_sections, derive_family, reusable_results, split_sections,
+)
+from compliance_rules import compile_rules, prescreen
+from llm_scheduler import LLMQueueTimeout, LLMScheduler, estimate_tokens
+from template_registry import TemplateRegistry
+from pdf_renderer import PDFQueueFull, PDFRenderer, render_text_pdf
+from document_store import DocumentStore, document_key
+from phol_store import PHOLStore, fund_for_policy, product_for_policy
+from phol_validation import PHOLValidator, SchemaUnavailable
+from risk_engine import RiskEngine, weather_severity
+from portfolio import CAPITAL_CITIES, PolicyBook, rescore
+from geo_aggregates import GeoAggregates
+from scenario_engine import HORIZONS, PRESETS, SHOCK_TYPES, ScenarioEngine, preset_shocks
 
 
 # --- App Initialization ---
@@ -36,6 +51,34 @@ CORS(app)
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
 FINANCE_API_KEY = os.getenv("FINANCE_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# OpenAI client used for policy drafting and compliance analysis (None disables AI features).
+# OPENAI_BASE_URL points it at any OpenAI-compatible server, e.g. a local stub for testing.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL) if OPENAI_API_KEY else None
+POLICY_MODEL = os.getenv("POLICY_MODEL", "gpt-4o-mini")
+COMPLIANCE_MODEL = os.getenv("COMPLIANCE_MODEL", "gpt-4o-mini")
+
+# Compliance results cache: repeat checks of the same wording cost no tokens
+COMPLIANCE_CACHE_PATH = os.getenv(
+    "COMPLIANCE_CACHE_PATH", os.path.join(os.path.dirname(__file__), 'compliance_cache.sqlite'))
+COMPLIANCE_CACHE_TTL_HOURS = float(os.getenv("COMPLIANCE_CACHE_TTL_HOURS", "720"))
+compliance_cache = ComplianceCache(COMPLIANCE_CACHE_PATH, ttl_seconds=COMPLIANCE_CACHE_TTL_HOURS * 3600)
+
+# All LLM calls share one scheduler: bounded concurrency, tokens-per-minute budget,
+# interactive calls (policy drafting) ahead of batch calls (compliance units)
+llm_scheduler = LLMScheduler(
+    client,
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "60")),
+)
+
+# Latest analysed revision per policy family, for incremental re-checks of revised drafts
+POLICY_REVISIONS_PATH = os.getenv(
+    "POLICY_REVISIONS_PATH", os.path.join(os.path.dirname(__file__), 'policy_revisions.sqlite'))
+policy_revisions = PolicyRevisionStore(POLICY_REVISIONS_PATH)
 
 # --- NEW: ML MODEL LOADING ---
 # Load the model and encoders once when the server starts for efficiency.
@@ -45,8 +88,19 @@ ENCODERS_PATH = os.path.join(MODEL_DIR, 'label_encoders.pkl')
 
 model = None
 label_encoders = None
+label_lookups = {}  # column -> {original label: encoded value}, built once from label_encoders
 model_columns = None  # This will hold the required feature order for the model
 
+# Class whose probability is reported as "risk" (matches predict_proba(...)[:, 1])
+ML_RISK_CLASS_INDEX = 1
+
+# Single scoring formula for every endpoint; weights/thresholds can be overridden with JSON env vars
+risk_engine = RiskEngine(
+    weights=json.loads(os.getenv("RISK_ENGINE_WEIGHTS", "{}")),
+    thresholds=json.loads(os.getenv("RISK_ENGINE_THRESHOLDS", "[60, 80]")),
+)
+ML_CACHE_SIZE = int(os.getenv("ML_CACHE_SIZE", "10000"))
+
 try:
     print("🧠 Loading ML model and encoders...")
 
@@ -58,15 +112,19 @@ try:
         label_encoders = pickle.load(f_encoders)
     print("   ✓ Label encoders ('label_encoders.pkl') loaded successfully.")
 
-    # IMPORTANT: You must replace this list with the actual column names
-    # in the exact order your model was trained on. This is a critical step.
-    model_columns = ['Customer Name', 'Age_x', 'State_x', 'Insurance Type_x',
-       'Annual Premium (AUD)_x', 'Claim Amount (AUD)_x', 'Claim Status_x',
-       'Policy Start Date_x', 'Policy End Date_x', 'Age_y', 'State_y',
-       'Insurance Type_y', 'Annual Premium (AUD)_y', 'Claim Amount (AUD)_y',
-       'Claim Status_y', 'Policy Start Date_y', 'Policy End Date_y',
-       'Policy Number', 'Product Tier', 'Payment Frequency', 'Risk Score',
-       'Email', 'Phone', 'Agent Name']
+    label_lookups = {
+        column: {label: index for index, label in enumerate(encoder.classes_)}
+        for column, encoder in label_encoders.items()
+    }
+
+    # Feature order comes from the trained model itself (two.py: identifiers and raw
+    # dates dropped, Policy Duration_x/_y derived from the dates)
+    model_columns = model.get_booster().feature_names
+    if model_columns is None and getattr(model, "feature_names_in_", None) is not None:
+        model_columns = model.feature_names_in_
+    model_columns = list(model_columns) if model_columns is not None else []
+    if not model_columns:
+        raise ValueError("Model has no feature names; retrain it with two.py")
 
     print(f"   ✓ Model expects {len(model_columns)} features in a specific order.")
 
@@ -547,9 +605,12 @@ def finance_news(symbols=None, max_retries=2):
     return financial_alerts[:8]  # Return top 8 alerts
 
 
-def extract_text_from_pdf(file_stream):
-    # ... (This function remains unchanged)
-    """Extract text from PDF with enhanced error handling."""
+def extract_text_from_pdf(file_stream, keep_lines=False):
+    """
+    Extract text from PDF with enhanced error handling.
+    keep_lines=True keeps line breaks (needed to find section headings); whitespace
+    within each line is still normalized.
+    """
     try:
         print("📄 Starting PDF text extraction")
         doc = fitz.open(stream=file_stream, filetype="pdf")
@@ -560,8 +621,12 @@ def extract_text_from_pdf(file_stream):
             page_text = page.get_text()
 
             # Clean text
-            page_text = re.sub(r'\s+', ' ', page_text)  # Normalize whitespace
-            full_text += f" {page_text}"
+            if keep_lines:
+                page_text = "\n".join(re.sub(r'[ \t\f\v]+', ' ', line).strip() for line in page_text.splitlines())
+                full_text += f"\n{page_text}"
+            else:
+                page_text = re.sub(r'\s+', ' ', page_text)  # Normalize whitespace
+                full_text += f" {page_text}"
 
         doc.close()
         full_text = full_text.strip()
@@ -578,6 +643,155 @@ def extract_text_from_pdf(file_stream):
         raise
 
 
+# --- ML SCORING & EXPLANATION HELPERS ---
+# Probabilities and per-feature contributions are computed together in one
+# booster pass and cached per encoded feature row, so an explanation requested
+# right after a prediction is a cache hit instead of a second model run.
+_ml_cache = OrderedDict()
+_ml_cache_lock = threading.Lock()
+
+
+# Date pairs the model sees as durations in days (see two.py preprocess)
+ML_DURATION_FEATURES = {
+    "Policy Duration_x": ("Policy Start Date_x", "Policy End Date_x"),
+    "Policy Duration_y": ("Policy Start Date_y", "Policy End Date_y"),
+}
+
+
+def prepare_ml_features(records):
+    """Encode raw applicant records into a frame with the model's feature order."""
+    input_df = pd.DataFrame(records)
+
+    # Durations from the raw policy dates, as in training
+    for feature, (start_col, end_col) in ML_DURATION_FEATURES.items():
+        if feature in model_columns and feature not in input_df.columns and {start_col, end_col}.issubset(input_df.columns):
+            input_df[feature] = (
+                pd.to_datetime(input_df[end_col], errors='coerce') - pd.to_datetime(input_df[start_col], errors='coerce')
+            ).dt.days
+
+    for col in model_columns:
+        if col not in input_df.columns:
+            raise KeyError(f"Missing required feature in input data: '{col}'")
+    input_df = input_df[model_columns].copy()
+
+    # Encode categoricals with the training encoders; unseen labels become -1
+    for column in model_columns:
+        lookup = label_lookups.get(column)
+        if lookup is not None:
+            input_df[column] = input_df[column].astype(str).map(lookup).fillna(-1).astype(int)
+        else:
+            input_df[column] = pd.to_numeric(input_df[column], errors='coerce')
+
+    return input_df.fillna(0)
+
+
+def _ml_iteration_range():
+    """Trees to use for prediction (respects early stopping when present)."""
+    best_iteration = getattr(model, "best_iteration", None)
+    return (0, best_iteration + 1) if best_iteration is not None else (0, 0)
+
+
+def score_ml_batch(processed_df):
+    """
+    Return (probabilities, contributions) for every row of an encoded frame.
+
+    Contributions come from the booster's native `pred_contribs` output (log-odds
+    space, last column is the bias term). Rows already seen are served from cache.
+    """
+    values = processed_df.to_numpy(dtype=np.float32)
+    keys = [row.tobytes() for row in values]
+    probabilities = np.empty(len(keys), dtype=np.float32)
+    contributions = np.empty((len(keys), values.shape[1] + 1), dtype=np.float32)
+
+    misses = []
+    with _ml_cache_lock:
+        for i, key in enumerate(keys):
+            cached = _ml_cache.get(key)
+            if cached is None:
+                misses.append(i)
+            else:
+                _ml_cache.move_to_end(key)
+                probabilities[i], contributions[i] = cached
+
+    if misses:
+        booster = model.get_booster()
+        dmatrix = xgb.DMatrix(values[misses], feature_names=list(processed_df.columns))
+        iteration_range = _ml_iteration_range()
+
+        raw = booster.predict(dmatrix, iteration_range=iteration_range)
+        contribs = booster.predict(dmatrix, pred_contribs=True, iteration_range=iteration_range)
+        if raw.ndim == 2:  # multi-class: keep the risk class only
+            raw = raw[:, ML_RISK_CLASS_INDEX]
+            contribs = contribs[:, ML_RISK_CLASS_INDEX, :]
+
+        probabilities[misses] = raw
+        contributions[misses] = contribs
+
+        with _ml_cache_lock:
+            for j, i in enumerate(misses):
+                _ml_cache[keys[i]] = (raw[j], contribs[j])
+            while len(_ml_cache) > ML_CACHE_SIZE:
+                _ml_cache.popitem(last=False)
+
+    return probabilities, contributions
+
+
+def top_contributions(processed_row, contribution_row, top_k=5):
+    """Top-k feature contributions with categorical codes mapped back to labels."""
+    feature_contribs = contribution_row[:-1]
+    order = np.argsort(-np.abs(feature_contribs))[:top_k]
+
+    explanation = []
+    for idx in order:
+        feature = model_columns[idx]
+        value = processed_row.iloc[idx]
+        encoder = label_encoders.get(feature)
+        if encoder is not None:
+            code = int(value)
+            value = encoder.classes_[code] if 0 <= code < len(encoder.classes_) else "Unseen"
+        elif isinstance(value, np.generic):
+            value = value.item()
+
+        contribution = float(feature_contribs[idx])
+        explanation.append({
+            'feature': feature,
+            'value': value,
+            'contribution': round(contribution, 4),
+            'direction': 'increases risk' if contribution > 0 else 'decreases risk'
+        })
+    return explanation
+
+
+def applicant_ml_probability():
+    """
+    (ML probability, status) for an optional 'applicant' JSON form field sent along with a PDF.
+    The probability is None when no applicant was sent or it could not be scored; the status
+    says which, so the response shows whether the score includes the ML blend.
+    """
+    raw = request.form.get('applicant')
+    if not raw:
+        return None, {"status": "not_provided"}
+    if not model or not label_encoders:
+        print("⚠️ Applicant data sent but the ML model is not loaded")
+        return None, {"status": "unavailable", "error": "ML model or encoders are not loaded"}
+    try:
+        probabilities, _ = score_ml_batch(prepare_ml_features([json.loads(raw)]))
+        return float(probabilities[0]), {"status": "scored"}
+    except Exception as e:
+        print(f"❌ Could not score applicant data: {e}\n{traceback.format_exc()}")
+        return None, {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+
+def assessment_risk(hazard_news, financial_news_alerts, weather_details, ml_probability=None):
+    """Risk engine score for one assessed document (plus the applicant's ML probability if known)."""
+    return risk_engine.score_one(
+        ml_probability=ml_probability,
+        hazard_count=len(hazard_news),
+        market_count=len(financial_news_alerts),
+        weather_severity=weather_severity(weather_details),
+    )
+
+
 # --- NEW: ML PREDICTION ENDPOINT ---
 @app.route('/api/predict_ml', methods=['POST'])
 def predict_ml_risk():
@@ -599,40 +813,18 @@ def predict_ml_risk():
     print("   - Input data received:", data)
 
     try:
-        # 1. Convert incoming JSON to a pandas DataFrame
-        input_df = pd.DataFrame([data])
-
-        # 2. Preprocess categorical data using the loaded label encoders
-        for column, encoder in label_encoders.items():
-            if column in input_df.columns:
-                # Handle potentially unseen labels gracefully
-                input_df[column] = input_df[column].apply(
-                    lambda x: encoder.transform([x])[0] if x in encoder.classes_ else -1
-                )
-
-        # 3. Ensure all required columns are present and in the correct order
-        processed_df = pd.DataFrame(columns=model_columns)
-        for col in model_columns:
-            if col in input_df.columns:
-                processed_df[col] = input_df[col]
-            else:
-                # If a column is missing, you might want to fill it with a default or raise an error
-                # For now, we'll raise an error as it's better to be explicit.
-                raise KeyError(f"Missing required feature in input data: '{col}'")
-
-        # 4. Make a prediction
-        # Use predict_proba to get the probability of risk (class 1)
-        prediction_proba = model.predict_proba(processed_df)[:, 1]
-        raw_prediction = prediction_proba[0]
+        # 1-3. Encode the applicant and order the features for the model
+        processed_df = prepare_ml_features([data])
+
+        # 4. Make a prediction (contributions are cached for /api/explain_ml)
+        prediction_proba, _ = score_ml_batch(processed_df)
+        raw_prediction = float(prediction_proba[0])
         print(f"   - Raw model prediction (probability): {raw_prediction:.4f}")
 
-        # 5. Format the response
-        score = int(raw_prediction * 100)
-        level = 'Low'
-        if score > 70:
-            level = 'High'
-        elif score > 45:
-            level = 'Medium'
+        # 5. Format the response (ML-only input to the shared risk engine)
+        risk = risk_engine.score_one(ml_probability=raw_prediction)
+        score = int(risk["score"])
+        level = risk["level"]
 
         response = {'score': score, 'level': level}
         print(f"   ✓ Prediction successful. Score: {score}, Level: {level}")
@@ -649,6 +841,65 @@ def predict_ml_risk():
         return jsonify({'error': error_msg}), 500
 
 
+@app.route('/api/explain_ml', methods=['POST'])
+def explain_ml_risk():
+    """
+    Explains ML risk scores with per-feature contributions.
+    Accepts one applicant object, a list of applicants, or {"applicants": [...], "top_k": 5}.
+    """
+    if not model or not label_encoders:
+        return jsonify({'error': "Model or encoders are not loaded. Cannot explain prediction."}), 500
+
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No input data provided in JSON format'}), 400
+
+    top_k = request.args.get('top_k', 5)
+    if isinstance(data, dict) and 'applicants' in data:
+        top_k = data.get('top_k', top_k)
+        records = data['applicants']
+    elif isinstance(data, list):
+        records = data
+    else:
+        records = [data]
+
+    try:
+        top_k = None if isinstance(top_k, (bool, float)) else int(top_k)
+    except (TypeError, ValueError):
+        top_k = None
+    if top_k is None or not 1 <= top_k <= len(model_columns):
+        return jsonify({'error': f"top_k must be an integer between 1 and {len(model_columns)}"}), 400
+
+    try:
+        started = time.perf_counter()
+        processed_df = prepare_ml_features(records)
+        probabilities, contributions = score_ml_batch(processed_df)
+        risk = risk_engine.score(ml_probability=probabilities)
+
+        explanations = []
+        for i in range(len(records)):
+            explanations.append({
+                'score': int(risk["score"][i]),
+                'level': str(risk["level"][i]),
+                'base_value': round(float(contributions[i, -1]), 4),
+                'top_contributions': top_contributions(processed_df.iloc[i], contributions[i], top_k)
+            })
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        if isinstance(data, dict) and 'applicants' not in data:
+            return jsonify({**explanations[0], 'elapsed_ms': elapsed_ms})
+        return jsonify({'explanations': explanations, 'count': len(explanations), 'elapsed_ms': elapsed_ms})
+
+    except KeyError as e:
+        error_msg = f"Feature mismatch error: {e}. Ensure all required features are provided."
+        print(f"❌ {error_msg}")
+        return jsonify({'error': error_msg}), 400
+    except Exception as e:
+        error_msg = f"An internal error occurred during explanation: {e}"
+        print(f"❌ {error_msg}\n{traceback.format_exc()}")
+        return jsonify({'error': error_msg}), 500
+
+
 # --- END OF NEW ENDPOINT ---
 
 
@@ -665,6 +916,12 @@ def debug_config():
     })
 
 
+@app.route('/api/debug/llm', methods=['GET'])
+def debug_llm():
+    """LLM scheduler state: queue depth, token usage and per-call latency."""
+    return jsonify(llm_scheduler.stats())
+
+
 @app.route('/api/debug/test_city/<city>', methods=['GET'])
 def debug_test_city(city):
     """Test location-specific functions for a city."""
@@ -715,17 +972,15 @@ def assess_application():
         hazard_news = get_location_specific_hazard_news(city) if city else []
         financial_news_alerts = finance_news()
 
-        # Calculate risk score based on hazards and financial alerts
-        base_score = 65
-        hazard_adjustment = min(len(hazard_news) * 5, 20)
-        financial_adjustment = min(len(financial_news_alerts) * 2, 10)  # Financial news has less impact
-        risk_score = base_score + hazard_adjustment + financial_adjustment
-
-        risk_level = "High Risk" if risk_score > 80 else "Medium Risk" if risk_score > 60 else "Low Risk"
+        # Calculate risk score based on hazards, weather, financial alerts (and applicant data if sent)
+        ml_probability, ml_scoring = applicant_ml_probability()
+        risk = assessment_risk(hazard_news, financial_news_alerts, weather_details, ml_probability)
 
         response = {
-            "risk_score": risk_score,
-            "risk_level": risk_level,
+            "risk_score": risk["score"],
+            "risk_level": f"{risk['level']} Risk",
+            "risk_components": risk["components"],
+            "ml_scoring": ml_scoring,
             "location_found": city or "Not specified",
             "weather_details": weather_details,
             "hazard_alerts": hazard_news,
@@ -863,16 +1118,15 @@ def assess_application_debug():
             print(f"💰 Financial Alert {i + 1}: {alert.get('title', 'No title')}")
 
         # Calculate risk score
-        base_score = 65
-        hazard_adjustment = min(len(hazard_news) * 5, 20)
-        financial_adjustment = min(len(financial_news_alerts) * 2, 10)
-        risk_score = base_score + hazard_adjustment + financial_adjustment
-
-        risk_level = "High Risk" if risk_score > 80 else "Medium Risk" if risk_score > 60 else "Low Risk"
+        ml_probability, ml_scoring = applicant_ml_probability()
+        risk = assessment_risk(hazard_news, financial_news_alerts, weather_details, ml_probability)
+        print(f"📊 Risk components: {risk['components']}")
 
         response = {
-            "risk_score": risk_score,
-            "risk_level": risk_level,
+            "risk_score": risk["score"],
+            "risk_level": f"{risk['level']} Risk",
+            "risk_components": risk["components"],
+            "ml_scoring": ml_scoring,
             "location_found": city or "Not specified",
             "weather_details": weather_details,
             "hazard_alerts": hazard_news,
@@ -909,6 +1163,242 @@ def assess_application_debug():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+# --- Portfolio re-scoring ---
+# The policy book is loaded once (lazily) into columnar arrays; a re-score is one vectorised pass.
+PORTFOLIO_BOOK_PATH = os.getenv("PORTFOLIO_BOOK_PATH", os.path.join(MODEL_DIR, 'australia_insurance_extended_mo.csv'))
+PORTFOLIO_ALERT_WORKERS = int(os.getenv("PORTFOLIO_ALERT_WORKERS", "8"))
+_policy_book = None
+_policy_book_lock = threading.Lock()
+_last_rescore = None
+
+
+def get_policy_book(reload=False):
+    global _policy_book
+    with _policy_book_lock:
+        if _policy_book is None or reload:
+            _policy_book = PolicyBook.from_csv(PORTFOLIO_BOOK_PATH)
+        return _policy_book
+
+
+def live_location_alerts(cities):
+    """Current hazard alert count and weather severity for each city, fetched concurrently."""
+    alerts = []
+    with ThreadPoolExecutor(max_workers=PORTFOLIO_ALERT_WORKERS) as pool:
+        hazards = {city: pool.submit(get_location_specific_hazard_news, city) for city in cities}
+        weather = {city: pool.submit(get_location_specific_weather, city) for city in cities}
+        for city in cities:
+            try:
+                count = len(hazards[city].result())
+                severity = weather_severity(weather[city].result())
+                severity = None if np.isnan(severity) else severity
+            except Exception as e:
+                print(f"⚠️ Could not load alerts for {city}: {e}")
+                continue
+            if count or severity:
+                alerts.append({"city": city, "count": count, "weather_severity": severity})
+    return alerts
+
+
+@app.route('/api/portfolio/rescore', methods=['POST'])
+def rescore_portfolio():
+    """
+    Re-score the whole policy book against current alerts, grouped by state/city.
+    JSON body (all optional): {"alerts": [{"state" | "city", "count", "weather_severity"}],
+    "market_alert_count": n, "as_of": "YYYY-MM-DD", "top_n": 20}.
+    Without "alerts", live hazard/weather alerts are fetched for every capital city.
+    """
+    global _last_rescore
+    data = request.get_json(silent=True) or {}
+    try:
+        book = get_policy_book()
+        alerts = data.get("alerts")
+        market_alert_count = data.get("market_alert_count")
+        if alerts is None:
+            alerts = live_location_alerts(list(CAPITAL_CITIES.values()))
+        if market_alert_count is None:
+            market_alert_count = len(finance_news())
+
+        result = rescore(book, risk_engine, alerts, market_alert_count=market_alert_count,
+                         as_of=data.get("as_of"), top_n=int(data.get("top_n", 20)))
+        result.update({"alerts": alerts, "market_alert_count": market_alert_count,
+                       "timestamp": datetime.now().isoformat()})
+        _last_rescore = result
+        ensure_geo_aggregates()
+        geo_aggregates.set_alerts(alerts)
+        print(f"✅ Re-scored {result['policies_scored']} policies in {result['elapsed_ms']}ms: "
+              f"{result['affected_policies']} affected, {result['level_changes']} level changes")
+        return jsonify(result)
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid rescore request: {e}"}), 400
+    except Exception as e:
+        print(f"❌ Portfolio rescore failed: {e}\n{traceback.format_exc()}")
+        return jsonify({"error": f"Portfolio rescore failed: {e}"}), 500
+
+
+@app.route('/api/portfolio', methods=['GET'])
+def get_portfolio():
+    """Loaded book summary plus the most recent re-score (if any)."""
+    try:
+        return jsonify({"book": get_policy_book().stats(), "last_rescore": _last_rescore})
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+
+
+@app.route('/api/portfolio/reload', methods=['POST'])
+def reload_portfolio():
+    """Reload the policy book from PORTFOLIO_BOOK_PATH after the extract changes."""
+    try:
+        book = get_policy_book(reload=True)
+        if geo_aggregates.loaded:
+            geo_aggregates.load_book(book)
+        return jsonify({"book": book.stats()})
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+
+
+# --- Scenario testing (Monte Carlo over the policy book) ---
+SCENARIO_MAX_PATHS = int(os.getenv("SCENARIO_MAX_PATHS", "200000"))
+scenario_engine = ScenarioEngine(max_workers=int(os.getenv("SCENARIO_WORKERS", "0")) or None)
+
+
+@app.route('/api/scenarios', methods=['GET'])
+def list_scenarios():
+    """Named scenarios, horizons and shock types accepted by /api/scenarios/run."""
+    return jsonify({
+        "scenarios": {name: preset["label"] for name, preset in PRESETS.items()},
+        "horizons": HORIZONS,
+        "shock_types": list(SHOCK_TYPES),
+        "max_paths": SCENARIO_MAX_PATHS,
+    })
+
+
+@app.route('/api/scenarios/run', methods=['POST'])
+def run_scenario():
+    """
+    Simulate the policy book's loss distribution under a stress scenario.
+    JSON body: {"scenario": "natural_disaster" | ..., "severity": 1-10, "horizon": "short" | "medium" | "long"}
+    and/or {"shocks": [...]} (see scenario_engine.py), plus optional "n_paths", "seed",
+    "horizon_years", "assumptions" and "as_of".
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        shocks = list(data.get("shocks") or [])
+        if data.get("scenario"):
+            shocks = preset_shocks(data["scenario"], data.get("severity", 5)) + shocks
+        horizon_years = float(data.get("horizon_years") or HORIZONS.get(data.get("horizon", "medium"), 1.0))
+        n_paths = int(data.get("n_paths", 10000))
+        if not 1 <= n_paths <= SCENARIO_MAX_PATHS:
+            return jsonify({"error": f"n_paths must be between 1 and {SCENARIO_MAX_PATHS}"}), 400
+
+        result = scenario_engine.run(
+            get_policy_book(), shocks, n_paths=n_paths, seed=data.get("seed"), horizon_years=horizon_years,
+            assumptions=data.get("assumptions"), as_of=data.get("as_of"),
+        )
+        result.update({"scenario": data.get("scenario"), "severity": data.get("severity"),
+                       "timestamp": datetime.now().isoformat()})
+        print(f"✅ Scenario {data.get('scenario') or 'custom'}: {n_paths} paths over {result['policies']} "
+              f"policies in {result['elapsed_seconds']}s")
+        return jsonify(result)
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid scenario: {e}"}), 400
+    except Exception as e:
+        print(f"❌ Scenario run failed: {e}\n{traceback.format_exc()}")
+        return jsonify({"error": f"Scenario run failed: {e}"}), 500
+
+
+# --- Geo risk aggregates (GeoRiskMap) ---
+# Per-state/city/grid-cell totals kept up to date as alerts and policies change; map reads are cached bytes.
+GEO_GRID_ZOOM = int(os.getenv("GEO_GRID_ZOOM", "8"))
+GEO_CACHE_MAX_AGE = int(os.getenv("GEO_CACHE_MAX_AGE_SECONDS", "60"))
+geo_aggregates = GeoAggregates(risk_engine, grid_zoom=GEO_GRID_ZOOM)
+_geo_load_lock = threading.Lock()
+
+
+def ensure_geo_aggregates():
+    """Build the aggregates from the policy book on first use."""
+    if geo_aggregates.loaded:
+        return
+    with _geo_load_lock:
+        if not geo_aggregates.loaded:
+            geo_aggregates.load_book(get_policy_book())
+
+
+def geo_response(payload, etag, mimetype="application/json"):
+    """Cached payload with a version ETag, so unchanged maps revalidate with a 304."""
+    response = Response(payload, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"public, max-age={GEO_CACHE_MAX_AGE}"
+    return response.make_conditional(request)
+
+
+@app.route('/api/geo/<level>', methods=['GET'])
+def get_geo_layer(level):
+    """GeoJSON of the 'state', 'city' or 'cell' aggregates."""
+    try:
+        ensure_geo_aggregates()
+        payload, etag = geo_aggregates.layer(level)
+        return geo_response(payload, etag, mimetype="application/geo+json")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+
+
+@app.route('/api/geo/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_geo_tile(z, x, y):
+    """Grid cells inside slippy-map tile z/x/y as a compact field list + rows."""
+    if z < 0 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "Invalid tile coordinates"}), 400
+    try:
+        ensure_geo_aggregates()
+        payload, etag = geo_aggregates.tile(z, x, y)
+        return geo_response(payload, etag)
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+
+
+@app.route('/api/geo/alerts', methods=['POST'])
+def update_geo_alerts():
+    """
+    Update current alert counts: {"alerts": [{"state" | "city" | "lat"/"lon", "count"}], "replace": true}.
+    With replace (the default) locations not listed drop to zero alerts.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        ensure_geo_aggregates()
+        geo_aggregates.set_alerts(data.get("alerts") or [], replace=data.get("replace", True))
+        return jsonify(geo_aggregates.stats())
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid alerts: {e}"}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+
+
+@app.route('/api/geo/policies', methods=['POST'])
+def update_geo_policies():
+    """Add/replace policies ({"policies": [...]}) and/or drop them ({"remove": [policy numbers]})."""
+    data = request.get_json(silent=True) or {}
+    try:
+        ensure_geo_aggregates()
+        if data.get("policies"):
+            geo_aggregates.upsert_policies(data["policies"])
+        removed = geo_aggregates.remove_policies(data["remove"]) if data.get("remove") else 0
+        return jsonify({**geo_aggregates.stats(), "removed": removed})
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid policy update: {e}"}), 400
+    except FileNotFoundError as e:
+        return jsonify({"error": f"Policy book not found: {e}"}), 404
+
+
+@app.route('/api/geo', methods=['GET'])
+def get_geo_stats():
+    return jsonify(geo_aggregates.stats())
+
+
 # Add these after your existing global variables
 APRA_COMPLIANCE_CHECKLIST = {
     "metadata": {
@@ -991,113 +1481,38 @@ APRA_COMPLIANCE_CHECKLIST = {
     }
 }
 
-# Enhanced policy template
-ENHANCED_POLICY_TEMPLATE = """
-<!doctype html>
-<html>
-<head>
-  <meta charset="utf-8"/>
-  <title>{{ product.product_name or "Insurance Policy" }} - Policy Schedule</title>
-  <style>
-    body { font-family: Arial, sans-serif; margin: 30px; line-height: 1.6; }
-    .header { text-align: center; border-bottom: 2px solid #2c3e50; padding-bottom: 20px; }
-    .section { margin: 20px 0; }
-    .section h3 { color: #2c3e50; border-bottom: 1px solid #ecf0f1; padding-bottom: 5px; }
-    .info-grid { display: grid; grid-template-columns: 1fr 1fr; gap: 20px; margin: 15px 0; }
-    .info-item { background: #f8f9fa; padding: 10px; border-radius: 5px; }
-    .benefits-list { background: #f1f2f6; padding: 15px; border-radius: 8px; }
-    .footer { margin-top: 40px; padding-top: 20px; border-top: 1px solid #bdc3c7; font-size: 12px; color: #7f8c8d; }
-  </style>
-</head>
-<body>
-  <div class="header">
-    <h1>{{ fund.Name if fund else 'Private Health Fund' }}</h1>
-    <h2>Policy Schedule — {{ product.product_name or "Insurance Policy" }}</h2>
-    <p><strong>Extract Date:</strong> {{ product.extract_date or "Not specified" }}</p>
-  </div>
-
-  {% if user_data and user_data.personal_info %}
-  <div class="section">
-    <h3>Policyholder Information</h3>
-    <div class="info-grid">
-      <div class="info-item">
-        <strong>Full Name:</strong> {{ user_data.personal_info.full_name }}
-      </div>
-      <div class="info-item">
-        <strong>Date of Birth:</strong> {{ user_data.personal_info.dob }}
-      </div>
-      <div class="info-item">
-        <strong>Gender:</strong> {{ user_data.personal_info.gender }}
-      </div>
-      <div class="info-item">
-        <strong>Contact:</strong> {{ user_data.personal_info.email }}
-      </div>
-    </div>
-  </div>
-  {% endif %}
-
-  <div class="section">
-    <h3>Policy Details</h3>
-    <div class="info-grid">
-      <div class="info-item">
-        <strong>Product ID:</strong> {{ product.product_id }}
-      </div>
-      <div class="info-item">
-        <strong>Status:</strong> {{ product.open_closed }}
-      </div>
-      <div class="info-item">
-        <strong>Type:</strong> {{ product.product_type }}
-      </div>
-      <div class="info-item">
-        <strong>Sum Insured:</strong> ${{ "{:,.2f}".format(product.sum_insured) if product.sum_insured else "Not specified" }}
-      </div>
-    </div>
-  </div>
-
-  {% if product.benefits %}
-  <div class="section">
-    <h3>Benefits Coverage</h3>
-    <div class="benefits-list">
-      {% for benefit in product.benefits %}
-      <div style="margin: 10px 0; padding: 8px; background: white; border-radius: 4px;">
-        <strong>{{ benefit.code }}:</strong> {{ benefit.text }}<br>
-        <em>Coverage Limit: ${{ "{:,.2f}".format(benefit.amount) if benefit.amount else "Unlimited" }}</em>
-      </div>
-      {% endfor %}
-    </div>
-  </div>
-  {% endif %}
-
-  {% if user_data and user_data.health_lifestyle %}
-  <div class="section">
-    <h3>Health Information</h3>
-    <div class="info-grid">
-      <div class="info-item">
-        <strong>Smoker:</strong> {{ "Yes" if user_data.health_lifestyle.smoker else "No" }}
-      </div>
-      <div class="info-item">
-        <strong>Pre-existing Conditions:</strong> {{ ", ".join(user_data.health_lifestyle.pre_existing_conditions) if user_data.health_lifestyle.pre_existing_conditions else "None declared" }}
-      </div>
-    </div>
-  </div>
-  {% endif %}
-
-  <div class="footer">
-    <p><em>This document is auto-generated from insurance data. This summary is generated automatically and requires legal review.</em></p>
-    <p>Generated on: {{ timestamp }}</p>
-  </div>
-</body>
-</html>
-"""
+# Policy and report templates (backend/templates/<kind>/<name>/v<N>.html), compiled once
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates')
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(os.path.dirname(__file__), '.template_cache'))
+templates = TemplateRegistry(TEMPLATE_DIR, cache_dir=TEMPLATE_CACHE_DIR)
 
+# Warm WeasyPrint worker processes render policy PDFs off the request threads
+pdf_renderer = PDFRenderer(
+    max_workers=int(os.getenv("PDF_WORKERS", "0")) or None,
+    queue_size=int(os.getenv("PDF_QUEUE_SIZE", "8")),
+    queue_timeout=float(os.getenv("PDF_QUEUE_TIMEOUT_SECONDS", "30")),
+)
 
-# Helper functions for enhanced policy generation
-def generate_enhanced_policy_with_user_data(product_json, fund_json, user_data_json):
-    """Enhanced policy generation using both OpenAI and templates"""
-    if not client:
-        return "OpenAI client is not initialized. Check API key."
+# Generated policy PDFs, keyed by a hash of their inputs and template/model versions
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", os.path.join(os.path.dirname(__file__), 'document_store'))
+DOCUMENT_STORE_MAX_MB = float(os.getenv("DOCUMENT_STORE_MAX_MB", "512"))
+document_store = DocumentStore(DOCUMENT_STORE_DIR, max_bytes=int(DOCUMENT_STORE_MAX_MB * 1024 * 1024))
 
-    ENHANCED_SUMMARY_PROMPT = """
+# Products and funds ingested from PHOL XML feeds (see phol_store.py), resolved by code/ID
+PHOL_STORE_PATH = os.getenv("PHOL_STORE_PATH", os.path.join(os.path.dirname(__file__), 'phol_products.sqlite'))
+phol_store = PHOLStore(PHOL_STORE_PATH)
+
+# PHOL XSD compiled once per process; feeds are validated record by record across a process pool
+PHOL_SCHEMA_PATH = os.getenv("PHOL_SCHEMA_PATH", os.path.join(os.path.dirname(__file__), 'schemas', 'PHOLSchema-V3.1.xsd'))
+phol_validator = PHOLValidator(
+    PHOL_SCHEMA_PATH,
+    max_workers=int(os.getenv("PHOL_VALIDATION_WORKERS", "0")) or None,
+    batch_size=int(os.getenv("PHOL_VALIDATION_BATCH_SIZE", "200")),
+)
+
+
+# Helper functions for enhanced policy generation
+ENHANCED_SUMMARY_PROMPT = """
     You are an expert insurance policy drafter. Use the provided product, fund, and user data JSON
     to generate a comprehensive draft policy schedule with the following sections:
 
@@ -1118,6 +1533,9 @@ def generate_enhanced_policy_with_user_data(product_json, fund_json, user_data_j
     End with: "This summary is generated automatically and requires legal review."
     """
 
+
+def policy_draft_messages(product_json, fund_json, user_data_json):
+    """Chat messages for drafting a policy from product, fund and applicant data."""
     # Combine all data
     full_context = f"""
     Product Information: {json.dumps(product_json, indent=2)}
@@ -1126,26 +1544,59 @@ def generate_enhanced_policy_with_user_data(product_json, fund_json, user_data_j
 
     Applicant Data: {json.dumps(user_data_json, indent=2)}
     """
+    return [
+        {"role": "system", "content": ENHANCED_SUMMARY_PROMPT},
+        {"role": "user", "content": full_context}
+    ]
+
+
+def generate_enhanced_policy_with_user_data(product_json, fund_json, user_data_json):
+    """Enhanced policy generation using both OpenAI and templates"""
+    if not client:
+        return "OpenAI client is not initialized. Check API key."
 
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": ENHANCED_SUMMARY_PROMPT},
-                {"role": "user", "content": full_context}
-            ],
+        resp = llm_scheduler.chat(
+            priority="interactive",
+            label="policy_draft",
+            model=POLICY_MODEL,
+            messages=policy_draft_messages(product_json, fund_json, user_data_json),
             temperature=0.1
         )
         return resp.choices[0].message.content
+    except LLMQueueTimeout as e:
+        print(f"⏳ {e}")
+        return f"Error generating policy draft: the AI service is busy, please retry ({e})"
     except Exception as e:
         print(f"❌ OpenAI API error: {e}")
         return f"Error generating policy draft: {e}"
 
 
-def render_policy_html(product_json, fund_json=None, user_data_json=None):
-    """Render HTML policy using Jinja2 template"""
-    env = Environment(loader=BaseLoader())
-    template = env.from_string(ENHANCED_POLICY_TEMPLATE)
+def stream_policy_draft(product_json, fund_json, user_data_json):
+    """
+    Yield the policy draft as it is generated. The scheduler slot is held until the
+    stream is consumed (or the client disconnects and the generator is closed).
+    """
+    messages = policy_draft_messages(product_json, fund_json, user_data_json)
+    with llm_scheduler.slot("interactive", estimate_tokens(messages), label="policy_draft_stream") as call:
+        stream = client.chat.completions.create(
+            model=POLICY_MODEL,
+            messages=messages,
+            temperature=0.1,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                call["prompt_tokens"] = chunk.usage.prompt_tokens
+                call["completion_tokens"] = chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+def render_policy_html(product_json, fund_json=None, user_data_json=None, template_version=None):
+    """Render HTML policy using the product type's template (latest version unless given)"""
+    template = templates.get("policy", product_json.get("product_type"), template_version)
 
     return template.render(
         product=product_json,
@@ -1155,59 +1606,52 @@ def render_policy_html(product_json, fund_json=None, user_data_json=None):
     )
 
 
+def generate_pdf_from_draft(draft_text):
+    """Plain-text FPDF rendering of a draft, used when HTML rendering is unavailable or fails"""
+    return render_text_pdf(draft_text)
+
+
 def save_ai_draft_pdf_enhanced(draft_text, out_file="ai_draft_policy.pdf"):
     """Enhanced PDF generation with better formatting"""
     try:
         # Convert markdown-style text to HTML
         html_body = markdown.markdown(draft_text) if markdown else draft_text.replace('\n', '<br>')
 
-        html_template = f"""
-        <!doctype html>
-        <html>
-        <head>
-          <meta charset="utf-8"/>
-          <style>
-            body {{ font-family: 'Times New Roman', serif; margin: 40px; line-height: 1.6; color: #2c3e50; }}
-            h1 {{ color: #2c3e50; text-align: center; border-bottom: 3px solid #3498db; padding-bottom: 10px; }}
-            h2 {{ color: #34495e; margin-top: 25px; border-bottom: 1px solid #bdc3c7; padding-bottom: 5px; }}
-            h3 {{ color: #34495e; margin-top: 20px; }}
-            p {{ text-align: justify; margin: 10px 0; }}
-            .disclaimer {{ background: #f39c12; color: white; padding: 15px; border-radius: 5px; margin: 20px 0; text-align: center; font-weight: bold; }}
-            .section {{ margin: 20px 0; padding: 15px; border-left: 4px solid #3498db; background: #f8f9fa; }}
-          </style>
-        </head>
-        <body>
-          <h1>Draft Insurance Policy Document</h1>
-          <div class="disclaimer">AI-generated draft — requires legal review</div>
-          <div class="content">
-            {html_body}
-          </div>
-        </body>
-        </html>
-        """
-
-        # Use WeasyPrint if available, otherwise fall back to simple PDF
-        try:
-            from weasyprint import HTML
-            pdf_bytes = HTML(string=html_template).write_pdf()
-            return pdf_bytes
-        except ImportError:
-            # Fallback to FPDF
-            return generate_pdf_from_draft(draft_text)
+        html_template = templates.render("report", "ai_draft", html_body=html_body)
+
+        # Rendered by the worker pool (WeasyPrint, or FPDF there if WeasyPrint is missing)
+        return pdf_renderer.render(html_template, fallback_text=draft_text)
 
+    except PDFQueueFull:
+        raise
     except Exception as e:
         print(f"❌ PDF generation error: {e}")
         return generate_pdf_from_draft(draft_text)
 
 
-def enhanced_apra_compliance_check(policy_text):
-    """Enhanced APRA compliance check with detailed analysis"""
-    if not client:
-        return {"error": "OpenAI client is not initialized. Check API key."}
+def sse_event(event, data):
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events):
+    """Stream an iterable of sse_event() strings; proxies are asked not to buffer it."""
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
-    ENHANCED_COMPLIANCE_PROMPT = """
+def wants_refresh():
+    """True when the caller asked to bypass cached results (?refresh=1 or form field)."""
+    value = request.args.get('refresh') or request.form.get('refresh') or ''
+    return value.lower() in ('1', 'true', 'yes')
+
+
+COMPLIANCE_UNIT_PROMPT = """
     You are a senior APRA compliance analyst with expertise in Australian financial services regulation.
-    Analyze the provided insurance policy text against the APRA compliance requirements.
+    Analyze the provided insurance policy text against the APRA compliance requirements given.
 
     For each requirement, provide:
     1. A compliance status: "Compliant", "Partially Compliant", "Not Compliant", or "Not Applicable"
@@ -1218,11 +1662,10 @@ def enhanced_apra_compliance_check(policy_text):
 
     Your response must be valid JSON with the structure:
     {
-        "overall_compliance_score": <percentage>,
         "compliance_results": [
             {
                 "requirement_id": "string",
-                "requirement_text": "string", 
+                "requirement_text": "string",
                 "status": "string",
                 "evidence": "string",
                 "gaps_identified": ["string"],
@@ -1230,63 +1673,357 @@ def enhanced_apra_compliance_check(policy_text):
                 "risk_level": "string",
                 "notes": "string"
             }
-        ],
-        "summary": {
-            "total_requirements": <number>,
-            "compliant": <number>,
-            "partially_compliant": <number>,
-            "non_compliant": <number>,
-            "not_applicable": <number>,
-            "high_risk_items": <number>
-        }
+        ]
     }
+    Return exactly one entry per requirement, using the requirement's "id" as requirement_id.
     """
 
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": ENHANCED_COMPLIANCE_PROMPT},
-                {"role": "user", "content": f"""
-Policy Text:
+# Per-standard compliance units run concurrently; failed units are retried on their own
+COMPLIANCE_MAX_CONCURRENCY = int(os.getenv("COMPLIANCE_MAX_CONCURRENCY", "4"))
+COMPLIANCE_UNIT_RETRIES = int(os.getenv("COMPLIANCE_UNIT_RETRIES", "2"))
+
+# Policies longer than this are sent as retrieved passages per requirement, not in full
+RETRIEVAL_MIN_CHARS = int(os.getenv("RETRIEVAL_MIN_CHARS", "12000"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+
+# Automatable checklist items are pre-screened by local rules; only ambiguous ones go to the LLM
+COMPLIANCE_RULES_ENABLED = os.getenv("COMPLIANCE_RULES_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPILED_COMPLIANCE_RULES = compile_rules(APRA_COMPLIANCE_CHECKLIST)
+
+
+def call_compliance_llm(system_prompt, user_content, label="compliance_unit"):
+    """Single JSON-mode LLM call used by every compliance unit (batch priority)."""
+    resp = llm_scheduler.chat(
+        priority="batch",
+        label=label,
+        model=COMPLIANCE_MODEL,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ],
+        temperature=0.0
+    )
+    return json.loads(resp.choices[0].message.content)
+
+
+def compliance_units(checklist, skip_ids=()):
+    """Split the checklist into independent units, one per standard, leaving out skip_ids."""
+    units = []
+    for standard, requirements in checklist["standards"].items():
+        remaining = [req for req in requirements if req["id"] not in skip_ids]
+        if remaining:
+            units.append((standard, {"metadata": checklist["metadata"], "standards": {standard: remaining}}))
+    return units
+
+
+def evaluate_compliance_unit(policy_text, standard, unit_checklist, force_refresh=False, index=None):
+    """
+    Evaluate one standard (cached per unit). Raises on failure so the caller can retry.
+    With a passage index, only the top passages per requirement are sent instead of the full text.
+    """
+    scope = f"apra-unit:{standard}" + (f":rag{RETRIEVAL_TOP_K}" if index else "")
+    cache_key = make_cache_key(policy_text, unit_checklist, COMPLIANCE_MODEL, scope=scope)
+    if not force_refresh:
+        cached = compliance_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    if index is not None:
+        context, passages_used = requirement_context(index, unit_checklist["standards"][standard], k=RETRIEVAL_TOP_K)
+        print(f"🔎 {standard}: sending {passages_used} passages ({len(context)} chars of {len(policy_text)})")
+        policy_section = f"""Relevant Policy Passages (retrieved per requirement; cite passage labels like [P3] in evidence):
 ```
-{policy_text}
+{context}
+```"""
+    else:
+        policy_section = f"""Policy Text:
 ```
+{policy_text}
+```"""
+
+    result = call_compliance_llm(COMPLIANCE_UNIT_PROMPT, f"""
+{policy_section}
 
 APRA Compliance Checklist:
 ```json
-{json.dumps(APRA_COMPLIANCE_CHECKLIST, indent=2)}
+{json.dumps(unit_checklist, indent=2)}
 ```
-                """}
-            ],
-            temperature=0.0
-        )
+    """)
+    unit_results = result.get("compliance_results")
+    if not isinstance(unit_results, list):
+        raise ValueError(f"Malformed LLM response for {standard}: missing compliance_results")
+
+    for item in unit_results:
+        item.setdefault("standard", standard)
+        item.setdefault("assessed_by", "llm")
+    compliance_cache.put(cache_key, unit_results)
+    return unit_results
+
+
+def summarize_compliance_results(compliance_results):
+    """Summary counts and overall score computed from the merged per-requirement results."""
+    statuses = [str(item.get("status", "")).lower() for item in compliance_results]
+    summary = {
+        "total_requirements": len(compliance_results),
+        "compliant": statuses.count("compliant"),
+        "partially_compliant": statuses.count("partially compliant"),
+        "non_compliant": statuses.count("not compliant"),
+        "not_applicable": statuses.count("not applicable"),
+        "not_assessed": statuses.count("not_assessed"),
+        "high_risk_items": sum(1 for item in compliance_results if str(item.get("risk_level", "")).lower() == "high"),
+    }
+    # Requirements that could not be assessed are left out of the score, and the result is flagged partial
+    assessed = summary["total_requirements"] - summary["not_applicable"] - summary["not_assessed"]
+    summary["partial"] = summary["not_assessed"] > 0
+    score = 100 * (summary["compliant"] + 0.5 * summary["partially_compliant"]) / assessed if assessed else 0
+    return round(score, 1), summary
+
+
+def not_assessed_result(requirement, error=None):
+    """Placeholder for a requirement no rule or LLM result covers (e.g. its unit failed after retries)."""
+    reason = f"Compliance unit failed: {error}" if error else "The analysis returned no result for this requirement."
+    return {
+        "requirement_id": requirement["id"],
+        "requirement_text": requirement["requirement"],
+        "status": "not_assessed",
+        "evidence": "",
+        "gaps_identified": [],
+        "recommendations": ["Re-run the compliance check for this requirement."],
+        "risk_level": "Unknown",
+        "notes": f"Not assessed. {reason} Excluded from the overall compliance score.",
+        "assessed_by": "none",
+    }
 
-        result = json.loads(resp.choices[0].message.content)
 
+def enhanced_apra_compliance_check(policy_text, force_refresh=False, reuse=None):
+    """
+    Enhanced APRA compliance check with detailed analysis (cached per wording/checklist/model).
+    `reuse` maps requirement ids to earlier results that are still valid; those are not re-evaluated.
+    """
+    reuse = reuse or {}
+    cache_key = make_cache_key(policy_text, APRA_COMPLIANCE_CHECKLIST, COMPLIANCE_MODEL, scope="apra")
+    if not force_refresh and not reuse:
+        cached = compliance_cache.get(cache_key)
+        if cached is not None:
+            print("⚡ Compliance result served from cache")
+            cached["analysis_metadata"]["cache_hit"] = True
+            return cached
+
+    started = time.perf_counter()
+    rule_results, escalated = ({}, [])
+    if COMPLIANCE_RULES_ENABLED:
+        rule_results, escalated = prescreen(policy_text, APRA_COMPLIANCE_CHECKLIST, COMPILED_COMPLIANCE_RULES)
+        print(f"📏 Rules decided {len(rule_results)} requirement(s), escalated {len(escalated)} to the LLM")
+    units = compliance_units(APRA_COMPLIANCE_CHECKLIST, skip_ids=set(rule_results) | set(reuse))
+    # Cached, rule-decided and reused results need no LLM; only the remaining units do
+    if units and not client:
+        return {"error": "OpenAI client is not initialized. Check API key."}
+    # Long documents: build the local passage index once and share it across units
+    index = PassageIndex(policy_text) if len(policy_text) >= RETRIEVAL_MIN_CHARS else None
+    unit_results = {}
+    errors = {}
+    pending = units
+
+    # Run all units concurrently; only the units that failed are retried
+    for attempt in range(COMPLIANCE_UNIT_RETRIES + 1):
+        if not pending:
+            break
+        if attempt:
+            print(f"🔁 Retrying {len(pending)} failed compliance unit(s) (attempt {attempt + 1})")
+            time.sleep(2 ** (attempt - 1))
+
+        with ThreadPoolExecutor(max_workers=COMPLIANCE_MAX_CONCURRENCY) as pool:
+            futures = {
+                pool.submit(evaluate_compliance_unit, policy_text, standard, unit, force_refresh, index): (standard, unit)
+                for standard, unit in pending
+            }
+            failed = []
+            for future in as_completed(futures):
+                standard, unit = futures[future]
+                try:
+                    unit_results[standard] = future.result()
+                    errors.pop(standard, None)
+                except Exception as e:
+                    print(f"❌ Compliance unit '{standard}' failed: {e}")
+                    errors[standard] = str(e)
+                    failed.append((standard, unit))
+        pending = failed
+
+    if units and not unit_results:
+        return {
+            "error": f"Compliance analysis failed: {errors}",
+            "overall_compliance_score": 0,
+            "compliance_results": [],
+            "summary": {"error": True}
+        }
+
+    # Merge rule and LLM verdicts in checklist order
+    llm_results = {
+        item.get("requirement_id"): item for items in unit_results.values() for item in items
+    }
+    compliance_results = []
+    for standard, requirements in APRA_COMPLIANCE_CHECKLIST["standards"].items():
+        for requirement in requirements:
+            item = (rule_results.get(requirement["id"]) or llm_results.pop(requirement["id"], None)
+                    or reuse.get(requirement["id"]))
+            if item is None:
+                item = not_assessed_result(requirement, errors.get(standard))
+            compliance_results.append({**item, "standard": standard})
+    # Anything the LLM returned under an unexpected id is kept rather than dropped
+    compliance_results.extend(llm_results.values())
+    overall_score, summary = summarize_compliance_results(compliance_results)
+    result = {
+        "overall_compliance_score": overall_score,
+        "partial": summary["partial"],
+        "compliance_results": compliance_results,
+        "summary": summary,
         # Add timestamp and metadata
-        result["analysis_metadata"] = {
+        "analysis_metadata": {
             "timestamp": datetime.now().isoformat(),
             "checklist_version": APRA_COMPLIANCE_CHECKLIST["metadata"]["version"],
             "text_length": len(policy_text),
-            "analysis_model": "gpt-4o-mini"
+            "analysis_model": COMPLIANCE_MODEL,
+            "units_evaluated": len(unit_results),
+            "rule_decided": len(rule_results),
+            "reused_results": len([rid for rid in reuse if rid not in rule_results]),
+            "llm_escalated": escalated,
+            "retrieval": {"passages_indexed": len(index.passages), "top_k": RETRIEVAL_TOP_K} if index else None,
+            "failed_units": errors,
+            "not_assessed": [item["requirement_id"] for item in compliance_results if item.get("status") == "not_assessed"],
+            "elapsed_seconds": round(time.perf_counter() - started, 2)
         }
+    }
+
+    # Partial results are returned but never cached as a whole
+    if not errors and not reuse and not summary["partial"]:
+        compliance_cache.put(cache_key, result)
+    result["analysis_metadata"]["cache_hit"] = False
+    return result
+
 
+def incremental_compliance_check(sectioned_text, family, force_refresh=False):
+    """
+    Compliance check of a revised draft: only requirements whose cited sections
+    changed since the family's previous run are evaluated again.
+    `sectioned_text` keeps line breaks so headings can be found.
+    """
+    policy_text = re.sub(r'\s+', ' ', sectioned_text).strip()
+    sections = split_sections(sectioned_text)
+    checklist_id = checklist_fingerprint(APRA_COMPLIANCE_CHECKLIST)
+    previous = None if force_refresh else policy_revisions.latest(family, checklist_id, COMPLIANCE_MODEL)
+
+    changed, reuse = None, {}
+    if previous:
+        changed = changed_sections(previous["sections"], sections)
+        reuse = reusable_results(previous, changed)
+        print(f"🧩 {family}: {len(changed)}/{len(sections)} section(s) changed, reusing {len(reuse)} result(s)")
+
+    result = enhanced_apra_compliance_check(policy_text, force_refresh=force_refresh, reuse=reuse)
+    if "error" in result:
         return result
 
-    except Exception as e:
-        print(f"❌ APRA compliance check error: {e}")
-        return {
-            "error": f"Compliance analysis failed: {e}",
-            "overall_compliance_score": 0,
-            "compliance_results": [],
-            "summary": {"error": True}
-        }
+    # Evidence passage labels refer to the same passages the analysis used
+    passages = split_passages(policy_text) if len(policy_text) >= RETRIEVAL_MIN_CHARS else None
+    requirement_sections = {}
+    for item in result["compliance_results"]:
+        requirement_id = item.get("requirement_id")
+        if requirement_id in reuse and previous:
+            requirement_sections[requirement_id] = previous["requirement_sections"].get(requirement_id, [])
+        elif requirement_id:
+            requirement_sections[requirement_id] = cited_sections(item, sections, passages)
+
+    policy_revisions.save(family, checklist_id, COMPLIANCE_MODEL, sections,
+                          result["compliance_results"], requirement_sections)
+    result["analysis_metadata"]["incremental"] = {
+        "policy_family": family,
+        "previous_revision": datetime.fromtimestamp(previous["updated_at"]).isoformat() if previous else None,
+        "sections": len(sections),
+        "changed_sections": sorted(changed) if changed is not None else None,
+        "reevaluated": [item.get("requirement_id") for item in result["compliance_results"]
+                        if item.get("requirement_id") not in reuse],
+    }
+    return result
 
 
 # Add these new endpoints to your existing api.py (before the if __name__ == '__main__': block)
 
+def policy_request_data(data):
+    """
+    Product, fund and applicant data from a policy generation request, with defaults.
+    "product_id" / "fund_code" resolve against the PHOL store (LookupError if unknown).
+    """
+    if data.get("product_id"):
+        record = phol_store.get_product(data["product_id"])
+        if record is None:
+            raise LookupError(f"Unknown product_id '{data['product_id']}'")
+        data = {**data, "product": product_for_policy(record)}
+
+    fund_code = data.get("fund_code") or (data.get("product") or {}).get("fund_code")
+    if fund_code and "fund" not in data:
+        record = phol_store.get_fund(fund_code)
+        if record is None and data.get("fund_code"):
+            raise LookupError(f"Unknown fund_code '{fund_code}'")
+        if record is not None:
+            data = {**data, "fund": fund_for_policy(record)}
+
+    # Set default values for missing data
+    product_data = data.get("product", {
+        "product_id": "DEFAULT-001",
+        "product_name": "Standard Insurance Policy",
+        "extract_date": datetime.now().strftime("%Y-%m-%d"),
+        "open_closed": "Open",
+        "product_type": "General",
+        "sum_insured": 100000,
+        "benefits": []
+    })
+
+    fund_data = data.get("fund", {"Name": "Insurance Provider"})
+    user_data = data.get("user_data", {})
+    return product_data, fund_data, user_data
+
+
+def policy_pdf_filename():
+    return f'Enhanced_Policy_Draft_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+
+
+def policy_document_id(product_data, fund_data, user_data, template_version=None):
+    """Content address of a generated policy: request data plus everything else that shapes the PDF."""
+    template_name, version = templates.resolve("policy", product_data.get("product_type"), template_version)
+    _, report_version = templates.resolve("report", "ai_draft")
+    return document_key(
+        "policy", product_data, fund_data, user_data,
+        f"policy/{template_name}/v{version}", f"report/ai_draft/v{report_version}",
+        POLICY_MODEL, ENHANCED_SUMMARY_PROMPT,
+    )
+
+
+def send_document(document):
+    """Serve a stored document with ETag / If-None-Match and Range support."""
+    response = send_file(
+        document["path"],
+        mimetype=document["mimetype"],
+        as_attachment=True,
+        download_name=document["filename"],
+        conditional=True,
+        etag=document["doc_id"],
+        max_age=0
+    )
+    response.headers["X-Document-Id"] = document["doc_id"]
+    return response
+
+
+@app.route('/api/documents/<doc_id>', methods=['GET'])
+def get_document(doc_id):
+    """Re-download a generated document (conditional GET and byte ranges supported)"""
+    if not re.fullmatch(r"[0-9a-f]{64}", doc_id):
+        return jsonify({"error": "Invalid document id"}), 400
+    document = document_store.get(doc_id)
+    if document is None:
+        return jsonify({"error": "Document not found or evicted; generate it again"}), 404
+    return send_document(document)
+
+
 @app.route('/api/generate_enhanced_policy', methods=['POST'])
 def generate_enhanced_policy_endpoint():
     """Enhanced policy generation with better templates and AI integration"""
@@ -1301,26 +2038,25 @@ def generate_enhanced_policy_endpoint():
         if not data:
             return jsonify({"error": "No data provided"}), 400
 
-        # Set default values for missing data
-        product_data = data.get("product", {
-            "product_id": "DEFAULT-001",
-            "product_name": "Standard Insurance Policy",
-            "extract_date": datetime.now().strftime("%Y-%m-%d"),
-            "open_closed": "Open",
-            "product_type": "General",
-            "sum_insured": 100000,
-            "benefits": []
-        })
-
-        fund_data = data.get("fund", {"Name": "Insurance Provider"})
-        user_data = data.get("user_data", {})
+        try:
+            product_data, fund_data, user_data = policy_request_data(data)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        template_version = data.get("template_version")
+
+        # Identical inputs are served from the document store (?refresh=1 regenerates)
+        doc_id = policy_document_id(product_data, fund_data, user_data, template_version)
+        document = None if wants_refresh() else document_store.get(doc_id)
+        if document:
+            print(f"⚡ Policy document {doc_id[:12]} served from the document store")
+            return send_document(document)
 
         # Generate both AI content and HTML template
         print("🤖 Generating AI policy content...")
         ai_draft = generate_enhanced_policy_with_user_data(product_data, fund_data, user_data)
 
         print("🎨 Rendering HTML template...")
-        html_content = render_policy_html(product_data, fund_data, user_data)
+        html_content = render_policy_html(product_data, fund_data, user_data, template_version)
 
         # Combine AI content with template
         combined_content = f"{ai_draft}\n\n--- POLICY SCHEDULE ---\n\n{html_content}"
@@ -1329,20 +2065,87 @@ def generate_enhanced_policy_endpoint():
         print("📄 Converting to PDF...")
         pdf_bytes = save_ai_draft_pdf_enhanced(combined_content)
 
+        # Drafts where the LLM call failed are returned but never stored
+        if not ai_draft.startswith(("Error generating policy draft", "OpenAI client is not initialized")):
+            return send_document(document_store.put(doc_id, pdf_bytes, policy_pdf_filename()))
+
         # Return PDF
         from io import BytesIO
         return send_file(
             BytesIO(pdf_bytes),
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f'Enhanced_Policy_Draft_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
+            download_name=policy_pdf_filename()
         )
 
+    except PDFQueueFull as e:
+        print(f"⏳ {e}")
+        return jsonify({"error": "PDF rendering is busy, please retry shortly."}), 503
     except Exception as e:
         print(f"❌ Error in enhanced policy generation: {e}\n{traceback.format_exc()}")
         return jsonify({"error": f"Policy generation failed: {e}"}), 500
 
 
+@app.route('/api/generate_enhanced_policy/stream', methods=['POST'])
+def generate_enhanced_policy_stream():
+    """
+    Server-sent-event variant of /api/generate_enhanced_policy: streams draft tokens
+    as they arrive, then the rendered schedule, then a download URL for the stored PDF.
+    """
+    print("📄 Received request for streamed policy generation.")
+    if not client:
+        return jsonify({"error": "AI client not configured on the server."}), 500
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    try:
+        product_data, fund_data, user_data = policy_request_data(data)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    template_version = data.get("template_version")
+    force_refresh = wants_refresh()
+
+    def events():
+        started = time.perf_counter()
+        yield sse_event("accepted", {"stages": ["draft", "schedule", "pdf"]})
+        try:
+            doc_id = policy_document_id(product_data, fund_data, user_data, template_version)
+            document = None if force_refresh else document_store.get(doc_id)
+            if document is None:
+                document = yield from generate_policy_document_events(doc_id, started)
+            else:
+                yield sse_event("cached", {"document_id": doc_id})
+            yield sse_event("pdf_ready", {
+                "document_id": document["doc_id"],
+                "filename": document["filename"],
+                "size_bytes": document["size"],
+                "url": f"/api/documents/{document['doc_id']}",
+            })
+            yield sse_event("done", {"elapsed_seconds": round(time.perf_counter() - started, 2)})
+        except Exception as e:
+            print(f"❌ Error in streamed policy generation: {e}\n{traceback.format_exc()}")
+            yield sse_event("error", {"error": f"Policy generation failed: {e}"})
+
+    def generate_policy_document_events(doc_id, started):
+        """Draft, render and store the document, yielding progress events; returns the stored document."""
+        parts = []
+        for token in stream_policy_draft(product_data, fund_data, user_data):
+            parts.append(token)
+            yield sse_event("token", {"text": token})
+        ai_draft = "".join(parts)
+        yield sse_event("draft_complete", {"characters": len(ai_draft),
+                                           "elapsed_seconds": round(time.perf_counter() - started, 2)})
+
+        html_content = render_policy_html(product_data, fund_data, user_data, template_version)
+        yield sse_event("schedule_rendered", {"html": html_content})
+
+        pdf_bytes = save_ai_draft_pdf_enhanced(f"{ai_draft}\n\n--- POLICY SCHEDULE ---\n\n{html_content}")
+        return document_store.put(doc_id, pdf_bytes, policy_pdf_filename())
+
+    return sse_response(events())
+
+
 @app.route('/api/enhanced_compliance_check', methods=['POST'])
 def enhanced_compliance_check_endpoint():
     """Enhanced APRA compliance checking endpoint"""
@@ -1358,17 +2161,25 @@ def enhanced_compliance_check_endpoint():
         return jsonify({"error": "No file selected"}), 400
 
     try:
-        # Extract text from PDF
+        # Extract text from PDF (line breaks kept for section detection)
         print("📄 Extracting text from PDF...")
-        policy_text = extract_text_from_pdf_stream(file.stream)
+        sectioned_text = extract_text_from_pdf(file.read(), keep_lines=True)
+        policy_text = re.sub(r'\s+', ' ', sectioned_text).strip()
 
         if not policy_text or len(policy_text) < 50:
             return jsonify({"error": "Could not extract sufficient text from the PDF."}), 400
 
         print(f"📋 Analyzing {len(policy_text)} characters of policy text...")
 
-        # Run enhanced compliance check
-        results = enhanced_apra_compliance_check(policy_text)
+        # Revised drafts of a policy family only re-check what changed (?incremental=1 or policy_family)
+        family = request.form.get('policy_family') or request.args.get('policy_family')
+        incremental = (request.form.get('incremental') or request.args.get('incremental') or '').lower()
+        if family or incremental in ('1', 'true', 'yes'):
+            family = family or derive_family(file.filename)
+            results = incremental_compliance_check(sectioned_text, family, force_refresh=wants_refresh())
+        else:
+            # Run enhanced compliance check (?refresh=1 bypasses the cache)
+            results = enhanced_apra_compliance_check(policy_text, force_refresh=wants_refresh())
 
         if "error" in results:
             return jsonify(results), 500
@@ -1381,6 +2192,76 @@ def enhanced_compliance_check_endpoint():
         return jsonify({"error": f"Compliance check failed: {e}"}), 500
 
 
+@app.route('/api/phol/ingest', methods=['POST'])
+def ingest_phol_feed():
+    """Ingest an uploaded PHOL Products/Funds XML feed (?prune=1 drops products no longer listed)"""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part in the request"}), 400
+    file = request.files['file']
+    prune = (request.args.get('prune') or request.form.get('prune') or '').lower() in ('1', 'true', 'yes')
+    try:
+        started = time.perf_counter()
+        stats = phol_store.ingest(file.stream, prune=prune)
+        stats["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+        print(f"📦 Ingested PHOL feed {file.filename}: {stats}")
+        return jsonify({"ingest": stats, "store": phol_store.stats()})
+    except ET.ParseError as e:
+        return jsonify({"error": f"Invalid XML: {e}"}), 400
+
+
+@app.route('/api/phol/validate', methods=['POST'])
+def validate_phol_feed():
+    """
+    Validate an uploaded PHOL feed against the XSD, reporting every invalid record.
+    ?ingest=1 ingests the feed afterwards if all records are valid.
+    """
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part in the request"}), 400
+    file = request.files['file']
+    try:
+        report = phol_validator.validate(file.stream)
+    except SchemaUnavailable as e:
+        print(f"❌ {e}")
+        return jsonify({"error": str(e)}), 503
+    print(f"📐 Validated {file.filename}: {report['records']} records, "
+          f"{report['invalid_records']} invalid in {report['elapsed_seconds']}s")
+
+    if (request.args.get('ingest') or request.form.get('ingest') or '').lower() in ('1', 'true', 'yes'):
+        if report["valid"]:
+            file.stream.seek(0)
+            report["ingest"] = phol_store.ingest(file.stream)
+        else:
+            report["ingest"] = None
+    return jsonify(report), 200 if report["valid"] else 422
+
+
+@app.route('/api/products', methods=['GET'])
+def list_products():
+    """Search ingested PHOL products by fund_code, product_type and status"""
+    limit = min(int(request.args.get('limit', 100)), 1000)
+    return jsonify(phol_store.search_products(
+        fund_code=request.args.get('fund_code'),
+        product_type=request.args.get('product_type'),
+        status=request.args.get('status'),
+        limit=limit
+    ))
+
+
+@app.route('/api/products/<product_id>', methods=['GET'])
+def get_product(product_id):
+    """One ingested product (by ProductCode or ProductID), raw and as policy product JSON"""
+    record = phol_store.get_product(product_id)
+    if record is None:
+        return jsonify({"error": f"Unknown product_id '{product_id}'"}), 404
+    return jsonify({"product": product_for_policy(record), "phol": record})
+
+
+@app.route('/api/templates', methods=['GET'])
+def list_templates():
+    """Available policy/report templates and their versions"""
+    return jsonify(templates.catalog())
+
+
 @app.route('/api/get_compliance_checklist', methods=['GET'])
 def get_compliance_checklist():
     """Get the APRA compliance checklist for frontend display"""
@@ -1398,82 +2279,116 @@ def get_compliance_checklist():
         return jsonify({"error": "Failed to retrieve compliance checklist"}), 500
 
 
-@app.route('/api/enhanced_assess', methods=['POST'])
-def enhanced_assess_application():
-    """Enhanced assessment combining ML prediction, risk analysis, and compliance"""
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part in the request"}), 400
-
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
-
-    try:
-        print(f"🔄 Processing enhanced assessment for: {file.filename}")
-        file_content = file.read()
-
-        if len(file_content) == 0:
-            return jsonify({"error": "Uploaded file is empty"}), 400
+def enhanced_assessment_stages(file_content, force_refresh=False, ml_probability=None, ml_scoring=None):
+    """
+    Run the enhanced assessment, yielding (stage, payload) as each part completes.
+    External lookups and the compliance check run concurrently; the last stage is
+    ("result", full response).
+    """
+    # Extract text
+    full_text = extract_text_from_pdf(file_content)
+    yield "extraction", {"text_length": len(full_text)}
+
+    # Parse location
+    city = parse_city_from_text(full_text)
+    yield "location", {"city": city or "Not specified"}
+
+    # Get external risk factors (and the compliance check if OpenAI is available) in parallel
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = {pool.submit(finance_news): "financial_alerts"}
+        if city:
+            futures[pool.submit(get_location_specific_weather, city)] = "weather"
+            futures[pool.submit(get_location_specific_hazard_news, city)] = "hazard_alerts"
+        if client:
+            print("📋 Running compliance analysis...")
+            futures[pool.submit(enhanced_apra_compliance_check, full_text, force_refresh)] = "compliance"
 
-        # Extract text
-        full_text = extract_text_from_pdf(file_content)
+        parts = {"weather": "No location specified", "hazard_alerts": [], "financial_alerts": [], "compliance": None}
+        for future in as_completed(futures):
+            stage = futures[future]
+            try:
+                parts[stage] = future.result()
+            except Exception as e:
+                if stage != "compliance":
+                    raise
+                print(f"⚠️ Compliance check failed: {e}")
+            yield stage, parts[stage]
+
+    weather_details = parts["weather"]
+    hazard_news = parts["hazard_alerts"]
+    financial_news_alerts = parts["financial_alerts"]
+    compliance_results = parts["compliance"]
+
+    # Blend external signals (and the applicant's ML probability if provided) into one score
+    risk = assessment_risk(hazard_news, financial_news_alerts, weather_details, ml_probability)
+
+    response = {
+        "enhanced_assessment": True,
+        "risk_score": risk["score"],
+        "risk_level": f"{risk['level']} Risk",
+        "risk_components": risk["components"],
+        "ml_scoring": ml_scoring or {"status": "not_provided"},
+        "location_found": city or "Not specified",
+        "weather_details": weather_details,
+        "hazard_alerts": hazard_news,
+        "financial_alerts": financial_news_alerts,
+        "alert_count": len(hazard_news),
+        "financial_alert_count": len(financial_news_alerts),
+        "total_alert_count": len(hazard_news) + len(financial_news_alerts),
+        "text_length": len(full_text),
+        "processing_status": "success",
+        "timestamp": datetime.now().isoformat(),
+
+        # Enhanced features
+        "compliance_analysis": compliance_results,
+        "has_compliance_data": compliance_results is not None and "error" not in compliance_results,
+        "ai_features_available": client is not None,
+
+        # Metadata for frontend
+        "enhancement_features": {
+            "compliance_checking": True,
+            "enhanced_templates": True,
+            "detailed_analysis": True,
+            "apra_standards": True
+        }
+    }
 
-        # Parse location
-        city = parse_city_from_text(full_text)
+    print(f"✅ Enhanced assessment complete for {city}: Risk Score {risk['score']}")
+    yield "result", response
 
-        # Get external risk factors
-        weather_details = get_location_specific_weather(city) if city else "No location specified"
-        hazard_news = get_location_specific_hazard_news(city) if city else []
-        financial_news_alerts = finance_news()
 
-        # Calculate base risk score
-        base_score = 65
-        hazard_adjustment = min(len(hazard_news) * 5, 20)
-        financial_adjustment = min(len(financial_news_alerts) * 2, 10)
-        external_risk_score = base_score + hazard_adjustment + financial_adjustment
+def read_assessment_upload():
+    """(file bytes, None) for the uploaded PDF, or (None, error response)."""
+    if 'file' not in request.files:
+        return None, (jsonify({"error": "No file part in the request"}), 400)
 
-        # Run compliance check if OpenAI is available
-        compliance_results = None
-        if client:
-            try:
-                print("📋 Running compliance analysis...")
-                compliance_results = enhanced_apra_compliance_check(full_text)
-            except Exception as e:
-                print(f"⚠️ Compliance check failed: {e}")
+    file = request.files['file']
+    if file.filename == '':
+        return None, (jsonify({"error": "No file selected"}), 400)
 
-        # Determine final risk level
-        risk_level = "High Risk" if external_risk_score > 80 else "Medium Risk" if external_risk_score > 60 else "Low Risk"
+    print(f"🔄 Processing enhanced assessment for: {file.filename}")
+    file_content = file.read()
 
-        response = {
-            "enhanced_assessment": True,
-            "risk_score": external_risk_score,
-            "risk_level": risk_level,
-            "location_found": city or "Not specified",
-            "weather_details": weather_details,
-            "hazard_alerts": hazard_news,
-            "financial_alerts": financial_news_alerts,
-            "alert_count": len(hazard_news),
-            "financial_alert_count": len(financial_news_alerts),
-            "total_alert_count": len(hazard_news) + len(financial_news_alerts),
-            "text_length": len(full_text),
-            "processing_status": "success",
-            "timestamp": datetime.now().isoformat(),
+    if len(file_content) == 0:
+        return None, (jsonify({"error": "Uploaded file is empty"}), 400)
+    return file_content, None
 
-            # Enhanced features
-            "compliance_analysis": compliance_results,
-            "has_compliance_data": compliance_results is not None and "error" not in compliance_results,
-            "ai_features_available": client is not None,
-
-            # Metadata for frontend
-            "enhancement_features": {
-                "compliance_checking": True,
-                "enhanced_templates": True,
-                "detailed_analysis": True,
-                "apra_standards": True
-            }
-        }
 
-        print(f"✅ Enhanced assessment complete for {city}: Risk Score {external_risk_score}")
+@app.route('/api/enhanced_assess', methods=['POST'])
+def enhanced_assess_application():
+    """Enhanced assessment combining ML prediction, risk analysis, and compliance"""
+    try:
+        file_content, error_response = read_assessment_upload()
+        if error_response:
+            return error_response
+
+        response = None
+        ml_probability, ml_scoring = applicant_ml_probability()
+        stages = enhanced_assessment_stages(file_content, force_refresh=wants_refresh(),
+                                            ml_probability=ml_probability, ml_scoring=ml_scoring)
+        for stage, payload in stages:
+            if stage == "result":
+                response = payload
         return jsonify(response)
 
     except Exception as e:
@@ -1488,10 +2403,45 @@ def enhanced_assess_application():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+
+@app.route('/api/enhanced_assess/stream', methods=['POST'])
+def enhanced_assess_stream():
+    """
+    Server-sent-event variant of /api/enhanced_assess: one event per completed stage
+    (extraction, location, weather, hazard_alerts, financial_alerts, compliance), then "result".
+    """
+    file_content, error_response = read_assessment_upload()
+    if error_response:
+        return error_response
+    force_refresh = wants_refresh()
+    ml_probability, ml_scoring = applicant_ml_probability()
+
+    def events():
+        yield sse_event("accepted", {"bytes": len(file_content)})
+        try:
+            stages = enhanced_assessment_stages(file_content, force_refresh=force_refresh,
+                                                ml_probability=ml_probability, ml_scoring=ml_scoring)
+            for stage, payload in stages:
+                yield sse_event(stage, payload)
+        except Exception as e:
+            print(f"❌ Streamed assessment failed: {e}\n{traceback.format_exc()}")
+            yield sse_event("error", {
+                "error": f"Enhanced assessment failed: {e}",
+                "processing_status": "failed",
+                "timestamp": datetime.now().isoformat()
+            })
+
+    return sse_response(events())
+
 if __name__ == '__main__':
     check_api_keys_on_startup()  # Run the API key check
     print("🚀 Starting Flask application...")
     print(f"   - PDF Assessment Endpoint: /api/assess [POST]")
     print(f"   - ML Prediction Endpoint: /api/predict_ml [POST]")
+    print(f"   - ML Explanation Endpoint: /api/explain_ml [POST]")
+    print(f"   - Portfolio Re-scoring Endpoint: /api/portfolio/rescore [POST]")
+    print(f"   - Scenario Testing Endpoint: /api/scenarios/run [POST]")
+    print(f"   - Geo Risk Endpoints: /api/geo/<state|city|cell>, /api/geo/tiles/<z>/<x>/<y> [GET]")
+    print(f"   - Streaming (SSE) Endpoints: /api/generate_enhanced_policy/stream, /api/enhanced_assess/stream [POST]")
     print(f"   - Debug Endpoints available at /api/debug/*")
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,85 @@
+# compliance_cache.py
+# Persistent cache for LLM compliance analyses.
+#
+# Results are keyed by a hash of the normalized policy text, the checklist
+# version (plus a hash of its content, so an edited checklist never serves stale
+# results even if the version was not bumped) and the model name.
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+
+def normalize_policy_text(text):
+    """Collapse whitespace so re-extracted copies of the same wording hash identically."""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def checklist_fingerprint(checklist):
+    content = json.dumps(checklist, sort_keys=True).encode()
+    return f"{checklist['metadata']['version']}:{hashlib.sha256(content).hexdigest()[:12]}"
+
+
+def make_cache_key(policy_text, checklist, model_name, scope=""):
+    """Cache key for one analysis. `scope` separates different kinds of analyses."""
+    text_hash = hashlib.sha256(normalize_policy_text(policy_text).encode()).hexdigest()
+    return f"{scope}|{text_hash}|{checklist_fingerprint(checklist)}|{model_name}"
+
+
+class ComplianceCache:
+    """SQLite-backed result cache with expiry. Safe to share between request threads."""
+
+    def __init__(self, path, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS compliance_results (
+                cache_key TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                result TEXT NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, key):
+        """Cached result, or None if missing or older than the TTL."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT created_at, result FROM compliance_results WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        created_at, result = row
+        if self.ttl_seconds and time.time() - created_at > self.ttl_seconds:
+            return None
+        return json.loads(result)
+
+    def put(self, key, result):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO compliance_results (cache_key, created_at, result) VALUES (?, ?, ?)",
+                (key, time.time(), json.dumps(result)),
+            )
+            self.conn.commit()
+
+    def purge_expired(self):
+        if not self.ttl_seconds:
+            return 0
+        with self.lock:
+            cursor = self.conn.execute(
+                "DELETE FROM compliance_results WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            )
+            self.conn.commit()
+        return cursor.rowcount
+
+    def stats(self):
+        with self.lock:
+            count, oldest = self.conn.execute(
+                "SELECT COUNT(*), MIN(created_at) FROM compliance_results"
+            ).fetchone()
+        return {"entries": count, "oldest_entry": oldest, "ttl_seconds": self.ttl_seconds}
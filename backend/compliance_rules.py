@@ -0,0 +1,148 @@
+# compliance_rules.py
+# Deterministic pre-screen for automatable APRA checklist items.
+#
+# Each automatable requirement is checked against compiled phrase patterns, one
+# pattern group per evidence hint. Only positive evidence is decided locally
+# (every hint evidenced, or most evidenced), with the matching sentences quoted.
+# No match at all is escalated like anything ambiguous: the policy may cover the
+# requirement in different words, so only the LLM may mark it Not Compliant.
+
+import re
+
+from passage_index import split_sentences, tokenize
+
+# Explicit patterns per requirement id: {evidence hint: [regex, ...]}.
+# A hint counts as evidenced when any of its patterns matches a sentence.
+RULES = {
+    "CPS234.05": {
+        "Control library mapped to assets (e.g., CIS/NIST)": [
+            r"\b(control (library|framework|set)s?)\b",
+            r"\b(CIS|NIST|ISO\s?27001)\b",
+        ],
+        "Risk assessments per asset/service": [
+            r"\b(information security|cyber|security) risk assessments?\b",
+            r"\brisk assess\w* (of|for|per) (each |all )?(information )?(assets?|services?|systems?)\b",
+        ],
+        "Compensating controls documentation": [
+            r"\bcompensating controls?\b",
+        ],
+    },
+    "CPS234.08": {
+        "Security clauses in contracts": [
+            r"\b(contracts?|agreements?) (with|for) (third[- ]part(y|ies)|service providers?|suppliers?|vendors?)\b.{0,120}\b(security|confidential\w*)\b",
+            r"\b(security|confidentiality|data protection) (clauses?|obligations?|requirements?)\b",
+        ],
+        "TPRM assessments/SOC2/ISO certificates": [
+            r"\b(third[- ]party risk|TPRM|vendor risk|supplier risk)\b",
+            r"\b(SOC ?2|ISO ?27001|ISAE ?3402)\b",
+        ],
+        "Right-to-audit evidence": [
+            r"\bright(s)? to audit\b",
+            r"\baudit rights?\b",
+        ],
+    },
+    "CPS230.02": {
+        "List of critical operations": [
+            r"\bcritical (business )?operations?\b",
+        ],
+        "Impact tolerance statements with metrics": [
+            r"\b(impact|outage) tolerances?\b",
+            r"\bmaximum (tolerable|acceptable) (outage|downtime|disruption)\b",
+        ],
+        "Dependency maps (people/tech/third-parties)": [
+            r"\b(dependency|dependencies) (map|mapping|register)\w*\b",
+            r"\bmaterial service providers?\b",
+        ],
+    },
+}
+
+NEGATION_RE = re.compile(r"\b(not|no|never|without|excludes?|excluded|exclusion)\b", re.IGNORECASE)
+PARTIAL_THRESHOLD = 0.5  # share of evidenced hints at or above which the item is "Partially Compliant"
+MAX_EVIDENCE_CHARS = 300
+
+
+def _hint_patterns(hint):
+    """Fallback for automatable items without explicit rules: all significant hint terms in one sentence."""
+    terms = [t for t in tokenize(hint) if len(t) > 2]
+    if not terms:
+        return []
+    lookaheads = "".join(rf"(?=.*\b{re.escape(term)}\w*)" for term in terms)
+    return [rf"^{lookaheads}"]
+
+
+def compile_rules(checklist):
+    """Compile patterns for every automatable requirement: {requirement id: [(hint, [regex])]}."""
+    compiled = {}
+    for requirements in checklist["standards"].values():
+        for requirement in requirements:
+            if not requirement.get("automatable"):
+                continue
+            explicit = RULES.get(requirement["id"], {})
+            compiled[requirement["id"]] = [
+                (hint, [re.compile(p, re.IGNORECASE) for p in explicit.get(hint) or _hint_patterns(hint)])
+                for hint in requirement.get("evidence_hints", [])
+            ]
+    return compiled
+
+
+def evaluate_requirement(requirement, hint_rules, sentences):
+    """
+    Rule verdict for one requirement in the compliance_results schema,
+    or None when the outcome is ambiguous and the LLM should decide.
+    """
+    evidenced, missing, quotes = [], [], []
+    for hint, patterns in hint_rules:
+        match = next((s for s in sentences if any(p.search(s) for p in patterns)), None)
+        if match is None:
+            missing.append(hint)
+            continue
+        if NEGATION_RE.search(match):
+            # "We do not maintain a right to audit..." - leave it to the LLM
+            return None
+        evidenced.append(hint)
+        quotes.append(f'"{match[:MAX_EVIDENCE_CHARS]}"')
+
+    if not hint_rules or not evidenced:
+        # No phrase matched: absence of our wording is not evidence of non-compliance
+        return None
+    coverage = len(evidenced) / len(hint_rules)
+    if coverage == 1:
+        status, risk_level = "Compliant", "Low"
+    elif coverage >= PARTIAL_THRESHOLD:
+        status, risk_level = "Partially Compliant", "Medium"
+    else:
+        return None
+
+    return {
+        "requirement_id": requirement["id"],
+        "requirement_text": requirement["requirement"],
+        "status": status,
+        "evidence": " ".join(quotes),
+        "gaps_identified": [f"No evidence of: {hint}" for hint in missing],
+        "recommendations": [f"Add or reference: {hint}" for hint in missing],
+        "risk_level": risk_level,
+        "notes": f"Evaluated by deterministic rules ({len(evidenced)}/{len(hint_rules)} evidence hints matched).",
+        "assessed_by": "rules",
+    }
+
+
+def prescreen(policy_text, checklist, compiled=None):
+    """
+    Run the rule engine over every automatable requirement.
+    Returns ({requirement id: result} decided locally, [ids escalated to the LLM]).
+    """
+    compiled = compiled if compiled is not None else compile_rules(checklist)
+    sentences = split_sentences(policy_text)
+    decided, escalated = {}, []
+
+    for requirements in checklist["standards"].values():
+        for requirement in requirements:
+            hint_rules = compiled.get(requirement["id"])
+            if hint_rules is None:
+                continue
+            result = evaluate_requirement(requirement, hint_rules, sentences)
+            if result is None:
+                escalated.append(requirement["id"])
+            else:
+                decided[requirement["id"]] = result
+    return decided, escalated
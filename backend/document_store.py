@@ -0,0 +1,112 @@
+# document_store.py
+# Content-addressed store for generated policy documents.
+#
+# A document's id is a hash of everything that determines its content (the
+# canonical request JSON, template and model versions), so an identical request
+# maps to the same file on disk. Files are written atomically and the store is
+# kept under a size limit by evicting the least recently used documents.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def document_key(*parts):
+    """Canonical hash of JSON-serialisable inputs (key order and whitespace do not matter)."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class DocumentStore:
+    """Files under `root`, indexed in SQLite for lookup and LRU eviction."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                mimetype TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def path(self, doc_id):
+        return os.path.join(self.root, doc_id[:2], doc_id)
+
+    def get(self, doc_id):
+        """Metadata (with "path") of a stored document, or None. Marks it as recently used."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT filename, mimetype, size, created_at FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(self.path(doc_id)):
+                # File removed behind our back; forget it so it gets regenerated
+                self.conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE documents SET last_access = ? WHERE doc_id = ?", (time.time(), doc_id))
+            self.conn.commit()
+        filename, mimetype, size, created_at = row
+        return {"doc_id": doc_id, "filename": filename, "mimetype": mimetype, "size": size,
+                "created_at": created_at, "path": self.path(doc_id)}
+
+    def put(self, doc_id, data, filename, mimetype="application/pdf"):
+        path = self.path(doc_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_id, filename, mimetype, len(data), now, now),
+            )
+            self.conn.commit()
+        self.evict(keep=doc_id)
+        return self.get(doc_id)
+
+    def evict(self, keep=None):
+        """Remove least recently used documents (except `keep`) until the store fits in max_bytes."""
+        removed = 0
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            for doc_id, size in self.conn.execute(
+                "SELECT doc_id, size FROM documents ORDER BY last_access"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                if doc_id == keep:
+                    continue
+                try:
+                    os.remove(self.path(doc_id))
+                except FileNotFoundError:
+                    pass
+                self.conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                total -= size
+                removed += 1
+            self.conn.commit()
+        return removed
+
+    def stats(self):
+        with self.lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+        return {"documents": count, "bytes": total, "max_bytes": self.max_bytes}
@@ -0,0 +1,320 @@
+# geo_aggregates.py
+# Per-state, per-city and per-grid-cell risk aggregates for the risk map.
+#
+# Every location bucket keeps running totals (policies, premium, sum insured,
+# ML score sum/count, current alerts). ML scores are the book's stored Risk Score
+# (see portfolio.py); sum insured totals are None when the book has no such column. Loading the book fills the buckets with
+# one bincount per field; afterwards policy upserts/removals and alert changes
+# only add or subtract their own contribution. Grid cells are slippy-map tiles at
+# a fixed zoom and are indexed under every parent tile, so a tile request is a
+# dict lookup. Serialized layers/tiles are cached until the next change, so map
+# loads read prepared bytes and clients revalidate with the version ETag.
+
+import json
+import math
+import threading
+import time
+
+import numpy as np
+
+from portfolio import CAPITAL_CITIES, CITY_STATE, normalize_city, normalize_state
+
+LEVELS = ("state", "city", "cell")
+FIELDS = ("policies", "premium", "sum_insured", "ml_score_sum", "ml_scored", "alerts")
+POLICIES, PREMIUM, SUM_INSURED, ML_SUM, ML_SCORED, ALERTS = range(len(FIELDS))
+DEFAULT_GRID_ZOOM = 8  # cells of ~1.4 degrees of longitude
+
+CITY_COORDS = {
+    "sydney": (-33.8688, 151.2093), "melbourne": (-37.8136, 144.9631), "brisbane": (-27.4698, 153.0251),
+    "perth": (-31.9505, 115.8605), "adelaide": (-34.9285, 138.6007), "hobart": (-42.8821, 147.3272),
+    "canberra": (-35.2809, 149.1300), "darwin": (-12.4634, 130.8456),
+    "newcastle": (-32.9283, 151.7817), "wollongong": (-34.4278, 150.8931), "central coast": (-33.4245, 151.3419),
+    "wagga wagga": (-35.1082, 147.3598), "geelong": (-38.1499, 144.3617), "ballarat": (-37.5622, 143.8503),
+    "bendigo": (-36.7570, 144.2794), "gold coast": (-28.0167, 153.4000), "sunshine coast": (-26.6500, 153.0667),
+    "townsville": (-19.2590, 146.8169), "cairns": (-16.9186, 145.7781), "toowoomba": (-27.5598, 151.9507),
+    "fremantle": (-32.0569, 115.7439), "bunbury": (-33.3271, 115.6414), "geraldton": (-28.7774, 114.6150),
+    "mount gambier": (-37.8284, 140.7804), "whyalla": (-33.0333, 137.5667), "launceston": (-41.4332, 147.1441),
+    "devonport": (-41.1800, 146.3500), "queanbeyan": (-35.3533, 149.2342), "alice springs": (-23.6980, 133.8807),
+    "katherine": (-14.4652, 132.2635),
+}
+
+
+def tile_of(lat, lon, zoom):
+    """Slippy-map (x, y) of the tile containing lat/lon at `zoom`."""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, zoom):
+    """(west, south, east, north) of a tile in degrees."""
+    n = 2 ** zoom
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def location_coords(state, city=None, lat=None, lon=None):
+    """Explicit coordinates, else the city's, else the state capital's (None if unknown)."""
+    if lat is not None and lon is not None:
+        return float(lat), float(lon)
+    if city in CITY_COORDS:
+        return CITY_COORDS[city]
+    capital = CAPITAL_CITIES.get(state)
+    return CITY_COORDS.get(capital.lower()) if capital else None
+
+
+class GeoAggregates:
+    """Incrementally maintained location buckets plus cached GeoJSON/tile payloads."""
+
+    def __init__(self, engine, grid_zoom=DEFAULT_GRID_ZOOM):
+        self.engine = engine
+        self.grid_zoom = grid_zoom
+        self.lock = threading.Lock()
+        self.instance = f"{time.time():.0f}"
+        self.version = 0
+        self.loaded = False
+        self.has_sum_insured = False
+        self._reset()
+
+    def _reset(self):
+        self.buckets = {level: {} for level in LEVELS}  # level -> key -> np.array(FIELDS)
+        self.coords = {"state": {}, "city": {}}         # point locations of state/city buckets
+        self.tile_index = {}                            # (z, x, y) -> set of cell keys, z <= grid_zoom
+        self.policies = {}                              # policy number -> (location keys, contribution)
+        self.alerts = {}                                # location keys -> current alert count
+        self._payloads = {}
+
+    def _location_keys(self, state, city=None, lat=None, lon=None):
+        """(state, city or None, cell key or None) buckets a location contributes to."""
+        state = normalize_state(state) or CITY_STATE.get(normalize_city(city), "")
+        city = normalize_city(city) or None
+        coords = location_coords(state, city, lat, lon)
+        cell = "{}/{}".format(*tile_of(*coords, self.grid_zoom)) if coords else None
+        if city and coords:
+            self.coords["city"].setdefault(city, coords)
+        if state and state in CAPITAL_CITIES:
+            self.coords["state"].setdefault(state, location_coords(state))
+        return state or None, city, cell
+
+    def _add(self, keys, contribution):
+        for level, key in zip(LEVELS, keys):
+            if key is None:
+                continue
+            bucket = self.buckets[level].get(key)
+            if bucket is None:
+                bucket = self.buckets[level][key] = np.zeros(len(FIELDS))
+                if level == "cell":
+                    self._index_cell(key)
+            bucket += contribution
+
+    def _index_cell(self, key):
+        x, y = map(int, key.split("/"))
+        for z in range(self.grid_zoom, -1, -1):
+            self.tile_index.setdefault((z, x, y), set()).add(key)
+            x, y = x // 2, y // 2
+
+    def _changed(self):
+        self.version += 1
+        self._payloads = {}
+
+    @property
+    def etag(self):
+        return f"{self.instance}-{self.version}"
+
+    # --- updates ---
+
+    def load_book(self, book):
+        """Rebuild policy aggregates from a PolicyBook (alerts are kept)."""
+        started = time.perf_counter()
+        city_codes = book.city_codes if len(book.cities) else np.full(book.size, -1)
+        # One bucket lookup per distinct (state, city) pair, then one bincount per field
+        pairs, pair_index = np.unique(np.stack([book.state_codes, city_codes], axis=1), axis=0, return_inverse=True)
+        pair_index = pair_index.reshape(-1)
+        scored = ~np.isnan(book.ml_probability)
+        per_policy = np.stack([
+            np.ones(book.size), book.premium, book.sum_insured,
+            np.where(scored, book.ml_probability, 0.0), scored.astype(np.float64), np.zeros(book.size),
+        ], axis=1)
+        totals = np.stack([np.bincount(pair_index, weights=per_policy[:, i], minlength=len(pairs))
+                           for i in range(len(FIELDS))], axis=1)
+
+        with self.lock:
+            alerts = self.alerts
+            self._reset()
+            pair_keys = [
+                self._location_keys(book.states[s] if s >= 0 else None, book.cities[c] if c >= 0 else None)
+                for s, c in pairs
+            ]
+            for keys, contribution in zip(pair_keys, totals):
+                self._add(keys, contribution)
+            self.policies = {
+                number: (pair_keys[i], per_policy[row])
+                for row, (number, i) in enumerate(zip(book.policy_numbers, pair_index))
+            }
+            for keys, count in alerts.items():
+                self._add(keys, self._alert_vector(count))
+            self.alerts = alerts
+            self.has_sum_insured = book.has_sum_insured
+            self.loaded = True
+            self._changed()
+        print(f"🗺️ Geo aggregates built for {book.size} policies in {time.perf_counter() - started:.2f}s")
+
+    def upsert_policies(self, records):
+        """
+        Add or replace policies: {"policy_number", "state", "city", "lat", "lon",
+        "premium", "sum_insured", "ml_score"}. Only their own contribution is applied.
+        Sum insured totals are only reported when the loaded book carries them.
+        """
+        with self.lock:
+            # Build every contribution first so a bad record leaves the buckets untouched
+            updates = []
+            for record in records:
+                ml_score = record.get("ml_score")
+                contribution = np.array([
+                    1.0, float(record.get("premium") or 0.0), float(record.get("sum_insured") or 0.0),
+                    float(ml_score or 0.0), float(ml_score is not None), 0.0,
+                ])
+                keys = self._location_keys(record.get("state"), record.get("city"), record.get("lat"), record.get("lon"))
+                updates.append((str(record["policy_number"]), keys, contribution))
+            try:
+                for number, keys, contribution in updates:
+                    self._remove_policy(number)
+                    self._add(keys, contribution)
+                    self.policies[number] = (keys, contribution)
+            finally:
+                self._changed()
+
+    def remove_policies(self, policy_numbers):
+        with self.lock:
+            removed = sum(self._remove_policy(str(number)) for number in policy_numbers)
+            self._changed()
+        return removed
+
+    def _remove_policy(self, number):
+        previous = self.policies.pop(number, None)
+        if previous is None:
+            return False
+        self._add(previous[0], -previous[1])
+        return True
+
+    @staticmethod
+    def _alert_vector(count):
+        vector = np.zeros(len(FIELDS))
+        vector[ALERTS] = count
+        return vector
+
+    def set_alerts(self, alerts, replace=True):
+        """
+        Current alerts ({"state" and/or "city", optional "count"}). With replace, these are
+        all current alerts and locations missing from the list drop to zero.
+        """
+        with self.lock:
+            counts = {} if replace else dict(self.alerts)
+            fresh = {}
+            for alert in alerts:
+                keys = self._location_keys(alert.get("state"), alert.get("city"), alert.get("lat"), alert.get("lon"))
+                if keys[0] is None and keys[1] is None:
+                    continue
+                fresh[keys] = fresh.get(keys, 0.0) + float(alert.get("count", 1))
+            counts.update(fresh)
+
+            for keys in set(self.alerts) | set(counts):
+                delta = counts.get(keys, 0.0) - self.alerts.get(keys, 0.0)
+                if delta:
+                    self._add(keys, self._alert_vector(delta))
+            self.alerts = {keys: count for keys, count in counts.items() if count}
+            self._changed()
+
+    # --- reads ---
+
+    def _properties(self, level, keys):
+        """Totals, mean ML score and risk engine score/level of the given buckets."""
+        if not keys:
+            return []
+        values = np.stack([self.buckets[level][key] for key in keys])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_ml = np.where(values[:, ML_SCORED] > 0, values[:, ML_SUM] / values[:, ML_SCORED], np.nan)
+        risk = self.engine.score(ml_probability=mean_ml, hazard_count=values[:, ALERTS])
+        return [{
+            "policies": int(round(row[POLICIES])),
+            "premium_total": round(float(row[PREMIUM]), 2),
+            "sum_insured_total": round(float(row[SUM_INSURED]), 2) if self.has_sum_insured else None,
+            "mean_ml_score": None if np.isnan(ml) else round(float(ml), 4),
+            "alerts": int(round(row[ALERTS])),
+            "risk_score": float(score),
+            "risk_level": str(level_name),
+        } for row, ml, score, level_name in zip(values, mean_ml, risk["score"], risk["level"])]
+
+    def _cell_geometry(self, key):
+        x, y = map(int, key.split("/"))
+        west, south, east, north = tile_bounds(x, y, self.grid_zoom)
+        ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+        return {"type": "Polygon", "coordinates": [[[round(lon, 5), round(lat, 5)] for lon, lat in ring]]}
+
+    def layer(self, level):
+        """(GeoJSON FeatureCollection bytes, ETag) of one level, built once per version."""
+        if level not in LEVELS:
+            raise ValueError(f"Unknown level '{level}' (expected one of {LEVELS})")
+        with self.lock:
+            cached = self._payloads.get(("layer", level))
+            if cached is not None:
+                return cached
+            keys = sorted(key for key, bucket in self.buckets[level].items() if bucket.any())
+            features = []
+            for key, properties in zip(keys, self._properties(level, keys)):
+                if level == "cell":
+                    geometry = self._cell_geometry(key)
+                else:
+                    coords = self.coords[level].get(key)
+                    if coords is None:
+                        continue
+                    geometry = {"type": "Point", "coordinates": [coords[1], coords[0]]}
+                features.append({"type": "Feature", "id": key, "geometry": geometry,
+                                 "properties": {level: key, **properties}})
+            payload = json.dumps({"type": "FeatureCollection", "version": self.version, "features": features},
+                                 separators=(",", ":")).encode()
+            self._payloads[("layer", level)] = payload, self.etag
+            return self._payloads[("layer", level)]
+
+    def tile(self, z, x, y):
+        """
+        (compact JSON bytes, ETag) of the grid cells inside tile z/x/y: a field list plus one
+        row per cell. Tiles deeper than the grid return the cell that contains them.
+        """
+        if z > self.grid_zoom:
+            shift = z - self.grid_zoom
+            z, x, y = self.grid_zoom, x >> shift, y >> shift
+        with self.lock:
+            cached = self._payloads.get(("tile", z, x, y))
+            if cached is not None:
+                return cached
+            keys = sorted(key for key in self.tile_index.get((z, x, y), ()) if self.buckets["cell"][key].any())
+            rows = [
+                [*map(int, key.split("/")), p["policies"], p["premium_total"], p["sum_insured_total"],
+                 p["mean_ml_score"], p["alerts"], p["risk_score"], p["risk_level"]]
+                for key, p in zip(keys, self._properties("cell", keys))
+            ]
+            payload = json.dumps({
+                "z": z, "x": x, "y": y, "grid_zoom": self.grid_zoom, "version": self.version,
+                "fields": ["x", "y", "policies", "premium_total", "sum_insured_total",
+                           "mean_ml_score", "alerts", "risk_score", "risk_level"],
+                "cells": rows,
+            }, separators=(",", ":")).encode()
+            self._payloads[("tile", z, x, y)] = payload, self.etag
+            return self._payloads[("tile", z, x, y)]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "loaded": self.loaded,
+                "version": self.version,
+                "grid_zoom": self.grid_zoom,
+                "policies": len(self.policies),
+                "alert_locations": len(self.alerts),
+                **{f"{level}_buckets": len(self.buckets[level]) for level in LEVELS},
+            }
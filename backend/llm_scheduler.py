@@ -0,0 +1,162 @@
+# llm_scheduler.py
+# Central admission control for OpenAI calls.
+#
+# Every chat completion goes through one LLMScheduler, which caps the number of
+# calls in flight, keeps a rolling tokens-per-minute budget, admits interactive
+# calls before batch ones and records latency and token usage per call. Callers
+# run the request on their own thread once admitted, so streamed responses keep
+# their slot until the stream is consumed. Calls that wait in the queue longer
+# than their timeout fail with LLMQueueTimeout instead of stalling the worker.
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+CHARS_PER_TOKEN = 4                  # rough prompt size estimate before the real usage is known
+DEFAULT_COMPLETION_TOKENS = 1000     # reserved for the completion when max_tokens is not given
+WINDOW_SECONDS = 60
+
+
+class LLMQueueTimeout(TimeoutError):
+    """The call waited longer than its queue timeout for a slot or token budget."""
+
+
+def estimate_tokens(messages, max_tokens=None):
+    prompt_chars = sum(len(str(message.get("content") or "")) for message in messages)
+    return prompt_chars // CHARS_PER_TOKEN + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class LLMScheduler:
+    """Priority-ordered, concurrency- and token-bounded gate in front of an OpenAI client."""
+
+    def __init__(self, client, max_concurrency=4, tokens_per_minute=0, queue_timeout=60, history_size=500):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute  # 0 disables the token budget
+        self.queue_timeout = queue_timeout
+        self.cond = threading.Condition()
+        self.waiting = []          # heap of (priority, sequence)
+        self.sequence = itertools.count()
+        self.active = 0
+        self.window = deque()      # [admitted_at, tokens] per call in the last minute
+        self.calls = deque(maxlen=history_size)
+        self.totals = {"calls": 0, "errors": 0, "timeouts": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def _tokens_in_window(self, now):
+        while self.window and now - self.window[0][0] > WINDOW_SECONDS:
+            self.window.popleft()
+        return sum(tokens for _, tokens in self.window)
+
+    def _admit_wait(self, ticket, tokens, now):
+        """0 if the ticket may run now, otherwise how long to wait before checking again."""
+        if self.waiting[0] != ticket or self.active >= self.max_concurrency:
+            return None
+        if self.tokens_per_minute:
+            used = self._tokens_in_window(now)
+            # A single call larger than the budget still runs once the window is empty
+            if used and used + tokens > self.tokens_per_minute:
+                return max(self.window[0][0] + WINDOW_SECONDS - now, 0.05)
+        return 0
+
+    @contextmanager
+    def slot(self, priority="interactive", estimated_tokens=0, timeout=None, label=""):
+        """
+        Hold one call slot. Yields the call record; set "prompt_tokens" and
+        "completion_tokens" on it once the real usage is known.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = (PRIORITIES.get(priority, PRIORITIES["batch"]), next(self.sequence))
+        queued_at = time.monotonic()
+        deadline = queued_at + timeout if timeout else None
+
+        with self.cond:
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                now = time.monotonic()
+                wait = self._admit_wait(ticket, estimated_tokens, now)
+                if wait == 0:
+                    break
+                if deadline is not None and now >= deadline:
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                    self.totals["timeouts"] += 1
+                    self.cond.notify_all()
+                    raise LLMQueueTimeout(f"LLM call '{label}' waited more than {timeout}s in the queue")
+                waits = [w for w in (wait, deadline - now if deadline is not None else None) if w is not None]
+                self.cond.wait(min(waits) if waits else None)
+            heapq.heappop(self.waiting)
+            self.active += 1
+            reservation = [time.monotonic(), estimated_tokens]
+            self.window.append(reservation)
+            self.cond.notify_all()
+
+        call = {
+            "label": label,
+            "priority": priority,
+            "queued_s": round(reservation[0] - queued_at, 3),
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "status": "ok",
+        }
+        started = time.monotonic()
+        try:
+            yield call
+        except Exception:
+            call["status"] = "error"
+            raise
+        finally:
+            call["latency_s"] = round(time.monotonic() - started, 3)
+            used = (call["prompt_tokens"] or 0) + (call["completion_tokens"] or 0)
+            with self.cond:
+                self.active -= 1
+                if used:
+                    reservation[1] = used  # replace the estimate with the actual usage
+                self.totals["calls"] += 1
+                self.totals["errors"] += call["status"] == "error"
+                self.totals["prompt_tokens"] += call["prompt_tokens"] or 0
+                self.totals["completion_tokens"] += call["completion_tokens"] or 0
+                self.calls.append(call)
+                self.cond.notify_all()
+
+    def chat(self, priority="interactive", label="", timeout=None, **create_kwargs):
+        """client.chat.completions.create() through the scheduler."""
+        estimate = estimate_tokens(create_kwargs.get("messages", []), create_kwargs.get("max_tokens"))
+        with self.slot(priority, estimate, timeout, label) as call:
+            response = self.client.chat.completions.create(**create_kwargs)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                call["prompt_tokens"] = usage.prompt_tokens
+                call["completion_tokens"] = usage.completion_tokens
+            return response
+
+    def stats(self):
+        with self.cond:
+            calls = list(self.calls)
+            snapshot = {
+                "active": self.active,
+                "queued": len(self.waiting),
+                "max_concurrency": self.max_concurrency,
+                "tokens_per_minute": self.tokens_per_minute,
+                "tokens_last_minute": self._tokens_in_window(time.monotonic()),
+                "totals": dict(self.totals),
+            }
+
+        by_label = {}
+        for call in calls:
+            by_label.setdefault(call["label"], []).append(call)
+        snapshot["by_label"] = {}
+        for label, items in by_label.items():
+            latencies = sorted(item["latency_s"] for item in items)
+            snapshot["by_label"][label] = {
+                "calls": len(items),
+                "avg_latency_s": round(sum(latencies) / len(latencies), 3),
+                "p95_latency_s": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+                "avg_queued_s": round(sum(item["queued_s"] for item in items) / len(items), 3),
+                "tokens": sum((item["prompt_tokens"] or 0) + (item["completion_tokens"] or 0) for item in items),
+            }
+        snapshot["recent_calls"] = calls[-20:]
+        return snapshot
@@ -0,0 +1,114 @@
+# passage_index.py
+# Local BM25 passage index over extracted policy text (no network, no extra dependencies).
+#
+# The compliance check uses it to send the LLM only the passages relevant to each
+# checklist requirement instead of the whole document.
+
+import math
+import re
+from collections import Counter, defaultdict
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "to", "was", "were", "will", "with", "e", "g",
+    "this", "these", "those", "any", "all", "may", "must", "shall", "such", "per",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def tokenize(text):
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_RE.split(text or "") if s.strip()]
+
+
+def split_passages(text, max_words=120, overlap_words=30):
+    """Sentence-aligned passages of about max_words words with some overlap."""
+    sentences = split_sentences(text)
+    passages, current, current_words = [], [], 0
+
+    for sentence in sentences:
+        words = len(sentence.split())
+        if current and current_words + words > max_words:
+            passages.append(" ".join(current))
+            # Carry trailing sentences forward as overlap
+            carried, carried_words = [], 0
+            for previous in reversed(current):
+                carried_words += len(previous.split())
+                if carried_words > overlap_words:
+                    break
+                carried.insert(0, previous)
+            current, current_words = carried, sum(len(c.split()) for c in carried)
+        current.append(sentence)
+        current_words += words
+
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+class PassageIndex:
+    """Okapi BM25 over the passages of one document."""
+
+    def __init__(self, text, k1=1.5, b=0.75, max_words=120, overlap_words=30):
+        self.k1 = k1
+        self.b = b
+        self.passages = split_passages(text, max_words, overlap_words)
+        self.postings = defaultdict(list)  # term -> [(passage index, term frequency)]
+        self.lengths = []
+
+        for idx, passage in enumerate(self.passages):
+            counts = Counter(tokenize(passage))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((idx, tf))
+
+        n = len(self.passages)
+        self.avg_length = (sum(self.lengths) / n) if n else 0
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, k=3):
+        """Top-k (passage index, score) pairs for a free-text query."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for idx, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[idx] / (self.avg_length or 1))
+                scores[idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def requirement_query(requirement):
+    """Query text for a checklist item: clause, requirement and evidence hints."""
+    return " ".join([
+        requirement.get("clause", ""),
+        requirement.get("requirement", ""),
+        " ".join(requirement.get("evidence_hints", [])),
+    ])
+
+
+def requirement_context(index, requirements, k=3):
+    """
+    Compact prompt context: for each requirement, its top-k passages (labelled so
+    the LLM can cite them). Returns (context text, number of distinct passages used).
+    """
+    blocks, used = [], set()
+    for requirement in requirements:
+        hits = index.search(requirement_query(requirement), k=k)
+        lines = [f"Requirement {requirement['id']} ({requirement.get('clause', '')}):"]
+        if not hits:
+            lines.append("  No relevant passages found in the policy text.")
+        for idx, _score in hits:
+            used.add(idx)
+            lines.append(f"  [P{idx}] {index.passages[idx]}")
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks), len(used)
@@ -0,0 +1,147 @@
+# pdf_renderer.py
+# HTML -> PDF rendering off the request threads.
+#
+# PDFs are rendered by a pool of worker processes that import WeasyPrint, load
+# the base stylesheet and fonts, and render a warm-up page once when they start,
+# so each request only pays for its own layout. Submissions go through a bounded
+# queue: when all workers are busy and the queue is full, callers get
+# PDFQueueFull instead of piling up. Without WeasyPrint (or if the pool breaks)
+# documents are rendered as plain text with FPDF.
+
+import atexit
+import html
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fpdf import FPDF
+
+BASE_CSS = "@page { size: A4; margin: 18mm; }"
+_worker = {}  # per-process WeasyPrint state, filled by _init_worker
+
+_TEXT_REPLACEMENTS = {"—": "-", "–": "-", "‘": "'", "’": "'", "“": '"', "”": '"',
+                      "•": "-", "…": "...", " ": " "}
+
+
+class PDFQueueFull(RuntimeError):
+    """All PDF workers are busy and the render queue is full."""
+
+
+def _init_worker():
+    """Pool initializer: import WeasyPrint, preload CSS and fonts, render a warm-up page."""
+    try:
+        from weasyprint import CSS, HTML
+        try:
+            from weasyprint.text.fonts import FontConfiguration
+        except ImportError:  # WeasyPrint < 53
+            from weasyprint.fonts import FontConfiguration
+    except ImportError:
+        _worker["html"] = None
+        return
+    font_config = FontConfiguration()
+    _worker.update(html=HTML, font_config=font_config, stylesheets=[CSS(string=BASE_CSS, font_config=font_config)])
+    _render_weasyprint("<p>warm-up</p>")
+
+
+def _render_weasyprint(html_document):
+    return _worker["html"](string=html_document).write_pdf(
+        stylesheets=_worker["stylesheets"], font_config=_worker["font_config"])
+
+
+def _render_job(html_document, fallback_text):
+    """Runs in a worker process."""
+    if _worker.get("html") is None:
+        return render_text_pdf(fallback_text if fallback_text is not None else html_document)
+    return _render_weasyprint(html_document)
+
+
+def _plain_text(text):
+    """Markdown/HTML draft -> plain text lines FPDF's core fonts can draw."""
+    text = re.sub(r"<(style|script|head)\b.*?</\1>", "", text or "", flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r"<br\s*/?>|</(p|div|h\d|li|tr)>", "\n", text, flags=re.IGNORECASE)
+    text = html.unescape(re.sub(r"<[^>]+>", "", text))
+    for char, replacement in _TEXT_REPLACEMENTS.items():
+        text = text.replace(char, replacement)
+    text = text.replace("**", "").replace("__", "")
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+def render_text_pdf(text, title="Draft Insurance Policy Document"):
+    """Lightweight FPDF rendering: title, disclaimer, markdown headings in bold, wrapped text."""
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.multi_cell(0, 10, _plain_text(title), align="C")
+    pdf.set_font("Helvetica", "I", 10)
+    pdf.multi_cell(0, 6, "AI-generated draft - requires legal review", align="C")
+    pdf.ln(4)
+
+    blank = False
+    for line in _plain_text(text).splitlines():
+        line = line.strip()
+        if not line:
+            if not blank:
+                pdf.ln(3)
+            blank = True
+            continue
+        blank = False
+        heading = re.match(r"^(#{1,6})\s*(.*)$", line)
+        if heading:
+            pdf.set_font("Helvetica", "B", max(15 - len(heading.group(1)), 11))
+            pdf.multi_cell(0, 7, heading.group(2))
+        else:
+            pdf.set_font("Helvetica", "", 10)
+            pdf.multi_cell(0, 5, line)
+
+    output = pdf.output(dest="S")
+    # PyFPDF returns a latin-1 str, fpdf2 a bytearray
+    return output.encode("latin-1") if isinstance(output, str) else bytes(output)
+
+
+class PDFRenderer:
+    """Warm process pool with a bounded queue. The pool is started on first use."""
+
+    def __init__(self, max_workers=None, queue_size=8, queue_timeout=30):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.queue_timeout = queue_timeout
+        self.slots = threading.BoundedSemaphore(self.max_workers + queue_size)
+        self.lock = threading.Lock()
+        self.pool = None
+        atexit.register(self.shutdown)
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+            return self.pool
+
+    def submit(self, html_document, fallback_text=None):
+        """Future of the PDF bytes. Raises PDFQueueFull when no slot frees up within queue_timeout."""
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise PDFQueueFull(f"PDF render queue full ({self.max_workers} workers busy)")
+        try:
+            future = self._get_pool().submit(_render_job, html_document, fallback_text)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def render(self, html_document, fallback_text=None):
+        """PDF bytes; falls back to in-process FPDF if the worker pool is broken."""
+        try:
+            return self.submit(html_document, fallback_text).result()
+        except BrokenProcessPool as e:
+            print(f"⚠️ PDF worker pool broken ({e}); restarting it and using the text renderer")
+            with self.lock:
+                self.pool = None
+            return render_text_pdf(fallback_text if fallback_text is not None else html_document)
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
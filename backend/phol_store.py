@@ -0,0 +1,316 @@
+# phol_store.py
+# Streaming ingestion of PHOL Products/Funds XML feeds into a local SQLite store.
+#
+#   python phol_store.py products.xml funds.xml [--prune]
+#
+# Feeds are read with an incremental iterparse and every record element is
+# cleared once stored, so memory stays flat for multi-GB files. Records are keyed
+# by ProductCode / FundCode and carry a hash of their content; re-ingesting a
+# feed only writes records that are new or changed. With --prune, products of the
+# funds present in the feed that are no longer listed are removed.
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+PHOL_NS = "http://admin.privatehealth.gov.au/ws/Schemas"
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "phol_products.sqlite")
+RECORD_TAGS = {"Product": "product", "Fund": "fund"}
+BATCH_SIZE = 1000
+
+
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def element_to_dict(elem):
+    """
+    Element -> JSON-friendly dict: attributes as "@Name", children by local name
+    (a list when repeated), text as the value itself or "#text" next to attributes.
+    """
+    node = {f"@{local_name(key)}": value for key, value in elem.attrib.items()}
+    for child in elem:
+        name = local_name(child.tag)
+        value = element_to_dict(child)
+        if name not in node:
+            node[name] = value
+        elif isinstance(node[name], list):
+            node[name].append(value)
+        else:
+            node[name] = [node[name], value]
+
+    text = (elem.text or "").strip()
+    if not node:
+        return text
+    if text:
+        node["#text"] = text
+    return node
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def text_of(value):
+    return value.get("#text") if isinstance(value, dict) else value
+
+
+def iter_records(source):
+    """
+    Yield ("product" | "fund", record dict) from a PHOL feed (file path or file object).
+    Records are the Product/Fund children of the root, or the root itself.
+    """
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        kind = RECORD_TAGS.get(local_name(elem.tag))
+        if kind and depth <= 1:
+            yield kind, element_to_dict(elem)
+            if elem is not root:
+                # Drop the finished record so the tree never grows
+                elem.clear()
+                root.clear()
+
+
+def content_hash(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+def product_row(record):
+    return {
+        "product_code": record.get("@ProductCode") or record.get("@ProductID"),
+        "product_id": record.get("@ProductID"),
+        "fund_code": text_of(record.get("FundCode")),
+        "name": text_of(record.get("Name")),
+        "product_type": text_of(record.get("ProductType")),
+        "status": text_of(record.get("ProductStatus")),
+        "state": text_of(record.get("State")),
+    }
+
+
+def fund_row(record):
+    return {
+        "fund_code": text_of(record.get("FundCode")),
+        "fund_id": record.get("@FundID"),
+        "name": text_of(record.get("FundName")),
+        "fund_type": text_of(record.get("FundType")),
+    }
+
+
+def _number(value):
+    try:
+        return float(str(text_of(value)).replace("$", "").replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def product_for_policy(record):
+    """Stored PHOL product -> the product JSON the policy templates and prompt use."""
+    row = product_row(record)
+    benefits = []
+    services = (record.get("GeneralHealthCover") or {}).get("GeneralHealthServices") or {}
+    for service in as_list(services.get("GeneralHealthService")):
+        if str(service.get("@Covered", "")).lower() != "true":
+            continue
+        amounts = [
+            _number(benefit)
+            for benefits_list in as_list(service.get("BenefitsList"))
+            for benefit in as_list(benefits_list.get("Benefit") if isinstance(benefits_list, dict) else None)
+        ]
+        amounts = [amount for amount in amounts if amount is not None]
+        benefits.append({
+            "code": service.get("@Title"),
+            "text": f"{service.get('@Title')} covered",
+            "amount": max(amounts) if amounts else None,
+        })
+
+    return {
+        "product_id": row["product_code"],
+        "product_name": row["name"],
+        "extract_date": text_of(record.get("DateIssued")) or text_of(record.get("DateValidFrom")),
+        "open_closed": row["status"],
+        "product_type": row["product_type"],
+        "fund_code": row["fund_code"],
+        "state": row["state"],
+        "premium_no_rebate": _number(record.get("PremiumNoRebate")),
+        "sum_insured": None,
+        "benefits": benefits,
+    }
+
+
+def fund_for_policy(record):
+    """Stored PHOL fund -> the fund JSON the policy templates use."""
+    row = fund_row(record)
+    return {
+        "Name": row["name"],
+        "fund_code": row["fund_code"],
+        "fund_id": row["fund_id"],
+        "fund_type": row["fund_type"],
+        "phone": text_of(record.get("Phone")),
+        "website": text_of(record.get("Website")),
+    }
+
+
+class PHOLStore:
+    """Products and funds by code, with content hashes for change detection."""
+
+    TABLES = {
+        "product": ("products", "product_code", ["product_id", "fund_code", "name", "product_type", "status", "state"]),
+        "fund": ("funds", "fund_code", ["fund_id", "name", "fund_type"]),
+    }
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for table, key, columns in self.TABLES.values():
+            column_defs = ", ".join(f"{column} TEXT" for column in columns)
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    {key} TEXT PRIMARY KEY,
+                    {column_defs},
+                    content_hash TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    last_seen_run TEXT NOT NULL
+                )
+            """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_products_product_id ON products (product_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_products_fund_code ON products (fund_code)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_funds_fund_id ON funds (fund_id)")
+        self.conn.commit()
+
+    def _apply_batch(self, kind, batch, run_id, stats):
+        table, key, columns = self.TABLES[kind]
+        keys = [row[key] for row, _ in batch]
+        placeholders = ",".join("?" * len(keys))
+        with self.lock:
+            existing = dict(self.conn.execute(
+                f"SELECT {key}, content_hash FROM {table} WHERE {key} IN ({placeholders})", keys
+            ).fetchall())
+
+            now, changed, unchanged = time.time(), [], []
+            for row, record in batch:
+                digest = content_hash(record)
+                if existing.get(row[key]) == digest:
+                    unchanged.append((run_id, row[key]))
+                    continue
+                stats["updated" if row[key] in existing else "inserted"] += 1
+                existing[row[key]] = digest
+                changed.append((row[key], *(row[c] for c in columns), digest, json.dumps(record), now, run_id))
+
+            if changed:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO {table} VALUES ({','.join('?' * (len(columns) + 5))})", changed
+                )
+            if unchanged:
+                self.conn.executemany(f"UPDATE {table} SET last_seen_run = ? WHERE {key} = ?", unchanged)
+            self.conn.commit()
+        stats["unchanged"] += len(unchanged)
+
+    def ingest(self, source, prune=False, batch_size=BATCH_SIZE):
+        """Load one feed; only new or changed records are written. Returns counts."""
+        run_id = f"{time.time():.6f}"
+        stats = {"records": 0, "inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0, "pruned": 0}
+        batches = {"product": [], "fund": []}
+        fund_codes = set()
+        row_builders = {"product": product_row, "fund": fund_row}
+
+        for kind, record in iter_records(source):
+            row = row_builders[kind](record)
+            key = self.TABLES[kind][1]
+            if not row[key]:
+                stats["skipped"] += 1
+                continue
+            stats["records"] += 1
+            if kind == "product" and row["fund_code"]:
+                fund_codes.add(row["fund_code"])
+            batches[kind].append((row, record))
+            if len(batches[kind]) >= batch_size:
+                self._apply_batch(kind, batches[kind], run_id, stats)
+                batches[kind] = []
+
+        for kind, batch in batches.items():
+            if batch:
+                self._apply_batch(kind, batch, run_id, stats)
+
+        if prune and fund_codes:
+            placeholders = ",".join("?" * len(fund_codes))
+            with self.lock:
+                cursor = self.conn.execute(
+                    f"DELETE FROM products WHERE fund_code IN ({placeholders}) AND last_seen_run != ?",
+                    [*sorted(fund_codes), run_id],
+                )
+                self.conn.commit()
+            stats["pruned"] = cursor.rowcount
+        return stats
+
+    def _get(self, table, where, value):
+        with self.lock:
+            row = self.conn.execute(f"SELECT data FROM {table} WHERE {where} = ? LIMIT 1", (value,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_product(self, code_or_id):
+        """Product record by ProductCode, falling back to ProductID."""
+        return self._get("products", "product_code", code_or_id) or self._get("products", "product_id", code_or_id)
+
+    def get_fund(self, fund_code):
+        return self._get("funds", "fund_code", fund_code) or self._get("funds", "fund_id", fund_code)
+
+    def search_products(self, fund_code=None, product_type=None, status=None, limit=100):
+        clauses, params = [], []
+        for column, value in (("fund_code", fund_code), ("product_type", product_type), ("status", status)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT product_code, product_id, fund_code, name, product_type, status, state "
+                f"FROM products {where} ORDER BY product_code LIMIT ?", [*params, limit]
+            ).fetchall()
+        keys = ("product_code", "product_id", "fund_code", "name", "product_type", "status", "state")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def stats(self):
+        with self.lock:
+            products = self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            funds = self.conn.execute("SELECT COUNT(*) FROM funds").fetchone()[0]
+        return {"products": products, "funds": funds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest PHOL Products/Funds XML feeds into the local store.")
+    parser.add_argument("feeds", nargs="+", help="PHOL XML files")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    parser.add_argument("--prune", action="store_true",
+                        help="Remove products of the feed's funds that the feed no longer lists")
+    args = parser.parse_args(argv)
+
+    store = PHOLStore(args.store)
+    for feed in args.feeds:
+        started = time.perf_counter()
+        stats = store.ingest(feed, prune=args.prune)
+        print(f"✅ {feed}: {stats} in {time.perf_counter() - started:.1f}s")
+    print(f"📦 Store now holds {store.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# phol_validation.py
+# Validation of PHOL Product/Fund feeds against the PHOL XSD.
+#
+# The schema (PHOLSchema-V3.1.xsd plus its PHOL-Lists-V3.1.xsd include) is
+# compiled once per process and cached. A feed is streamed with iterparse and
+# each top-level Product/Fund record is validated on its own (both are global
+# elements of the schema), in batches spread over a process pool whose workers
+# compile the schema once when they start. Every record is checked, so one
+# report lists all invalid records with their errors and source lines.
+
+import functools
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from lxml import etree
+except ImportError:  # validation is unavailable without lxml
+    etree = None
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+SCHEMA_FILE = "PHOLSchema-V3.1.xsd"
+PHOL_NS = "http://admin.privatehealth.gov.au/ws/Schemas"
+RECORD_TAGS = (f"{{{PHOL_NS}}}Product", f"{{{PHOL_NS}}}Fund")
+
+
+class SchemaUnavailable(RuntimeError):
+    """The schema cannot be compiled (lxml missing, or a schema file missing or invalid)."""
+
+
+@functools.lru_cache(maxsize=None)
+def get_schema(schema_path):
+    """Compiled XMLSchema for schema_path, compiled once per process."""
+    if etree is None:
+        raise SchemaUnavailable("lxml is required for XSD validation (pip install lxml)")
+    try:
+        started = time.perf_counter()
+        schema = etree.XMLSchema(etree.parse(schema_path))
+    except (OSError, etree.XMLSyntaxError, etree.XMLSchemaParseError) as e:
+        raise SchemaUnavailable(
+            f"Cannot compile {schema_path}: {e}. Its include PHOL-Lists-V3.1.xsd must be in the same directory."
+        ) from e
+    print(f"📐 Compiled PHOL schema in {time.perf_counter() - started:.2f}s (pid {os.getpid()})")
+    return schema
+
+
+def record_key(elem):
+    """ProductCode for products, FundCode for funds."""
+    if elem.get("ProductCode"):
+        return elem.get("ProductCode")
+    code = elem.find(f"{{{PHOL_NS}}}FundCode")
+    return code.text if code is not None else None
+
+
+def iter_record_batches(source, batch_size=200):
+    """
+    Stream (index, kind, key, source line, serialized record) batches from a feed.
+    Only records directly under the root are taken; each is freed once serialized.
+    On a syntax error, the records read so far are yielded before the error is raised.
+    """
+    batch, index = [], 0
+    try:
+        for _, elem in etree.iterparse(source, events=("end",), tag=RECORD_TAGS, huge_tree=True):
+            parent = elem.getparent()
+            if parent is not None and parent.getparent() is not None:
+                continue  # nested, not a feed record
+            batch.append((index, etree.QName(elem).localname, record_key(elem), elem.sourceline,
+                          etree.tostring(elem)))
+            index += 1
+            elem.clear()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    except etree.XMLSyntaxError:
+        # Hand over the records read before the error, then let the caller see it
+        if batch:
+            yield batch
+        raise
+    if batch:
+        yield batch
+
+
+def validate_batch(schema_path, batch, max_errors=20):
+    """Validate serialized records; returns only the invalid ones with their errors."""
+    schema = get_schema(schema_path)
+    invalid = []
+    for index, kind, key, line, data in batch:
+        record = etree.fromstring(data)
+        if schema.validate(record):
+            continue
+        invalid.append({
+            "index": index,
+            "kind": kind,
+            "key": key,
+            "line": line,
+            "errors": [
+                {"line": line + error.line - 1, "message": error.message}
+                for error in list(schema.error_log)[:max_errors]
+            ],
+        })
+    return len(batch), invalid
+
+
+class PHOLValidator:
+    """Compiled-once schema plus a lazily started pool of pre-compiled worker processes."""
+
+    def __init__(self, schema_path=os.path.join(SCHEMA_DIR, SCHEMA_FILE), max_workers=None, batch_size=200):
+        self.schema_path = schema_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.pool = None
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            initializer=get_schema, initargs=(self.schema_path,))
+        return self.pool
+
+    def validate(self, source, max_errors=20):
+        """
+        Validate every record of a feed. Batches run in the pool with a bounded number
+        in flight, so memory stays flat however large the feed is.
+        """
+        get_schema(self.schema_path)  # fail fast (and warm this process) before reading the feed
+        started = time.perf_counter()
+        pool = self._get_pool()
+        pending, records, invalid = deque(), 0, []
+
+        def collect(future):
+            nonlocal records
+            count, batch_invalid = future.result()
+            records += count
+            invalid.extend(batch_invalid)
+
+        try:
+            for batch in iter_record_batches(source, self.batch_size):
+                pending.append(pool.submit(validate_batch, self.schema_path, batch, max_errors))
+                if len(pending) >= 2 * self.max_workers:
+                    collect(pending.popleft())
+        except etree.XMLSyntaxError as e:
+            # Records read before the error are still reported. In-flight batches are
+            # bounded (2 x workers) and hold records already read, so all are collected
+            while pending:
+                collect(pending.popleft())
+            invalid.sort(key=lambda item: item["index"])
+            return {"valid": False, "records": records, "invalid_records": len(invalid), "errors": invalid,
+                    "syntax_error": str(e), "elapsed_seconds": round(time.perf_counter() - started, 2)}
+        while pending:
+            collect(pending.popleft())
+
+        invalid.sort(key=lambda item: item["index"])
+        return {
+            "valid": not invalid,
+            "records": records,
+            "invalid_records": len(invalid),
+            "errors": invalid,
+            "elapsed_seconds": round(time.perf_counter() - started, 2),
+        }
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
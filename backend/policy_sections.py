@@ -0,0 +1,179 @@
+# policy_sections.py
+# Section-level change tracking for incremental compliance re-checks.
+#
+# A policy wording is split into sections by its heading structure and each
+# section is hashed. For every policy family (the successive revisions of one
+# wording) the latest run is stored with its section hashes, its results and the
+# sections each requirement cited as evidence. On the next revision only the
+# requirements whose cited sections changed are evaluated again.
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_HEADING_RES = [
+    re.compile(r"^#{1,6}\s+\S"),                                                     # Markdown
+    re.compile(r"^(section|part|schedule|clause|appendix)\s+[\w.]+\b", re.IGNORECASE),
+    re.compile(r"^\d+(\.\d+)*\.?\s+[A-Z][^.!?]{0,100}$"),                           # 1. / 2.3 Title
+    re.compile(r"^[A-Z][A-Z0-9 &/,()'-]{3,80}$"),                                  # ALL CAPS TITLE
+]
+_QUOTE_RE = re.compile(r'"([^"]{12,})"')
+_PASSAGE_LABEL_RE = re.compile(r"\[P(\d+)\]")
+_VERSION_SUFFIX_RE = re.compile(
+    r"([_\-\s.]+(v|ver|version|rev|revision|draft|final|r)?[_\-\s.]?\d*(\.\d+)*|[_\-\s.]+\d{4}-?\d{2}-?\d{2})+$",
+    re.IGNORECASE,
+)
+SNIPPET_CHARS = 80  # leading characters of a quote used to locate it in a section
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def is_heading(line):
+    line = line.strip()
+    return bool(line) and len(line) <= 120 and any(pattern.match(line) for pattern in _HEADING_RES)
+
+
+def split_sections(text):
+    """
+    Sections of a line-preserving policy text: [{"key", "heading", "text", "hash"}].
+    Keys come from the heading (numbered on repeats) so an edited section keeps its
+    key and shows up as changed. Text without headings falls back to paragraphs
+    keyed by their content, so inserting a paragraph does not shift the others.
+    """
+    blocks, heading, lines = [], "preamble", []
+    for line in (text or "").splitlines():
+        if is_heading(line):
+            if any(l.strip() for l in lines) or heading != "preamble":
+                blocks.append((heading, lines))
+            heading, lines = line.strip(), []
+        else:
+            lines.append(line)
+    blocks.append((heading, lines))
+
+    if len(blocks) == 1:
+        paragraphs = [p for p in re.split(r"\n\s*\n", text or "") if p.strip()]
+        blocks = [(None, [p]) for p in paragraphs]
+
+    sections, seen = [], {}
+    for heading, body in blocks:
+        content = _normalize(" ".join(body))
+        if heading is None and not content:
+            continue
+        digest = hashlib.sha256(f"{heading or ''}\n{content}".encode()).hexdigest()[:16]
+        if heading is None:
+            key = f"para:{digest}"
+        else:
+            base = _normalize(heading)
+            seen[base] = seen.get(base, 0) + 1
+            key = base if seen[base] == 1 else f"{base}#{seen[base]}"
+        sections.append({"key": key, "heading": heading, "text": content, "hash": digest})
+    return sections
+
+
+def changed_sections(previous_hashes, sections):
+    """Keys of sections added, removed or edited since the previous run."""
+    current = {section["key"]: section["hash"] for section in sections}
+    keys = set(previous_hashes) | set(current)
+    return {key for key in keys if previous_hashes.get(key) != current.get(key)}
+
+
+def cited_sections(result, sections, passages=None):
+    """
+    Section keys a requirement result cites: quoted evidence is located in the
+    section text, and passage labels like [P3] are resolved through `passages`.
+    """
+    snippets = [quote for quote in _QUOTE_RE.findall(result.get("evidence") or "")]
+    if passages:
+        for label in _PASSAGE_LABEL_RE.findall(result.get("evidence") or ""):
+            idx = int(label)
+            if idx < len(passages):
+                snippets.append(passages[idx])
+
+    keys = []
+    for snippet in snippets:
+        needle = _normalize(snippet)[:SNIPPET_CHARS]
+        for section in sections:
+            if needle and needle in section["text"] and section["key"] not in keys:
+                keys.append(section["key"])
+                break
+    return keys
+
+
+def reusable_results(previous, changed):
+    """
+    Previous LLM results still valid for this revision: {requirement id: result}.
+    A result is reused if none of its cited sections changed. Results that cite
+    nothing (usually "Not Compliant") are only reused when nothing changed at
+    all, since new wording anywhere could now satisfy them. Rule decisions and
+    requirements that were not assessed are always evaluated again.
+    """
+    reuse = {}
+    for result in previous["results"]:
+        requirement_id = result.get("requirement_id")
+        if not requirement_id or result.get("assessed_by") in ("rules", "none"):
+            continue
+        cited = previous["requirement_sections"].get(requirement_id, [])
+        if (cited and not set(cited) & changed) or not changed:
+            reuse[requirement_id] = result
+    return reuse
+
+
+def derive_family(filename):
+    """Policy family from an upload name: 'home_policy_v3.pdf' and 'home_policy-rev4.pdf' -> 'home_policy'."""
+    stem = os.path.splitext(os.path.basename(filename or ""))[0]
+    return _VERSION_SUFFIX_RE.sub("", stem).strip().lower() or stem.lower()
+
+
+class PolicyRevisionStore:
+    """Latest analysed revision per policy family, checklist and model (SQLite)."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS policy_revisions (
+                family TEXT NOT NULL,
+                checklist TEXT NOT NULL,
+                model TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                sections TEXT NOT NULL,
+                results TEXT NOT NULL,
+                requirement_sections TEXT NOT NULL,
+                PRIMARY KEY (family, checklist, model)
+            )
+        """)
+        self.conn.commit()
+
+    def latest(self, family, checklist, model):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT updated_at, sections, results, requirement_sections FROM policy_revisions "
+                "WHERE family = ? AND checklist = ? AND model = ?",
+                (family, checklist, model),
+            ).fetchone()
+        if not row:
+            return None
+        updated_at, sections, results, requirement_sections = row
+        return {
+            "updated_at": updated_at,
+            "sections": json.loads(sections),
+            "results": json.loads(results),
+            "requirement_sections": json.loads(requirement_sections),
+        }
+
+    def save(self, family, checklist, model, sections, results, requirement_sections):
+        hashes = {section["key"]: section["hash"] for section in sections}
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO policy_revisions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (family, checklist, model, time.time(), json.dumps(hashes),
+                 json.dumps(results), json.dumps(requirement_sections)),
+            )
+            self.conn.commit()
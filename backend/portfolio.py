@@ -0,0 +1,259 @@
+# portfolio.py
+# Whole-book re-scoring against the current hazard alerts, grouped by location.
+#
+# The policy book (australia_insurance_* extract) is loaded once into columnar
+# NumPy arrays: state and city become small integer codes, premiums, claims and
+# dates become float/datetime columns. Alerts are counted per state and per
+# city, gathered onto every policy with one index lookup, and the whole book is
+# scored by a single RiskEngine call, so a re-score costs a few array passes
+# whatever the number of policies. Exposure totals per location come from
+# np.bincount over the same codes.
+#
+# The book is not run through the XGBoost model: the extract's stored "Risk Score"
+# column (0-1) is used as each policy's ML probability, and policies without one
+# are scored on the external signals only. The extracts carry no sum insured, so
+# sum insured totals are reported as None unless the book has a "Sum Insured (AUD)"
+# column.
+
+import time
+
+import numpy as np
+import pandas as pd
+
+# Capital city of each state (the extracts only carry a state, so this is where its alerts land)
+CAPITAL_CITIES = {
+    "NSW": "Sydney", "VIC": "Melbourne", "QLD": "Brisbane", "WA": "Perth",
+    "SA": "Adelaide", "TAS": "Hobart", "ACT": "Canberra", "NT": "Darwin",
+}
+# City -> state, for alerts that name a city
+CITY_STATE = {
+    **{city.lower(): state for state, city in CAPITAL_CITIES.items()},
+    "newcastle": "NSW", "wollongong": "NSW", "central coast": "NSW", "wagga wagga": "NSW",
+    "geelong": "VIC", "ballarat": "VIC", "bendigo": "VIC",
+    "gold coast": "QLD", "sunshine coast": "QLD", "townsville": "QLD", "cairns": "QLD", "toowoomba": "QLD",
+    "fremantle": "WA", "bunbury": "WA", "geraldton": "WA",
+    "mount gambier": "SA", "whyalla": "SA",
+    "launceston": "TAS", "devonport": "TAS",
+    "queanbeyan": "ACT",
+    "alice springs": "NT", "katherine": "NT",
+}
+
+STATE_COL = "State"
+CITY_COL = "City"
+PREMIUM_COL = "Annual Premium (AUD)"
+CLAIM_COL = "Claim Amount (AUD)"
+SUM_INSURED_COL = "Sum Insured (AUD)"
+RISK_COL = "Risk Score"
+END_DATE_COL = "Policy End Date"
+POLICY_COL = "Policy Number"
+DATE_FORMAT = "%m/%d/%Y"
+
+
+def normalize_state(value):
+    return str(value or "").strip().upper()
+
+
+def normalize_city(value):
+    return str(value or "").strip().lower()
+
+
+class PolicyBook:
+    """Columnar, location-indexed copy of the policy book."""
+
+    def __init__(self, df, source=None):
+        self.source = source
+        self.size = len(df)
+        self.state_codes, states = pd.factorize(df[STATE_COL].astype("string").str.strip().str.upper())
+        self.states = [str(state) for state in states]
+        self.state_index = {state: i for i, state in enumerate(self.states)}
+
+        if CITY_COL in df.columns:
+            self.city_codes, cities = pd.factorize(df[CITY_COL].astype("string").str.strip().str.lower())
+            self.cities = [str(city) for city in cities]
+        else:
+            # No city column: every policy sits in its state, cities are only used to map alerts
+            self.city_codes, self.cities = np.full(self.size, -1, dtype=np.int64), []
+        self.city_index = {city: i for i, city in enumerate(self.cities)}
+
+        def column(name, default=np.nan):
+            if name not in df.columns:
+                return np.full(self.size, default, dtype=np.float64)
+            return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=np.float64)
+
+        self.premium = np.nan_to_num(column(PREMIUM_COL))
+        self.claims = np.nan_to_num(column(CLAIM_COL))
+        self.has_sum_insured = SUM_INSURED_COL in df.columns
+        self.sum_insured = np.nan_to_num(column(SUM_INSURED_COL))  # zeros when the column is missing
+        # Stored extract score, used as the ML probability; NaN where the extract has none
+        self.ml_probability = column(RISK_COL)
+        self.end_date = (
+            pd.to_datetime(df[END_DATE_COL], format=DATE_FORMAT, errors="coerce").to_numpy()
+            if END_DATE_COL in df.columns else np.full(self.size, np.datetime64("NaT"), dtype="datetime64[ns]")
+        )
+        self.policy_numbers = (
+            df[POLICY_COL].astype(str).to_numpy() if POLICY_COL in df.columns else np.arange(self.size).astype(str)
+        )
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_csv(cls, path):
+        started = time.perf_counter()
+        book = cls(pd.read_csv(path, dtype={STATE_COL: "string", POLICY_COL: "string"}), source=path)
+        print(f"📚 Loaded policy book {path}: {book.size} policies in {len(book.states)} states "
+              f"({time.perf_counter() - started:.2f}s)")
+        return book
+
+    def in_force(self, as_of=None):
+        """Mask of policies in force on `as_of` (all policies when it is None)."""
+        if as_of is None:
+            return np.ones(self.size, dtype=bool)
+        as_of = np.datetime64(pd.Timestamp(as_of))
+        return np.isnat(self.end_date) | (self.end_date >= as_of)
+
+    def location_values(self, by_state, by_city=None, combine=np.add):
+        """
+        Per-policy value gathered from per-location dicts in one lookup per level:
+        the state's value, combined with the policy's city value where it has one.
+        """
+        # Trailing 0 for code -1 (missing state/city)
+        state_values = np.array([by_state.get(state, 0.0) for state in self.states] + [0.0], dtype=np.float64)
+        values = state_values[self.state_codes]
+        if by_city and self.cities:
+            city_values = np.array([by_city.get(city, 0.0) for city in self.cities] + [0.0], dtype=np.float64)
+            values = combine(values, city_values[self.city_codes])
+        return values
+
+    def stats(self):
+        return {
+            "source": self.source,
+            "policies": self.size,
+            "states": self.states,
+            "cities": len(self.cities),
+            "premium_total": round(float(self.premium.sum()), 2),
+            "has_sum_insured": self.has_sum_insured,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def count_alerts(alerts, book):
+    """
+    Alerts ({"state": ...} and/or {"city": ...}, optional "count", "weather_severity") ->
+    (hazards per state, hazards per city, max weather severity per state, per city).
+    City alerts land on the city when the book has cities, else on the city's state.
+    """
+    hazards_state, hazards_city, weather_state, weather_city = {}, {}, {}, {}
+    for alert in alerts:
+        state = normalize_state(alert.get("state"))
+        city = normalize_city(alert.get("city"))
+        count = float(alert.get("count", 1))
+        severity = alert.get("weather_severity")
+
+        if city and city in book.city_index:
+            hazards, weather, key = hazards_city, weather_city, city
+        else:
+            state = state or CITY_STATE.get(city, "")
+            if not state:
+                continue
+            hazards, weather, key = hazards_state, weather_state, state
+        hazards[key] = hazards.get(key, 0.0) + count
+        if severity is not None:
+            weather[key] = max(weather.get(key, 0.0), float(severity))
+    return hazards_state, hazards_city, weather_state, weather_city
+
+
+def _group_totals(codes, labels, mask, columns):
+    """Sum of each column per code (only where mask), as {label: {column: total}}."""
+    valid = mask & (codes >= 0)
+    minlength = len(labels)
+    sums = {
+        name: np.bincount(codes[valid], weights=values[valid], minlength=minlength)
+        for name, values in columns.items()
+    }
+    return {
+        label: {name: float(totals[i]) for name, totals in sums.items()}
+        for i, label in enumerate(labels)
+    }
+
+
+def rescore(book, engine, alerts=(), market_alert_count=0, as_of=None, top_n=20):
+    """
+    Re-score every (in-force) policy of `book` against `alerts` in one vectorised pass,
+    using the book's stored Risk Score as the ML probability. Returns the per-state/per-city
+    exposure summary (exposed_sum_insured is None when the book has no sum insured column)
+    and the policies whose score moved most.
+    """
+    started = time.perf_counter()
+    hazards_state, hazards_city, weather_state, weather_city = count_alerts(alerts, book)
+
+    hazards = book.location_values(hazards_state, hazards_city)
+    weather = book.location_values(weather_state, weather_city, combine=np.maximum)
+    market = np.full(book.size, float(market_alert_count))
+
+    current = engine.score(ml_probability=book.ml_probability, hazard_count=hazards,
+                           market_count=market, weather_severity=weather)
+    baseline = engine.score(ml_probability=book.ml_probability, hazard_count=np.zeros(book.size),
+                            market_count=market, weather_severity=np.zeros(book.size))
+
+    active = book.in_force(as_of)
+    affected = active & ((hazards > 0) | (weather > 0))
+    high = current["level"] == "High"
+    changed = current["level"] != baseline["level"]
+    delta = current["score"] - baseline["score"]
+
+    columns = {
+        "policies": active.astype(np.float64),
+        "affected_policies": affected.astype(np.float64),
+        "high_risk_policies": (active & high).astype(np.float64),
+        "level_changes": (active & changed).astype(np.float64),
+        "premium_total": np.where(active, book.premium, 0.0),
+        "exposed_premium": np.where(affected, book.premium, 0.0),
+        "claims_total": np.where(active, book.claims, 0.0),
+        "score_total": np.where(active, current["score"], 0.0),
+    }
+    if book.has_sum_insured:
+        columns["exposed_sum_insured"] = np.where(affected, book.sum_insured, 0.0)
+
+    def summarize(groups, alert_counts):
+        summary = {}
+        for label, totals in groups.items():
+            if not totals["policies"]:
+                continue
+            policies = totals.pop("policies")
+            score_total = totals.pop("score_total")
+            summary[label] = {
+                "policies": int(policies),
+                "alerts": alert_counts.get(label, 0),
+                "mean_score": round(score_total / policies, 1),
+                "exposed_sum_insured": None,
+                **{name: int(value) if name.endswith(("policies", "changes")) else round(value, 2)
+                   for name, value in totals.items()},
+            }
+        return summary
+
+    by_state = summarize(_group_totals(book.state_codes, book.states, np.ones(book.size, dtype=bool), columns),
+                         hazards_state)
+    by_city = summarize(_group_totals(book.city_codes, book.cities, np.ones(book.size, dtype=bool), columns),
+                        hazards_city)
+
+    top = np.flatnonzero(active & (delta > 0))
+    top = top[np.argsort(-delta[top], kind="stable")][:top_n]
+    top_policies = [{
+        "policy_number": book.policy_numbers[i],
+        "state": book.states[book.state_codes[i]] if book.state_codes[i] >= 0 else None,
+        "previous_score": float(baseline["score"][i]),
+        "score": float(current["score"][i]),
+        "level": str(current["level"][i]),
+        "premium": round(float(book.premium[i]), 2),
+    } for i in top]
+
+    return {
+        "policies_scored": int(active.sum()),
+        "affected_policies": int(affected.sum()),
+        "level_changes": int((active & changed).sum()),
+        "exposed_premium": round(float(columns["exposed_premium"].sum()), 2),
+        "by_state": by_state,
+        "by_city": by_city,
+        "top_policies": top_policies,
+        "as_of": str(as_of) if as_of is not None else None,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
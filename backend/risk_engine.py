@@ -0,0 +1,119 @@
+# risk_engine.py
+# One risk scoring formula for every assessment path.
+#
+# Signals are NumPy arrays (scalars broadcast), so a single applicant and a whole
+# policy book are scored by the same code:
+#
+#   external = base + hazard_weight  * min(hazard_count / hazard_saturation, 1)
+#                   + market_weight  * min(market_count / market_saturation, 1)
+#                   + weather_weight * weather_severity
+#   score    = external                                   where there is no ML probability
+#            = ml_blend * 100 * p + (1 - ml_blend) * external   where there is one
+#            = 100 * p                                    when only the ML probability is known
+#
+# With the default weights and no weather/ML signal this reproduces the original
+# 65 + min(5 * hazards, 20) + min(2 * financial alerts, 10) formula.
+
+import re
+
+import numpy as np
+
+DEFAULT_WEIGHTS = {
+    "base": 65.0,
+    "hazard_weight": 20.0,
+    "hazard_saturation": 4.0,    # alerts at which the hazard signal is maxed out
+    "market_weight": 10.0,
+    "market_saturation": 5.0,
+    "weather_weight": 10.0,
+    "ml_blend": 0.5,             # share of the ML probability in the blended score
+}
+DEFAULT_THRESHOLDS = (60.0, 80.0)  # Low <= 60 < Medium <= 80 < High
+LEVELS = ("Low", "Medium", "High")
+
+# Weather description keywords -> severity in [0, 1]; the highest match wins
+WEATHER_SEVERITY = {
+    "tornado": 1.0, "hurricane": 1.0, "cyclone": 1.0, "thunderstorm": 0.9, "squall": 0.8,
+    "storm": 0.8, "heavy": 0.7, "snow": 0.6, "sleet": 0.5, "smoke": 0.4, "rain": 0.3,
+    "dust": 0.3, "sand": 0.3, "fog": 0.2, "mist": 0.1, "drizzle": 0.1, "haze": 0.1,
+}
+# "Weather in Cairns: Heavy Intensity Rain, 31.2°C, 80% humidity"; the city prefix is optional
+_WEATHER_RE = re.compile(r"(?:Weather in .*?: )?(?P<description>.*?),\s*(?P<temp>-?\d+(?:\.\d+)?)\s*°C")
+
+
+def weather_severity(weather):
+    """
+    Severity in [0, 1] from a weather summary like 'Weather in Cairns: Heavy Intensity Rain, 41.2°C, 80% humidity'.
+    Keywords are only matched in the description, not the city name. NaN (not observed)
+    when the summary is an error message or does not carry a description and temperature.
+    """
+    if not weather or not isinstance(weather, str) or weather.startswith(("Could not", "No location")):
+        return np.nan
+    match = _WEATHER_RE.match(weather)
+    if not match:
+        return np.nan
+    text = match.group("description").lower()
+    severity = max([value for keyword, value in WEATHER_SEVERITY.items() if keyword in text] or [0.0])
+    temp = float(match.group("temp"))
+    return max(severity, 0.8 if temp >= 40 else 0.5 if temp >= 35 else 0.4 if temp <= 0 else 0.0)
+
+
+class RiskEngine:
+    """Vectorised blend of the ML probability with hazard, weather and market signals."""
+
+    def __init__(self, weights=None, thresholds=DEFAULT_THRESHOLDS):
+        unknown = set(weights or {}) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown risk weights: {sorted(unknown)}")
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.thresholds = np.asarray(thresholds, dtype=float)
+
+    def score(self, ml_probability=np.nan, hazard_count=np.nan, market_count=np.nan, weather_severity=np.nan):
+        """
+        Score arrays of signals. NaN means "not observed": missing external signals
+        count as no alerts, a missing ML probability leaves the external score as is,
+        and rows with only an ML probability are scored on it alone.
+        Returns {"score", "level", "external_score", "ml_score"} as arrays.
+        """
+        w = self.weights
+        p, hazards, market, weather = np.broadcast_arrays(
+            *(np.asarray(x, dtype=float) for x in (ml_probability, hazard_count, market_count, weather_severity))
+        )
+        has_external = ~(np.isnan(hazards) & np.isnan(market) & np.isnan(weather))
+        has_ml = ~np.isnan(p)
+
+        external = (
+            w["base"]
+            + w["hazard_weight"] * np.minimum(np.nan_to_num(hazards) / w["hazard_saturation"], 1.0)
+            + w["market_weight"] * np.minimum(np.nan_to_num(market) / w["market_saturation"], 1.0)
+            + w["weather_weight"] * np.clip(np.nan_to_num(weather), 0.0, 1.0)
+        )
+        ml_score = 100.0 * np.clip(np.nan_to_num(p), 0.0, 1.0)
+
+        score = np.where(has_ml, w["ml_blend"] * ml_score + (1 - w["ml_blend"]) * external, external)
+        score = np.where(has_ml & ~has_external, ml_score, score)
+        score = np.round(np.clip(score, 0.0, 100.0), 1)
+
+        return {
+            "score": score,
+            "level": np.asarray(LEVELS)[np.searchsorted(self.thresholds, score, side="left")],
+            "external_score": np.where(has_external, np.round(np.minimum(external, 100.0), 1), np.nan),
+            "ml_score": np.where(has_ml, np.round(ml_score, 1), np.nan),
+        }
+
+    def score_one(self, **signals):
+        """Score a single applicant; returns plain Python values for JSON responses."""
+        result = self.score(**{key: np.nan if value is None else value for key, value in signals.items()})
+
+        def scalar(values):
+            value = np.asarray(values).reshape(-1)[0]
+            return None if isinstance(value, float) and np.isnan(value) else value.item()
+
+        return {
+            "score": scalar(result["score"]),
+            "level": str(scalar(result["level"])),
+            "components": {
+                "external_score": scalar(result["external_score"]),
+                "ml_score": scalar(result["ml_score"]),
+                **{key: value for key, value in signals.items() if value is not None and not np.all(np.isnan(value))},
+            },
+        }
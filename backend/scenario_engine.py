@@ -0,0 +1,270 @@
+# scenario_engine.py
+# Monte Carlo stress testing of the policy book.
+#
+# Each policy has an expected claim frequency (from the book's stored Risk Score,
+# see portfolio.py) and a mean claim size (its claim amount, or a multiple of its
+# premium). A scenario is a
+# list of shocks applied to those arrays:
+#
+#   {"type": "cat_event", "state": "QLD", "probability": 0.2,
+#    "frequency_multiplier": 4, "severity_multiplier": 1.5}   random, shared by the state
+#   {"type": "frequency_uplift", "change": 0.25, "states": [...]}  deterministic
+#   {"type": "severity_uplift",  "change": 0.10, "states": [...]}
+#   {"type": "premium_shock",    "change": -0.05, "states": [...]}
+#
+# Paths are simulated in chunks of (paths x policies) arrays: claim counts are
+# Poisson, claim sizes Gamma (so the sum of k claims is one Gamma draw), and a
+# cat event hits every policy of its state on the same path. Chunks run in a
+# process pool with their own SeedSequence child, so a seed reproduces the same
+# result whatever the number of workers.
+
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+DEFAULT_ASSUMPTIONS = {
+    "base_frequency": 0.1,          # claims per policy-year at a risk score of 0.5
+    "severity_cv": 1.0,             # coefficient of variation of a single claim
+    "severity_to_premium": 5.0,     # mean claim / annual premium where no claim amount is known
+}
+PERCENTILES = (50, 75, 90, 95, 99, 99.5)
+VAR_LEVELS = (95, 99, 99.5)
+CHUNK_CELLS = 2_000_000             # paths x policies simulated per chunk
+SHOCK_TYPES = ("cat_event", "frequency_uplift", "severity_uplift", "premium_shock")
+
+# Time Horizon options of the ScenarioTesting panel, in years
+HORIZONS = {"short": 0.25, "medium": 1.0, "long": 3.0}
+
+# Named scenarios of the ScenarioTesting panel, scaled by severity 1-10
+PRESETS = {
+    "natural_disaster": {
+        "label": "Natural Disaster Impact",
+        "shocks": lambda s: [
+            {"type": "cat_event", "state": "QLD", "probability": 0.05 + 0.03 * s,
+             "frequency_multiplier": 1 + 0.6 * s, "severity_multiplier": 1 + 0.1 * s},
+            {"type": "cat_event", "state": "NSW", "probability": 0.03 + 0.02 * s,
+             "frequency_multiplier": 1 + 0.4 * s, "severity_multiplier": 1 + 0.08 * s},
+        ],
+    },
+    "market_volatility": {
+        "label": "Market Volatility",
+        "shocks": lambda s: [
+            {"type": "premium_shock", "change": -0.02 * s},
+            {"type": "severity_uplift", "change": 0.03 * s},
+        ],
+    },
+    "regulatory_changes": {
+        "label": "Regulatory Changes",
+        "shocks": lambda s: [
+            {"type": "premium_shock", "change": -0.015 * s},
+            {"type": "frequency_uplift", "change": 0.02 * s},
+        ],
+    },
+    "cyber_breach": {
+        "label": "Cyber Security Breach",
+        "shocks": lambda s: [
+            {"type": "frequency_uplift", "change": 0.05 * s},
+            {"type": "severity_uplift", "change": 0.04 * s},
+        ],
+    },
+}
+
+
+def preset_shocks(name, severity=5):
+    """Shocks of a named scenario at severity 1-10."""
+    if name not in PRESETS:
+        raise ValueError(f"Unknown scenario '{name}' (available: {sorted(PRESETS)})")
+    severity = min(max(float(severity), 1.0), 10.0)
+    return PRESETS[name]["shocks"](severity)
+
+
+def _state_mask(book, states):
+    """Policies in any of `states` (all policies when states is empty)."""
+    if not states:
+        return np.ones(book.size, dtype=bool)
+    if isinstance(states, str):
+        states = [states]
+    codes = [book.state_index[s.strip().upper()] for s in states if s.strip().upper() in book.state_index]
+    return np.isin(book.state_codes, codes)
+
+
+def scenario_inputs(book, shocks, assumptions=None, horizon_years=1.0, mask=None):
+    """
+    Per-policy arrays for one scenario: expected claims over the horizon, mean claim
+    size, premium, plus the cat events as (probability, policy mask, freq, severity multipliers).
+    Deterministic shocks are applied here; cat events are drawn per path in the workers.
+    """
+    a = {**DEFAULT_ASSUMPTIONS, **(assumptions or {})}
+    unknown = set(assumptions or {}) - set(DEFAULT_ASSUMPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown assumptions: {sorted(unknown)}")
+
+    risk = np.where(np.isnan(book.ml_probability), 0.5, np.clip(book.ml_probability, 0.0, 1.0))
+    frequency = a["base_frequency"] * 2.0 * risk * horizon_years
+    severity = np.where(book.claims > 0, book.claims, book.premium * a["severity_to_premium"])
+    premium = book.premium * horizon_years
+    baseline_loss = frequency * severity  # expected loss before any shock
+    baseline_loss = float((baseline_loss if mask is None else baseline_loss[mask]).sum())
+
+    cats = []
+    for shock in shocks:
+        kind = shock.get("type")
+        if kind not in SHOCK_TYPES:
+            raise ValueError(f"Unknown shock type '{kind}' (expected one of {SHOCK_TYPES})")
+        if kind == "cat_event":
+            probability = float(shock.get("probability", 0.1))
+            if not 0.0 <= probability <= 1.0:
+                raise ValueError("cat_event probability must be between 0 and 1")
+            # Probability of the event over the horizon (given per year)
+            probability = 1.0 - (1.0 - probability) ** horizon_years
+            cats.append((probability, _state_mask(book, shock.get("state") or shock.get("states")),
+                         float(shock.get("frequency_multiplier", 3.0)), float(shock.get("severity_multiplier", 1.0))))
+            continue
+        affected = _state_mask(book, shock.get("states") or shock.get("state"))
+        factor = np.where(affected, 1.0 + float(shock.get("change", 0.0)), 1.0)
+        if kind == "frequency_uplift":
+            frequency = frequency * factor
+        elif kind == "severity_uplift":
+            severity = severity * factor
+        else:
+            premium = premium * factor
+
+    if mask is not None:
+        frequency, severity, premium = frequency[mask], severity[mask], premium[mask]
+        cats = [(p, in_state[mask], fm, sm) for p, in_state, fm, sm in cats]
+    return {
+        "frequency": np.maximum(frequency, 0.0),
+        "severity": np.maximum(severity, 0.0),
+        "premium": premium,
+        "cats": cats,
+        "shape": 1.0 / a["severity_cv"] ** 2,
+        "baseline_expected_loss": baseline_loss,
+    }
+
+
+def simulate_chunk(inputs, state_codes, n_states, n_paths, seed):
+    """
+    Simulate `n_paths` paths; returns (total loss per path, loss per path and state).
+    `seed` is a SeedSequence, so chunks are independent and reproducible.
+    """
+    rng = np.random.default_rng(seed)
+    frequency = np.broadcast_to(inputs["frequency"], (n_paths, len(inputs["frequency"])))
+    severity = np.broadcast_to(inputs["severity"], frequency.shape)
+
+    for probability, in_state, frequency_multiplier, severity_multiplier in inputs["cats"]:
+        hit = (rng.random(n_paths) < probability)[:, None] & in_state[None, :]
+        frequency = np.where(hit, frequency * frequency_multiplier, frequency)
+        severity = np.where(hit, severity * severity_multiplier, severity)
+
+    counts = rng.poisson(frequency)
+    shape = inputs["shape"]
+    # Sum of k Gamma(shape, scale) claims is Gamma(k * shape, scale); k = 0 gives 0
+    losses = rng.gamma(counts * shape, severity / shape)
+
+    valid = state_codes >= 0
+    onehot = np.zeros((len(state_codes), n_states))
+    onehot[np.flatnonzero(valid), state_codes[valid]] = 1.0
+    return losses.sum(axis=1), losses @ onehot
+
+
+def tail_metrics(losses, levels=VAR_LEVELS):
+    """VaR (loss quantile) and TVaR (mean loss at or beyond it) per confidence level."""
+    var, tvar = {}, {}
+    for level in levels:
+        threshold = float(np.percentile(losses, level))
+        tail = losses[losses >= threshold]
+        var[str(level)] = round(threshold, 2)
+        tvar[str(level)] = round(float(tail.mean()) if tail.size else threshold, 2)
+    return var, tvar
+
+
+class ScenarioEngine:
+    """Seeded, chunked Monte Carlo over a lazily started process pool."""
+
+    def __init__(self, max_workers=None, chunk_cells=CHUNK_CELLS):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_cells = chunk_cells
+        self.pool = None
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool
+
+    def run(self, book, shocks, n_paths=10_000, seed=None, horizon_years=1.0, assumptions=None,
+            as_of=None, percentiles=PERCENTILES, var_levels=VAR_LEVELS):
+        started = time.perf_counter()
+        mask = book.in_force(as_of)
+        if not mask.any():
+            raise ValueError("No policies in force for this scenario")
+        inputs = scenario_inputs(book, shocks, assumptions, horizon_years, mask=mask)
+        state_codes = book.state_codes[mask]
+        n_states = len(book.states)
+
+        policies = int(mask.sum())
+        chunk_paths = max(1, min(n_paths, self.chunk_cells // policies))
+        n_chunks = math.ceil(n_paths / chunk_paths)
+        seed_sequence = np.random.SeedSequence(seed)
+        seeds = seed_sequence.spawn(n_chunks)
+        sizes = [min(chunk_paths, n_paths - i * chunk_paths) for i in range(n_chunks)]
+
+        if n_chunks == 1:
+            results = [simulate_chunk(inputs, state_codes, n_states, sizes[0], seeds[0])]
+        else:
+            pool = self._get_pool()
+            futures = [pool.submit(simulate_chunk, inputs, state_codes, n_states, size, child)
+                       for size, child in zip(sizes, seeds)]
+            results = [future.result() for future in futures]
+        totals = np.concatenate([total for total, _ in results])
+        by_state_losses = np.concatenate([states for _, states in results])
+
+        premium = float(inputs["premium"].sum())
+        var, tvar = tail_metrics(totals, var_levels)
+        state_premium = np.bincount(state_codes[state_codes >= 0], weights=inputs["premium"][state_codes >= 0],
+                                    minlength=n_states)
+        state_policies = np.bincount(state_codes[state_codes >= 0], minlength=n_states)
+
+        by_state = {}
+        for i, state in enumerate(book.states):
+            if not state_policies[i]:
+                continue
+            state_var, state_tvar = tail_metrics(by_state_losses[:, i], var_levels)
+            expected = float(by_state_losses[:, i].mean())
+            by_state[state] = {
+                "policies": int(state_policies[i]),
+                "premium": round(float(state_premium[i]), 2),
+                "expected_loss": round(expected, 2),
+                "loss_ratio": round(expected / state_premium[i], 4) if state_premium[i] else None,
+                "var": state_var,
+                "tvar": state_tvar,
+            }
+
+        expected_loss = float(totals.mean())
+        return {
+            "n_paths": n_paths,
+            "seed": seed_sequence.entropy,
+            "horizon_years": horizon_years,
+            "policies": policies,
+            "shocks": shocks,
+            "premium": round(premium, 2),
+            "expected_loss": round(expected_loss, 2),
+            "baseline_expected_loss": round(inputs["baseline_expected_loss"], 2),
+            "std_loss": round(float(totals.std()), 2),
+            "loss_ratio": round(expected_loss / premium, 4) if premium else None,
+            "probability_loss_exceeds_premium": round(float((totals > premium).mean()), 4),
+            "percentiles": {str(p): round(float(v), 2) for p, v in zip(percentiles, np.percentile(totals, percentiles))},
+            "var": var,
+            "tvar": tvar,
+            "by_state": by_state,
+            "chunks": n_chunks,
+            "workers": self.max_workers if n_chunks > 1 else 1,
+            "elapsed_seconds": round(time.perf_counter() - started, 2),
+        }
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
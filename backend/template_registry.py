@@ -0,0 +1,70 @@
+# template_registry.py
+# Named, versioned Jinja2 templates compiled once at startup.
+#
+# Templates live under templates/<kind>/<name>/v<N>.html, e.g.
+# templates/policy/default/v1.html. Every template is compiled when the
+# registry is created, with compiled bytecode cached on disk so restarts skip
+# the parse/compile step too. Auto-reload is off: rendering never stats or
+# recompiles a template on the request path.
+
+import os
+import re
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+_VERSION_RE = re.compile(r"^v(\d+)\.html$")
+DEFAULT_NAME = "default"
+
+
+class TemplateRegistry:
+    """All templates of one directory, looked up by (kind, name, version)."""
+
+    def __init__(self, template_dir, cache_dir=None):
+        bytecode_cache = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        self.env = Environment(loader=FileSystemLoader(template_dir), bytecode_cache=bytecode_cache, auto_reload=False)
+        self.templates = {}  # (kind, name) -> {version: Template}
+
+        for kind in sorted(os.listdir(template_dir)):
+            kind_dir = os.path.join(template_dir, kind)
+            if not os.path.isdir(kind_dir):
+                continue
+            for name in sorted(os.listdir(kind_dir)):
+                for filename in sorted(os.listdir(os.path.join(kind_dir, name))):
+                    match = _VERSION_RE.match(filename)
+                    if match:
+                        template = self.env.get_template(f"{kind}/{name}/{filename}")
+                        self.templates.setdefault((kind, name), {})[int(match.group(1))] = template
+
+    def resolve(self, kind, name=None, version=None):
+        """
+        (name, version) actually used for `kind` and `name` (e.g. a product type):
+        falls back to the kind's default, latest version unless `version` is given.
+        """
+        key = (kind, (name or DEFAULT_NAME).strip().lower())
+        if key not in self.templates:
+            key = (kind, DEFAULT_NAME)
+        versions = self.templates.get(key)
+        if not versions:
+            raise KeyError(f"No '{kind}' template named '{name}' or '{DEFAULT_NAME}'")
+        if version is None:
+            return key[1], max(versions)
+        if int(version) not in versions:
+            raise KeyError(f"Template {key[0]}/{key[1]} has no version {version} (available: {sorted(versions)})")
+        return key[1], int(version)
+
+    def get(self, kind, name=None, version=None):
+        name, version = self.resolve(kind, name, version)
+        return self.templates[(kind, name)][version]
+
+    def render(self, kind, name=None, version=None, **context):
+        return self.get(kind, name, version).render(**context)
+
+    def catalog(self):
+        """{kind: {name: [versions]}} for listing."""
+        listing = {}
+        for (kind, name), versions in sorted(self.templates.items()):
+            listing.setdefault(kind, {})[name] = sorted(versions)
+        return listing
@@ -1,15 +1,73 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
 import './RiskAnalysisDashboard.css';
 
-const GeoRiskMap = () => {
+// Bounding box of Australia used to project lon/lat into the map area
+const BOUNDS = { west: 112, east: 155, north: -10, south: -44 };
+const WIDTH = 320;
+const HEIGHT = 200;
+const LEVEL_COLORS = { High: '#fc8181', Medium: '#f6ad55', Low: '#68d391' };
+
+const project = ([lon, lat]) => [
+  ((lon - BOUNDS.west) / (BOUNDS.east - BOUNDS.west)) * WIDTH,
+  ((BOUNDS.north - lat) / (BOUNDS.north - BOUNDS.south)) * HEIGHT
+];
+
+const GeoRiskMap = ({ level = 'state' }) => {
+  const [features, setFeatures] = useState([]);
+  const [error, setError] = useState(null);
+
+  useEffect(() => {
+    const fetchLayer = async () => {
+      try {
+        const response = await fetch(`http://localhost:5000/api/geo/${level}`);
+        const data = await response.json();
+        if (!response.ok) {
+          throw new Error(data.error || `Map data unavailable (${response.status})`);
+        }
+        setFeatures(Array.isArray(data.features) ? data.features : []);
+        setError(null);
+      } catch (err) {
+        console.error('Error fetching geo risk layer:', err);
+        setError(err.message);
+      }
+    };
+
+    fetchLayer();
+  }, [level]);
+
+  const points = features.filter((feature) => feature.geometry.type === 'Point');
+  const maxPremium = Math.max(1, ...points.map((feature) => feature.properties.premium_total));
+
   return (
     <div className="geo-risk-map">
       <h3>Geospatial Risk Map</h3>
       <div className="map-container">
-        {/* Map visualization would be integrated here */}
-        <div className="map-placeholder">
-          <p>Interactive Risk Map</p>
-        </div>
+        {error || points.length === 0 ? (
+          <div className="map-placeholder">
+            <p>{error || 'Interactive Risk Map'}</p>
+          </div>
+        ) : (
+          <svg width="100%" height="100%" viewBox={`0 0 ${WIDTH} ${HEIGHT}`}>
+            {points.map((feature) => {
+              const [x, y] = project(feature.geometry.coordinates);
+              const props = feature.properties;
+              const radius = 4 + 12 * Math.sqrt(props.premium_total / maxPremium);
+              return (
+                <g key={feature.id}>
+                  <circle cx={x} cy={y} r={radius} fill={LEVEL_COLORS[props.risk_level]} fillOpacity="0.8">
+                    <title>
+                      {`${feature.id}: ${props.policies} policies, $${Math.round(props.premium_total).toLocaleString()} premium, `
+                        + `${props.alerts} alerts, risk ${props.risk_score} (${props.risk_level})`}
+                    </title>
+                  </circle>
+                  <text x={x} y={y - radius - 2} textAnchor="middle" fontSize="8" fill="#4a5568">
+                    {feature.id.toUpperCase()}
+                  </text>
+                </g>
+              );
+            })}
+          </svg>
+        )}
       </div>
       <div className="map-legend">
         <div className="legend-item">
@@ -1,41 +1,129 @@
-import React from 'react';
+import React, { useState } from 'react';
 import './RiskAnalysisDashboard.css';
 
+const SCENARIOS = [
+  { value: 'natural_disaster', label: 'Natural Disaster Impact' },
+  { value: 'market_volatility', label: 'Market Volatility' },
+  { value: 'regulatory_changes', label: 'Regulatory Changes' },
+  { value: 'cyber_breach', label: 'Cyber Security Breach' }
+];
+
+const formatAUD = (value) =>
+  value === null || value === undefined
+    ? 'N/A'
+    : `$${Number(value).toLocaleString(undefined, { maximumFractionDigits: 0 })}`;
+
 const ScenarioTesting = () => {
+  const [scenario, setScenario] = useState('natural_disaster');
+  const [severity, setSeverity] = useState(5);
+  const [horizon, setHorizon] = useState('medium');
+  const [result, setResult] = useState(null);
+  const [error, setError] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  const runScenario = async () => {
+    setLoading(true);
+    setError(null);
+    try {
+      const response = await fetch('http://localhost:5000/api/scenarios/run', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ scenario, severity: Number(severity), horizon, n_paths: 100000, seed: 42 })
+      });
+      const data = await response.json();
+      if (!response.ok) {
+        throw new Error(data.error || `Scenario failed (${response.status})`);
+      }
+      setResult(data);
+    } catch (err) {
+      console.error('Error running scenario:', err);
+      setError(err.message);
+      setResult(null);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   return (
     <div className="scenario-testing">
       <h3>Scenario Testing</h3>
       <div className="scenario-controls">
         <div className="scenario-selector">
           <label>Select Scenario:</label>
-          <select>
-            <option>Natural Disaster Impact</option>
-            <option>Market Volatility</option>
-            <option>Regulatory Changes</option>
-            <option>Cyber Security Breach</option>
+          <select value={scenario} onChange={(e) => setScenario(e.target.value)}>
+            {SCENARIOS.map((option) => (
+              <option key={option.value} value={option.value}>{option.label}</option>
+            ))}
           </select>
         </div>
         <div className="parameter-controls">
           <div className="parameter">
-            <label>Severity Level:</label>
-            <input type="range" min="1" max="10" defaultValue="5" />
+            <label>Severity Level: {severity}</label>
+            <input type="range" min="1" max="10" value={severity} onChange={(e) => setSeverity(e.target.value)} />
           </div>
           <div className="parameter">
             <label>Time Horizon:</label>
-            <select>
-              <option>Short-term (1-3 months)</option>
-              <option>Medium-term (3-12 months)</option>
-              <option>Long-term (1-5 years)</option>
+            <select value={horizon} onChange={(e) => setHorizon(e.target.value)}>
+              <option value="short">Short-term (1-3 months)</option>
+              <option value="medium">Medium-term (3-12 months)</option>
+              <option value="long">Long-term (1-5 years)</option>
             </select>
           </div>
         </div>
-        <button className="run-scenario-btn">Run Scenario Analysis</button>
+        <button className="run-scenario-btn" onClick={runScenario} disabled={loading}>
+          {loading ? 'Running Simulation...' : 'Run Scenario Analysis'}
+        </button>
       </div>
       <div className="scenario-results">
-        <p>Select and run a scenario to see projected impact on risk profile</p>
+        {error && <p>{error}</p>}
+        {!error && !result && <p>Select and run a scenario to see projected impact on risk profile</p>}
+        {result && (
+          <div>
+            <p>
+              {result.n_paths.toLocaleString()} paths over {result.policies} policies
+              ({result.elapsed_seconds}s)
+            </p>
+            <div className="detail-item">
+              <span className="detail-label">Expected Loss: </span>
+              <span className="detail-value">
+                {formatAUD(result.expected_loss)} (baseline {formatAUD(result.baseline_expected_loss)})
+              </span>
+            </div>
+            <div className="detail-item">
+              <span className="detail-label">Loss Ratio: </span>
+              <span className="detail-value">
+                {result.loss_ratio !== null ? `${(result.loss_ratio * 100).toFixed(1)}%` : 'N/A'}
+              </span>
+            </div>
+            <div className="detail-item">
+              <span className="detail-label">VaR 99% / TVaR 99%: </span>
+              <span className="detail-value">{formatAUD(result.var['99'])} / {formatAUD(result.tvar['99'])}</span>
+            </div>
+            <table style={{ width: '100%', marginTop: '10px' }}>
+              <thead>
+                <tr>
+                  <th>State</th>
+                  <th>Expected Loss</th>
+                  <th>Loss Ratio</th>
+                  <th>VaR 99%</th>
+                </tr>
+              </thead>
+              <tbody>
+                {Object.entries(result.by_state).map(([state, stats]) => (
+                  <tr key={state}>
+                    <td>{state}</td>
+                    <td>{formatAUD(stats.expected_loss)}</td>
+                    <td>{stats.loss_ratio !== null ? `${(stats.loss_ratio * 100).toFixed(1)}%` : 'N/A'}</td>
+                    <td>{formatAUD(stats.var['99'])}</td>
+                  </tr>
+                ))}
+              </tbody>
+            </table>
+          </div>
+        )}
       </div>
     </div>
   );
 };
 
-export default ScenarioTesting;
\ No newline at end of file
+export default ScenarioTesting;